@@ -1,23 +1,58 @@
+import importlib
+
 import streamlit as st 
-import pages.home
-import pages.world
-import pages.countrywise
-import pages.vaccinate
-import pages.cases_forecast
+
+from pages.utils import metrics, refresher
+from pages.utils.versions import snapshot
 
 
+# page name -> module, imported the first time the page is opened so a visit to Home
+# does not pay for the forecasting and plotting libraries of the other pages
 PAGES = {
-    "Home": pages.home ,
-    "Worldwide" : pages.world,
-    "Countrywise": pages.countrywise,
-    "Covid 19 Forecast": pages.cases_forecast,
-    "Vaccination Analysis": pages.vaccinate,
+    "Home": "pages.home",
+    "Worldwide" : "pages.world",
+    "Countrywise": "pages.countrywise",
+    "Covid 19 Forecast": "pages.cases_forecast",
+    "Vaccination Analysis": "pages.vaccinate",
 }
 
+# times every st.plotly_chart and st.altair_chart call of the pages
+metrics.instrument_charts(st)
+
+def load_page(name):
+    """ Function to import a page module on first navigation; sys.modules keeps it for the
+        following reruns and sessions
+        param: page name (key of PAGES)
+        return: page module
+    """
+    return importlib.import_module(PAGES[name])
+
+def show_debug_panel():
+    """ Function to show in the sidebar where the last run of the page spent its time:
+        loads, aggregations, figure builds and chart emits, payload sizes and cache lookups
+    """
+    import pandas as pd
+    last = metrics.last_request()
+    st.sidebar.subheader(f"Debug: {last['page']} ran in {last['seconds'] * 1000:,.0f} ms")
+    events = pd.DataFrame(last['events'], columns=['event', 'labels', 'ms', 'kb'])
+    st.sidebar.dataframe(events.sort_values('ms', ascending=False).round(1))
+    caches = pd.DataFrame([(cache, result, lookups) for (cache, result), lookups in sorted(last['caches'].items())],
+                          columns=['cache', 'result', 'lookups'])
+    st.sidebar.dataframe(caches)
+
 def main():
+    # refreshes the data in the background when COVID_REFRESH_INTERVAL is set
+    refresher.start()
+    # serves /metrics when COVID_METRICS_PORT is set
+    metrics.serve()
     menu = st.sidebar.title("Menu")
     choice = st.sidebar.radio("Navigate", list(PAGES.keys()))
-    PAGES[choice].main()
+    debug = metrics.debug_enabled(st.experimental_get_query_params())
+    # every table of this run comes from the same data version, even if a refresh swaps one in meanwhile
+    with snapshot(), metrics.request(choice, measure_payload=debug):
+        load_page(choice).main()
+    if debug:
+        show_debug_panel()
     st.sidebar.markdown(''' 
     This web application provides a holistic analysis of covid 19 cases around the world.
     Select the different options to vary the visualization.
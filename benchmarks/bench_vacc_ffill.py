@@ -0,0 +1,68 @@
+"""
+Compares the per-iso_code forward-fill loop previously used in get_vacc_data with
+fetch_vacc_data.fill_by_country on synthetic OWID-shaped data.
+
+    python -m benchmarks.bench_vacc_ffill --scales 1 10 100
+"""
+import argparse
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic import owid_frames
+from pages.utils.fetch_vacc_data import fill_by_country
+
+# countries x days of the 1x dataset, roughly the OWID feed in mid 2021
+BASE_COUNTRIES = 200
+BASE_DAYS = 150
+
+
+def legacy_fill(df_vaccine):
+    """
+    Function reproducing the original O(countries x rows) loop
+    """
+    df_vaccine = df_vaccine.copy()
+    for iso_code in df_vaccine['iso_code'].unique():
+        df_vaccine.loc[df_vaccine['iso_code'] == iso_code, :] = df_vaccine.loc[df_vaccine['iso_code'] == iso_code, :].ffill().fillna(0)
+    return df_vaccine
+
+
+def prepare(scale):
+    """
+    Function that builds the merged, date sorted frame both fills start from.
+    The 1x dataset is grown in countries, which is what the legacy loop scales with.
+    """
+    vaccine_data, vaccine_loc = owid_frames(n_countries=BASE_COUNTRIES * scale, n_days=BASE_DAYS)
+    df_vaccine = pd.merge(vaccine_data, vaccine_loc, on=["location", "iso_code"])
+    df_vaccine['date'] = pd.to_datetime(df_vaccine['date'])
+    return df_vaccine.sort_values('date', ascending=True).rename(columns={'location': 'country'})
+
+
+def timed(func, df):
+    start = time.perf_counter()
+    result = func(df)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--legacy-limit', type=int, default=10,
+                        help='largest scale the legacy loop is run at (it is quadratic)')
+    args = parser.parse_args()
+
+    print(f"{'scale':>6} {'rows':>10} {'legacy (s)':>12} {'grouped (s)':>12} {'speedup':>9}")
+    for scale in args.scales:
+        df = prepare(scale)
+        new_seconds, new_result = timed(fill_by_country, df)
+        if scale <= args.legacy_limit:
+            old_seconds, old_result = timed(legacy_fill, df)
+            pd.testing.assert_frame_equal(old_result, new_result, check_dtype=False)
+            old_col, speedup = f'{old_seconds:12.3f}', f'{old_seconds / new_seconds:8.1f}x'
+        else:
+            old_col, speedup = f"{'skipped':>12}", f"{'-':>9}"
+        print(f'{scale:>5}x {len(df):>10} {old_col} {new_seconds:12.3f} {speedup}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Reports what importing each page costs on top of streamlit, from `python -X importtime`
+run in a fresh interpreter per page, grouped by top-level package.
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --pages pages.home pages.cases_forecast --top 10
+"""
+import argparse
+import json
+import subprocess
+import sys
+from collections import Counter
+
+from app import PAGES
+
+BASELINE = 'streamlit'
+
+
+def import_times(module, baseline=BASELINE):
+    """
+    Function that imports baseline then module in a fresh interpreter with -X importtime
+    arg: page module, module the app imports before any page
+    return: list of (module name, self microseconds, nesting depth) imported by the page
+    """
+    code = f'import {baseline}; import {module}'
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                          capture_output=True, text=True, check=True)
+    entries = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((name.strip(), int(self_us), depth))
+        if depth == 0 and name.strip() == baseline:
+            # everything so far was imported by the baseline, which every page shares
+            entries = []
+    return entries
+
+
+def summarize(entries, top=5):
+    """
+    Function that totals the import time of a page and of its heaviest packages
+    arg: entries of import_times, number of packages to keep
+    return: dict with the total milliseconds, module count and the top packages in ms
+    """
+    packages = Counter()
+    for name, self_us, _ in entries:
+        packages[name.split('.')[0]] += self_us
+    return {'total_ms': round(sum(packages.values()) / 1000, 1), 'modules': len(entries),
+            'packages': {name: round(us / 1000, 1) for name, us in packages.most_common(top)}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', nargs='+', default=list(PAGES.values()))
+    parser.add_argument('--top', type=int, default=5, help='packages listed per page')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    report = {module: summarize(import_times(module), args.top) for module in args.pages}
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for module, summary in report.items():
+        print(f"{module:<22} {summary['total_ms']:>9.1f} ms  {summary['modules']:>5} modules")
+        for name, ms in summary['packages'].items():
+            print(f"    {name:<18} {ms:>9.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
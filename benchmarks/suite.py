@@ -0,0 +1,285 @@
+"""
+Times the refresh scripts and the data preparation and figure build of every page on
+synthetic JHU and OWID data, with the Streamlit calls of the pages stubbed out.
+Each scale is COUNTRIESxDAYSxPROVINCES. Stage timings, peak traced memory and figure
+payload sizes are written as sorted JSON, so two runs can be diffed, or compared with
+--compare to flag regressions.
+
+    python -m benchmarks.suite --scales 50x120x5 200x450x10 --output bench.json
+    python -m benchmarks.suite --output new.json --compare bench.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic import jhu_frames, owid_frames, worldometer_frames
+from pages.utils.profiling import track
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+DEFAULT_SCALES = ['50x120x5', '200x450x10']
+REGRESSION = 1.2
+# stages faster than this in both runs are too noisy to compare
+MIN_SECONDS = 0.05
+
+
+class StreamlitStub:
+    """
+    Stands in for the streamlit module of a page: every attribute is a no-op call that
+    also works as a context manager (st.spinner)
+    """
+
+    def __getattr__(self, name):
+        return self
+
+    def __call__(self, *args, **kwargs):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def parse_scale(scale):
+    """
+    Function that reads a COUNTRIESxDAYSxPROVINCES scale
+    """
+    n_countries, n_days, provinces = (int(part) for part in scale.lower().split('x'))
+    return n_countries, n_days, provinces
+
+
+def country_names(n_countries, codes_path):
+    """
+    Function that returns real JHU country names first, so the ISO code lookup mostly hits
+    the mapping table, then numbered ones
+    """
+    names = pd.read_csv(codes_path, keep_default_na=False)['country'].tolist()
+    return (names + [f'Country {i}' for i in range(n_countries)])[:n_countries]
+
+
+def write_inputs(directory, scale, seed=0):
+    """
+    Function that writes the synthetic raw files of a scale: the JHU time series and OWID
+    files under directory/raw/, the worldometer tables under directory/data/
+    arg: working directory, scale string, seed
+    return: dict of input row counts
+    """
+    n_countries, n_days, provinces = parse_scale(scale)
+    names = country_names(n_countries, os.path.join(directory, 'data', 'country_codes.csv'))
+    raw = os.path.join(directory, 'raw')
+    os.makedirs(raw, exist_ok=True)
+    for series, frame in jhu_frames(n_countries, n_days, provinces, seed, names).items():
+        frame.to_csv(os.path.join(raw, f'time_series_covid19_{series}_global.csv'), index=False)
+    vaccine_data, vaccine_loc = owid_frames(n_countries, n_days, seed=seed, names=names)
+    vaccine_data.to_csv(os.path.join(raw, 'vaccinations.csv'), index=False)
+    vaccine_loc.to_csv(os.path.join(raw, 'locations.csv'), index=False)
+    summary, daily = worldometer_frames(names, n_days, seed)
+    summary.to_csv(os.path.join(directory, 'data', 'worldometer_coronavirus_summary_data.csv'), index=False)
+    daily.to_csv(os.path.join(directory, 'data', 'worldometer_coronavirus_daily_data.csv'), index=False)
+    return {'countries': n_countries, 'days': n_days, 'provinces': provinces,
+            'owid_rows': len(vaccine_data)}
+
+
+def timed_figure(stage, results, build, *args):
+    """
+    Function that times a figure build including its JSON serialization, which is what
+    st.plotly_chart pays on every render, and records the payload size
+    """
+    with track(stage, results):
+        fig = build(*args)
+        payload = fig.to_json() if fig is not None else ''
+    results[-1]['payload_kb'] = len(payload) / 1024
+    return fig
+
+
+def bench_etl(results, fmt, source):
+    """
+    Function that times the JHU refresh stages and the three OWID refresh steps
+    """
+    from pages.utils import fetch_data, fetch_vacc_data
+
+    stats = []
+    fetch_data.fetchdata(fmt=fmt, stats=stats, source=source)
+    results.extend(dict(entry, stage=f"etl.jhu.{entry['stage'].replace(' ', '_')}") for entry in stats)
+    with track('etl.owid.vaccinations', results):
+        fetch_vacc_data.get_vacc_data(fmt=fmt, source=source)
+    with track('etl.owid.daily', results):
+        fetch_vacc_data.get_daily_data(fmt=fmt)
+    with track('etl.owid.summary', results):
+        fetch_vacc_data.get_summ_data(fmt=fmt)
+
+
+def bench_pages(results, engines):
+    """
+    Function that times the data loads and every figure builder of the pages with cold
+    caches. Cached builders are called through __wrapped__ so each one really runs.
+    return: memory held by each loaded dataset and saved by the load-time dtypes
+    """
+    from pages import cases_forecast, countrywise, vaccinate, world
+    from pages.utils import caching, data_store, forecasting
+    from pages.utils.figure_cache import figures
+    from pages.utils.frames import DEFAULT_BUDGET
+
+    for page in (world, countrywise, vaccinate, cases_forecast):
+        page.st = StreamlitStub()
+    data_store.clear_cache()
+    figures.clear()
+    caching.clear_all()
+
+    with track('world.load', results):
+        for name in ('by_date', 'latest_by_country'):
+            data_store.get_aggregate(name)
+        data_store.get_dataset('covid', columns=['Country/Region', 'iso_code', 'Date', 'Confirmed', 'Deaths'])
+    with track('world.map_frames', results):
+        world.map_frames(DEFAULT_BUDGET)
+    timed_figure('world.snapshot', results, world.snapshot_figure.__wrapped__)
+    timed_figure('world.active_cases', results, world.active_cases_figure.__wrapped__)
+    timed_figure('world.top_countries', results, world.top_countries_figure.__wrapped__)
+    timed_figure('world.confirmed_map', results, world.confirmed_map.__wrapped__, DEFAULT_BUDGET)
+    timed_figure('world.deaths_map', results, world.deaths_map.__wrapped__, DEFAULT_BUDGET)
+    top = data_store.top_n('latest_by_country', 'Confirmed', world.COMPARISON_DEFAULT)['Country/Region'].tolist()
+    with track('world.comparison_data', results):
+        world.comparison_data(top)
+
+    # the split country with the most cases exercises every countrywise view
+    provinces = data_store.get_aggregate('latest_by_country_province').dropna(subset=['Province/State'])
+    country = provinces.sort_values('Confirmed')['Country/Region'].iloc[-1] if len(provinces) else top[0]
+    with track('countrywise.load', results):
+        for name in ('latest_by_country', 'by_country_date'):
+            data_store.country_rows(name, country)
+        data_store.top_n('latest_by_country_province', 'Confirmed', 10, country)
+    timed_figure('countrywise.snapshot', results, countrywise.snapshot_figure.__wrapped__, country)
+    timed_figure('countrywise.timeline', results, countrywise.timeline_figure.__wrapped__, country, 'Confirmed')
+    timed_figure('countrywise.top_states', results, countrywise.top_states_figure.__wrapped__, country)
+
+    with track('vaccinate.load', results):
+        for name in ('vaccine', 'daily', 'summary'):
+            data_store.get_dataset(name)
+    for name, args in vaccinate.SUMMARY_BARS.items():
+        timed_figure(f'vaccinate.summary_bar.{name}', results, vaccinate.summary_bar_plot.__wrapped__, *args)
+    timed_figure('vaccinate.vaccines_map', results, vaccinate.vaccines_map.__wrapped__)
+    timed_figure('vaccinate.vaccination_map', results, vaccinate.vaccination_map.__wrapped__, DEFAULT_BUDGET)
+
+    memory = data_store.memory_report()
+    world_series = cases_forecast.load_data()
+    for engine in engines:
+        with track(f'cases_forecast.fit.{engine}', results):
+            result = forecasting.fit_forecast(world_series, 'Confirmed', engine=engine)
+        timed_figure(f'cases_forecast.plot.{engine}', results, result['model'].plot, result['forecast'])
+        with track(f'cases_forecast.backtest.{engine}', results):
+            forecasting.backtest(world_series, 'Confirmed', engines=[engine], workers=1)
+    return {f'{dataset} ({columns})': {'loaded_mb': round(row.loaded_mb, 2), 'saved_mb': round(row.saved_mb, 2)}
+            for (dataset, columns), row in memory.iterrows()}
+
+
+def run_scale(scale, fmt, engines, keep=False):
+    """
+    Function that benchmarks one scale in a scratch working directory
+    arg: scale string, storage format, forecasting engines, keep the directory
+    return: dict with the input sizes, the stages and the peak resident memory
+    """
+    repo = os.getcwd()
+    directory = tempfile.mkdtemp(prefix='covid-bench-')
+    os.makedirs(os.path.join(directory, 'data'))
+    shutil.copy(os.path.join(repo, 'data', 'country_codes.csv'), os.path.join(directory, 'data'))
+    inputs = write_inputs(directory, scale)
+    results = []
+    os.chdir(directory)
+    try:
+        bench_etl(results, fmt, 'file://' + os.path.join(directory, 'raw') + '/')
+        memory = bench_pages(results, engines)
+    finally:
+        os.chdir(repo)
+        if not keep:
+            shutil.rmtree(directory, ignore_errors=True)
+    stages = {}
+    for entry in results:
+        stages[entry['stage']] = {key: round(value, 4) for key, value in entry.items() if key != 'stage'}
+    report = {'inputs': inputs, 'stages': stages, 'memory': memory}
+    if resource is not None:
+        # ru_maxrss is in kB on Linux; it only grows, so it is the peak over all scales so far
+        report['max_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return report
+
+
+def environment():
+    """
+    Function that describes the code and library versions a run measured
+    """
+    import numpy
+    import plotly
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), 'pandas': pd.__version__,
+            'numpy': numpy.__version__, 'plotly': plotly.__version__, 'machine': platform.machine()}
+
+
+def compare(old, new, threshold=REGRESSION):
+    """
+    Function that prints the stages of new slower than in old by more than threshold,
+    ignoring stages that take under MIN_SECONDS in both
+    arg: two reports, slowdown ratio counted as a regression
+    return: number of regressions
+    """
+    regressions = 0
+    for scale, report in new['scales'].items():
+        before = old.get('scales', {}).get(scale, {}).get('stages', {})
+        for stage, entry in report['stages'].items():
+            if stage not in before or max(before[stage]['seconds'], entry['seconds']) < MIN_SECONDS:
+                continue
+            ratio = entry['seconds'] / before[stage]['seconds']
+            if ratio > threshold:
+                regressions += 1
+                print(f"REGRESSION {scale:>14} {stage:<40} {before[stage]['seconds']:9.3f}s -> "
+                      f"{entry['seconds']:9.3f}s ({ratio:.2f}x)")
+    print(f'{regressions} stages slower than {threshold:.2f}x the baseline')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', nargs='+', default=DEFAULT_SCALES, help='COUNTRIESxDAYSxPROVINCES')
+    parser.add_argument('--format', default='parquet', help='storage format of the refreshed tables')
+    parser.add_argument('--engines', nargs='+', default=['fast'], help='forecasting engines to time')
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--compare', metavar='BASELINE', help='report written by an earlier run')
+    parser.add_argument('--threshold', type=float, default=REGRESSION)
+    parser.add_argument('--keep', action='store_true', help='keep the scratch directories')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    report = {'environment': environment(), 'scales': {}}
+    for scale in args.scales:
+        start = time.perf_counter()
+        report['scales'][scale] = run_scale(scale, args.format, args.engines, args.keep)
+        print(f'{scale}: {time.perf_counter() - start:.1f}s')
+        for stage, entry in report['scales'][scale]['stages'].items():
+            print(f"    {stage:<40} {entry['seconds']:9.3f}s  peak +{entry['peak_mb']:8.1f} MB")
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+    if args.compare:
+        with open(args.compare) as f:
+            sys.exit(1 if compare(json.load(f), report, args.threshold) else 0)
+
+
+if __name__ == '__main__':
+    main()
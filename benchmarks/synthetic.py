@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+
+JHU_SERIES = ['confirmed', 'deaths', 'recovered']
+OWID_START = '2020-12-01'
+OWID_METRICS = ['total_vaccinations', 'people_vaccinated', 'people_fully_vaccinated',
+                'daily_vaccinations_raw', 'daily_vaccinations', 'total_vaccinations_per_hundred',
+                'people_vaccinated_per_hundred', 'people_fully_vaccinated_per_hundred',
+                'daily_vaccinations_per_million']
+VACCINES = ['Pfizer/BioNTech', 'Moderna', 'Oxford/AstraZeneca', 'Sinopharm/Beijing', 'Sputnik V']
+
+
+def owid_frames(n_countries=200, n_days=150, missing=0.4, seed=0, names=None):
+    """
+    Function that generates OWID-shaped vaccinations.csv and locations.csv frames.
+    Every country reports on every day, with a share of the metrics missing like the
+    real feed (countries report totals irregularly).
+    arg: number of countries, number of days, share of missing metric values, seed,
+         optional country names (default 'Country <i>')
+    return: (vaccine_data, vaccine_loc) dataframes
+    """
+    rng = np.random.default_rng(seed)
+    countries = list(names or [f'Country {i}' for i in range(n_countries)])[:n_countries]
+    codes = [f'C{i:05d}' for i in range(n_countries)]
+    dates = pd.date_range(OWID_START, periods=n_days).strftime('%Y-%m-%d')
+
+    n_rows = n_countries * n_days
+    daily = rng.integers(0, 100000, size=(n_countries, n_days))
+    total = daily.cumsum(axis=1).ravel().astype('float64')
+    vaccine_data = pd.DataFrame({
+        'location': np.repeat(countries, n_days),
+        'iso_code': np.repeat(codes, n_days),
+        'date': np.tile(dates, n_countries),
+    })
+    for col in OWID_METRICS:
+        values = total if col.startswith('total') or col.startswith('people') else daily.ravel().astype('float64')
+        values = np.where(rng.random(n_rows) < missing, np.nan, values)
+        vaccine_data[col] = values
+
+    vaccine_loc = pd.DataFrame({
+        'location': countries,
+        'iso_code': codes,
+        'vaccines': rng.choice(VACCINES, size=n_countries),
+        'last_observation_date': dates[-1],
+        'source_name': 'Synthetic',
+        'source_website': 'https://example.org',
+    })
+    # OWID publishes rows grouped by location
+    return vaccine_data, vaccine_loc
+
+
+def jhu_frames(n_countries=200, n_days=450, provinces=10, seed=0, names=None):
+    """
+    Function that generates the three JHU global time series, one column per day.
+    Every tenth country is split into provinces like Australia, Canada or China, and the
+    recovered series lacks one location like the real feed.
+    arg: number of countries, number of days, provinces of each split country, seed,
+         optional country names (default 'Country <i>')
+    return: dict of series name -> wide dataframe
+    """
+    rng = np.random.default_rng(seed)
+    countries = list(names or [f'Country {i}' for i in range(n_countries)])[:n_countries]
+    rows = []
+    for i, country in enumerate(countries):
+        for province in ([f'Province {j}' for j in range(provinces)] if i % 10 == 0 and provinces else [np.nan]):
+            rows.append((province, country, rng.uniform(-60, 70), rng.uniform(-180, 180)))
+    ids = pd.DataFrame(rows, columns=['Province/State', 'Country/Region', 'Lat', 'Long'])
+    dates = pd.date_range('2020-01-22', periods=n_days)
+    header = [f'{d.month}/{d.day}/{d.year % 100}' for d in dates]
+
+    confirmed = rng.integers(0, 1000, size=(len(ids), n_days)).cumsum(axis=1)
+    deaths = (confirmed * rng.uniform(0.005, 0.03, size=(len(ids), 1))).astype('int64')
+    recovered = (confirmed * rng.uniform(0.5, 0.9, size=(len(ids), 1))).astype('int64')
+    frames = {series: pd.concat([ids, pd.DataFrame(values, columns=header)], axis=1)
+              for series, values in zip(JHU_SERIES, (confirmed, deaths, recovered))}
+    frames['recovered'] = frames['recovered'].iloc[1:].reset_index(drop=True)
+    return frames
+
+
+def worldometer_frames(names, n_days=150, seed=0):
+    """
+    Function that generates the worldometer summary and daily tables the vaccination
+    refresh joins with OWID, over the same days as owid_frames
+    arg: country names, number of days, seed
+    return: (summary, daily) dataframes
+    """
+    rng = np.random.default_rng(seed)
+    names = list(names)
+    population = rng.integers(10**5, 10**9, size=len(names))
+    daily_new = rng.integers(0, 10000, size=(len(names), n_days))
+    cases = daily_new.cumsum(axis=1)
+    deaths = (cases * 0.02).astype('int64')
+    summary = pd.DataFrame({
+        'country': names,
+        'continent': rng.choice(['Africa', 'Asia', 'Europe', 'North America', 'Oceania', 'South America'], size=len(names)),
+        'total_confirmed': cases[:, -1],
+        'total_deaths': deaths[:, -1].astype('float64'),
+        'total_recovered': (cases[:, -1] * 0.8).astype('int64'),
+        'active_cases': (cases[:, -1] * 0.18).astype('int64'),
+        'serious_or_critical': (cases[:, -1] * 0.01).astype('float64'),
+        'total_cases_per_1m_population': cases[:, -1] * 10**6 // population,
+        'total_deaths_per_1m_population': (deaths[:, -1] * 10**6 / population).round(),
+        'total_tests': (cases[:, -1] * 10).astype('float64'),
+        'total_tests_per_1m_population': (cases[:, -1] * 10**7 / population).round(),
+        'population': population,
+    })
+    daily = pd.DataFrame({
+        'date': np.tile(pd.date_range(OWID_START, periods=n_days).strftime('%Y-%m-%d'), len(names)),
+        'country': np.repeat(names, n_days),
+        'cumulative_total_cases': cases.ravel().astype('float64'),
+        'daily_new_cases': daily_new.ravel().astype('float64'),
+        'active_cases': (cases * 0.18).ravel(),
+        'cumulative_total_deaths': deaths.ravel().astype('float64'),
+        'daily_new_deaths': np.diff(deaths, axis=1, prepend=0).ravel().astype('float64'),
+    })
+    return summary, daily
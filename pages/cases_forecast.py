@@ -1,115 +1,144 @@
-import pandas as pd
-import numpy as np
 import streamlit as st
-import altair as alt
-import plotly.express as px
-import plotly.graph_objs as go
-from sklearn.metrics import mean_squared_error
-from fbprophet import Prophet
+from pages.utils import data_store, forecasting, metrics
+from pages.utils.forecast_job import FEATURES, forecast_version
+from pages.utils.forecasters import DEFAULT_ENGINE, ENGINES
 
 
 def load_data():
     """ Function to load data
-        param DATA_URL: data_url
-        return: pandas dataframe
+        return: pandas dataframe of worldwide totals per date (see data_store)
     """
-    DATA_URL = 'data/covid.csv'
-    data = pd.read_csv(DATA_URL)
-    data['Date'] = pd.to_datetime(data['Date']).dt.strftime('%Y-%m-%d')
-    return data
+    return data_store.get_aggregate('by_date')
 
-def forecast_global(df, feature):
+def forecast_global(df, feature, engine=DEFAULT_ENGINE):
     """ Function to forecast covid cases for the next one year
-        param: dataframe(df) and dataframe attribute(feature)
-        return forecast dataframe
+        param: dataframe(df), dataframe attribute(feature) and forecasting engine
+        return forecast figure
     """
-    data = df.groupby('Date').sum()[feature].reset_index()
-    data.columns = ['ds','y']
-    data['ds'] = pd.to_datetime(data['ds'])
-    m = Prophet()
-    m.fit(data)
-    future = m.make_future_dataframe(periods=365)
-    #print(future.tail(5))
-    forecast = m.predict(future)
-    forecast[['ds', 'yhat', 'yhat_lower', 'yhat_upper']].tail()
-    fig = m.plot(forecast)
+    result = fit_global(df, feature, engine)
+    fig = result['model'].plot(result['forecast'])
     return fig
 
-def forecast_global_components(df, feature):
-    """ Function to forecast covid cases for the next one year
-        param: dataframe(df) and dataframe attribute(feature)
-        return forecast dataframe
+def forecast_global_components(df, feature, engine=DEFAULT_ENGINE):
+    """ Function to plot the trend and seasonality components of the forecast
+        param: dataframe(df), dataframe attribute(feature) and forecasting engine
+        return components figure
     """
-    data = df.groupby('Date').sum()[feature].reset_index()
-    data.columns = ['ds','y']
-    data['ds'] = pd.to_datetime(data['ds'])
-    m = Prophet()
-    m.fit(data)
-    future = m.make_future_dataframe(periods=365)
-    #print(future.tail(5))
-    forecast = m.predict(future)
-    forecast[['ds', 'yhat', 'yhat_lower', 'yhat_upper']].tail()
-    fig2 = m.plot_components(forecast)
+    result = fit_global(df, feature, engine)
+    fig2 = result['model'].plot_components(result['forecast'])
     return fig2
 
-def get_error_metrics(df,feature):
-    data = df.groupby('Date').sum()[feature].reset_index()
-    data.columns = ['ds','y']
-    data['ds'] = pd.to_datetime(data['ds'])
-    m = Prophet()
-    m.fit(data)
-    future = m.make_future_dataframe(periods=365)
-    #print(future.tail(5))
-    forecast = m.predict(future)
-    forecast[['ds', 'yhat', 'yhat_lower', 'yhat_upper']].tail()
-    return np.sqrt(mean_squared_error(data['y'],forecast['yhat'].head(data.shape[0])))
+def get_error_metrics(feature, scope='Global'):
+    """ Function to compare the engines with the rolling-origin backtest the batch job stored for the current data
+        param: dataframe attribute(feature) and the series it was computed on ('Global' or a country)
+        return dataframe of rmse, mae and mape per engine and horizon (see forecasting.backtest), or None
+    """
+    return forecasting.get_stored_backtest(forecast_version(), feature, scope)
+
+def show_error_metrics(feature, engine=DEFAULT_ENGINE, scope='Global'):
+    """ Function to show the backtest errors, with the chosen engine first; nothing is fitted here
+        param: dataframe attribute(feature), forecasting engine and the series ('Global' or a country)
+    """
+    scores = get_error_metrics(feature, scope)
+    if scores is None:
+        where = '' if scope == 'Global' else f' for {scope}'
+        st.info(f'The backtest of the {feature} forecasts{where} is not available yet, '
+                'it is computed by the forecast job (pages.utils.forecast_job).')
+        return
+    order = sorted(scores.index.unique('engine'), key=lambda name: name != engine)
+    st.write(f'Forecast error of each engine over the first {", ".join(map(str, forecasting.HORIZONS))} days '
+             f'after {forecasting.ORIGINS} origins, {forecasting.ORIGIN_STEP} days apart, that were held out of the fit:')
+    st.table(scores.reindex(order, level='engine').style.format(
+        {'rmse': '{:,.0f}', 'mae': '{:,.0f}', 'mape': '{:.2f}%', 'fit_seconds': '{:.3f}'}))
+
+def fit_global(df, feature, engine=DEFAULT_ENGINE):
+    """ Function returning the single shared fit of a feature for the current data
+        param: dataframe(df), dataframe attribute(feature) and forecasting engine
+        return dict with the model, the forecast dataframe and the rmse (see forecasting.get_forecast)
+    """
+    return forecasting.get_forecast(df, feature, forecast_version(), engine=engine)
+
+def precomputed_countries(engine=DEFAULT_ENGINE):
+    """ Function to list the countries the batch job (pages.utils.forecast_job) has forecasts for
+        param: forecasting engine
+        return sorted list of countries, empty when the job has not run on the current data
+    """
+    index = forecasting.load_index(forecast_version())
+    if index is None:
+        return []
+    return sorted(set(index.loc[index['engine'] == engine, 'scope']) - {'Global'})
+
+def show_figure(fig):
+    """ Function to draw a forecast figure, a matplotlib one from Prophet or a plotly one from the
+        fast engine, timed like the charts of the other pages (see metrics.instrument_charts)
+        param: figure
+    """
+    with metrics.timed('chart_emit', kind='write', chart=metrics.chart_id()):
+        st.write(fig)
+
+def show_country_forecast(country, feature, engine=DEFAULT_ENGINE):
+    """ Function to show a precomputed country forecast; nothing is fitted here
+        param: country, dataframe attribute(feature) and forecasting engine
+    """
+    result = forecasting.get_stored_forecast(forecast_version(), country, feature, engine)
+    if result is None:
+        st.info(f'No {feature} forecast has been precomputed for {country}.')
+        return
+    st.subheader(f'Forecasting {feature} Cases in {country}')
+    show_figure(result['model'].plot(result['forecast']))
+    show_figure(result['model'].plot_components(result['forecast']))
+    show_error_metrics(feature, engine, scope=country)
 
 
 def main():
     df = load_data()
-    st.title('Forecasting Covid 19 Cases using Prophet')
-    graph_type = st.sidebar.selectbox("Choose what forecast you would like to view", ["Global"])
+    st.title('Forecasting Covid 19 Cases')
+    engine = st.sidebar.selectbox("Forecast engine", list(ENGINES),
+                                  format_func=lambda name: f'{name} ({ENGINES[name].__name__})')
+    countries = precomputed_countries(engine)
+    graph_type = st.sidebar.selectbox("Choose what forecast you would like to view",
+                                      ["Global", "Countrywise"] if countries else ["Global"])
+    if graph_type=='Countrywise':
+        country = st.sidebar.selectbox("Select country", countries)
+        view_type = st.selectbox("Choose what forecast you would like to view", FEATURES)
+        show_country_forecast(country, view_type, engine)
     if graph_type=='Global':
         view_type = st.selectbox("Choose what forecast you would like to view", ["Confirmed","Deaths",
                                                         "Recovered","Active"])
         if view_type=='Confirmed':
             st.subheader('Forecasting Confirmed Cases Worldwide(Baseline)')
-            fig = forecast_global(df, feature='Confirmed')
-            st.write(fig)
-            fig1 = forecast_global_components(df, feature='Confirmed')
-            st.write(fig1)
-            rmse = get_error_metrics(df, feature='Confirmed')
-            st.write('The root mean squared error is: ', rmse)
+            fig = forecast_global(df, feature='Confirmed', engine=engine)
+            show_figure(fig)
+            fig1 = forecast_global_components(df, feature='Confirmed', engine=engine)
+            show_figure(fig1)
+            show_error_metrics(feature='Confirmed', engine=engine)
             st.write('This graph is taken in the form of A*10^8, where A is the number in the y-axis. This graph shows an upward trend. The confirmed cases seemed to have slowed down due to the roll out and the effectiveness of the vaccine. Hope to see a downward trend in the far future')
 
         if view_type=='Deaths':
             st.subheader('Forecasting Deaths Worldwide(Baseline)')
-            fig = forecast_global(df, feature='Deaths')
-            st.write(fig)
-            fig1 = forecast_global_components(df, feature='Deaths')
-            st.write(fig1)
-            rmse = get_error_metrics(df, feature='Deaths')
-            st.write('The root mean squared error is: ', rmse)
+            fig = forecast_global(df, feature='Deaths', engine=engine)
+            show_figure(fig)
+            fig1 = forecast_global_components(df, feature='Deaths', engine=engine)
+            show_figure(fig1)
+            show_error_metrics(feature='Deaths', engine=engine)
             st.write('There has been an overwhelming amount of deaths over the past one year. The number of deaths have slowed down but unfortunately, there were vast cases of death in India')
         
         if view_type=='Recovered':
             st.subheader('Forecasting Recovered Cases Worldwide(Baseline)')
-            fig = forecast_global(df, feature='Recovered')
-            st.write(fig)
-            fig1 = forecast_global_components(df, feature='Recovered')
-            st.write(fig1)
-            rmse = get_error_metrics(df, feature='Recovered')
-            st.write('The root mean squared error is: ', rmse)
+            fig = forecast_global(df, feature='Recovered', engine=engine)
+            show_figure(fig)
+            fig1 = forecast_global_components(df, feature='Recovered', engine=engine)
+            show_figure(fig1)
+            show_error_metrics(feature='Recovered', engine=engine)
             st.write('This graph kinda gives me the hope that things are going to get better with the amount of people who have recovered.')
         
         if view_type=='Active':
             st.subheader('Forecasting Active Cases Worldwide(Baseline)')
-            fig = forecast_global(df, feature='Active')
-            st.write(fig)
-            fig1 = forecast_global_components(df, feature='Active')
-            st.write(fig1)
-            rmse = get_error_metrics(df, feature='Active')
-            st.write('The root mean squared error is: ', rmse)
+            fig = forecast_global(df, feature='Active', engine=engine)
+            show_figure(fig)
+            fig1 = forecast_global_components(df, feature='Active', engine=engine)
+            show_figure(fig1)
+            show_error_metrics(feature='Active', engine=engine)
     
 
 if __name__=='__main__':
@@ -1,24 +1,14 @@
-import pandas as pd
 import streamlit as st
 import altair as alt
 import plotly.express as px
 import plotly.graph_objs as go
 from plotly.subplots import make_subplots
 import datetime
+from pages.utils import data_store
+from pages.utils.aggregates import METRICS
+from pages.utils.caching import versioned_cache
 
 
-#loading the data
-def load_data():
-    """ Function to load data
-        param DATA_URL: data_url
-        return: pandas dataframe
-    """
-    DATA_URL = 'data/covid.csv'
-    data = pd.read_csv(DATA_URL)
-    data['Date'] = pd.to_datetime(data['Date']).dt.strftime('%Y-%m-%d')
-    return data
-
-@st.cache
 def plot_snapshot_numbers(df, colors, country=None):
     """
     Function plots snapshots for worldwide and countries.
@@ -28,99 +18,90 @@ def plot_snapshot_numbers(df, colors, country=None):
     :param country: str
     :return: plotly.figure
     """
-    with st.spinner("Rendering chart..."):
-        colors = px.colors.qualitative.Set1
-        if country:
-            df = df[df["Country/Region"] == country]
-        fig = go.Figure()
-        fig.add_trace(go.Bar(y=df[["Confirmed", "Deaths", "Recovered", "Active"]].columns.tolist(),
-                             x=df[["Confirmed", "Deaths", "Recovered", "Active"]].sum().values,
-                             text=df[["Confirmed", "Deaths", "Recovered", "Active"]].sum().values,
-                             orientation='h',
-                             marker=dict(color=[colors[1], colors[3], colors[2], colors[0]]),
-                             ),
+    colors = px.colors.qualitative.Set1
+    if country:
+        df = df[df["Country/Region"] == country]
+    fig = go.Figure()
+    fig.add_trace(go.Bar(y=df[["Confirmed", "Deaths", "Recovered", "Active"]].columns.tolist(),
+                         x=df[["Confirmed", "Deaths", "Recovered", "Active"]].sum().values,
+                         text=df[["Confirmed", "Deaths", "Recovered", "Active"]].sum().values,
+                         orientation='h',
+                         marker=dict(color=[colors[1], colors[3], colors[2], colors[0]]),
+                         ),
+                  )
+    fig.update_traces(opacity=0.7,
+                      textposition=["inside", "outside", "inside", "inside"],
+                      texttemplate='%{text:.3s}',
+                      hovertemplate='Status: %{y} <br>Count: %{x:,.2f}',
+                      marker_line_color='rgb(255, 255, 255)',
+                      marker_line_width=2.5
                       )
-        fig.update_traces(opacity=0.7,
-                          textposition=["inside", "outside", "inside", "inside"],
-                          texttemplate='%{text:.3s}',
-                          hovertemplate='Status: %{y} <br>Count: %{x:,.2f}',
-                          marker_line_color='rgb(255, 255, 255)',
-                          marker_line_width=2.5
-                          )
-        fig.update_layout(
-            title="Total count",
-            width=800,
-            legend_title_text="Status",
-            xaxis=dict(title="Count"),
-            yaxis=dict(showgrid=False, showticklabels=True),
-        )
+    fig.update_layout(
+        title="Total count",
+        width=800,
+        legend_title_text="Status",
+        xaxis=dict(title="Count"),
+        yaxis=dict(showgrid=False, showticklabels=True),
+    )
 
-        return fig
+    return fig
 
-@st.cache(suppress_st_warning=True)
-def plot_top_states(df, country=None):
+def plot_top_states(tops, country=None):
     """
     Function plots top provinces by confirmed, deaths, recovered, active cases.
-    :param df: DataFrame
-    :param colors: list
-    :return: plotly.figure
+    :param tops: dict of metric -> DataFrame of the country's top provinces for it (see data_store.top_n)
+    :param country: str
+    :return: plotly.figure, or None when the country has no province/state level data
     """
-    with st.spinner("Rendering chart..."):
-        df = df[df["Country/Region"] == country]
-        if df["Province/State"].isnull().all():
-            st.info("Sorry we do not have province/state level information for {}".format(country))
+    if tops["Confirmed"].empty:
+        return None
+
+    else:
+        colors = px.colors.qualitative.Prism
+        fig = make_subplots(2, 2, subplot_titles=("Top 10 Province/States by cases",
+                                              "Top 10 Province/States by deaths",
+                                              "Top 10 Province/States by recoveries",
+                                              "Top 10 Province/States by active cases"))
+        fig.append_trace(go.Bar(x=tops["Confirmed"]["Confirmed"],
+                            y=tops["Confirmed"]["Province/State"],
+                            orientation='h',
+                            marker=dict(color=colors),
+                            hovertemplate='<br>Count: %{x:,.2f}',
+                            ),
+                     row=1, col=1)
+
+        fig.append_trace(go.Bar(x=tops["Deaths"]["Deaths"],
+                            y=tops["Deaths"]["Province/State"],
+                            orientation='h',
+                            marker=dict(color=colors),
+                            hovertemplate='<br>Count: %{x:,.2f}',
+                            ),
+                     row=2, col=1)
+
+        fig.append_trace(go.Bar(x=tops["Recovered"]["Recovered"],
+                            y=tops["Recovered"]["Province/State"],
+                            orientation='h',
+                            marker=dict(color=colors),
+                            hovertemplate='<br>Count: %{x:,.2f}',
+                            ),
+                     row=1, col=2)
+
+        fig.append_trace(go.Bar(x=tops["Active"]["Active"],
+                            y=tops["Active"]["Province/State"],
+                            orientation='h',
+                            marker=dict(color=colors),
+                            hovertemplate='<br>Count: %{x:,.2f}'),
+                     row=2, col=2)
+        fig.update_yaxes(autorange="reversed")
+        fig.update_traces(
+        opacity=0.7,
+        marker_line_color='rgb(255, 255, 255)',
+        marker_line_width=2.5)
+        fig.update_layout(height=700,
+                      width=1000,
+                      showlegend=False)
 
-        else:
-        
-            df = df.groupby(["Province/State"]).agg({"Confirmed": "sum",
-                                             "Deaths": "sum",
-                                             "Recovered": "sum",
-                                             "Active": "sum"})
-            colors = px.colors.qualitative.Prism
-            fig = make_subplots(2, 2, subplot_titles=("Top 10 Province/States by cases",
-                                                  "Top 10 Province/States by deaths",
-                                                  "Top 10 Province/States by recoveries",
-                                                  "Top 10 Province/States by active cases"))
-            fig.append_trace(go.Bar(x=df["Confirmed"].nlargest(n=10),
-                                y=df["Confirmed"].nlargest(n=10).index,
-                                orientation='h',
-                                marker=dict(color=colors),
-                                hovertemplate='<br>Count: %{x:,.2f}',
-                                ),
-                         row=1, col=1)
-
-            fig.append_trace(go.Bar(x=df["Deaths"].nlargest(n=10),
-                                y=df["Deaths"].nlargest(n=10).index,
-                                orientation='h',
-                                marker=dict(color=colors),
-                                hovertemplate='<br>Count: %{x:,.2f}',
-                                ),
-                         row=2, col=1)
-
-            fig.append_trace(go.Bar(x=df["Recovered"].nlargest(n=10),
-                                y=df["Recovered"].nlargest(n=10).index,
-                                orientation='h',
-                                marker=dict(color=colors),
-                                hovertemplate='<br>Count: %{x:,.2f}',
-                                ),
-                         row=1, col=2)
-
-            fig.append_trace(go.Bar(x=df["Active"].nlargest(n=10),
-                                y=df["Active"].nlargest(n=10).index,
-                                orientation='h',
-                                marker=dict(color=colors),
-                                hovertemplate='<br>Count: %{x:,.2f}'),
-                         row=2, col=2)
-            fig.update_yaxes(autorange="reversed")
-            fig.update_traces(
-            opacity=0.7,
-            marker_line_color='rgb(255, 255, 255)',
-            marker_line_width=2.5)
-            fig.update_layout(height=700,
-                          width=1000,
-                          showlegend=False)
-
-            return fig
+        return fig
 
 
 
@@ -132,46 +113,81 @@ def timeline(df, feature, country=None):
     :param country: str
     :return: plotly.figure, DataFrame
     """
-    with st.spinner("Rendering chart..."):
-        color = px.colors.qualitative.Set1
-        if country:
-            df = df[df['Country/Region'] == country]
-        
-        temp = df.groupby(['Date']).agg({feature: "sum"}).reset_index()
-        
-        fig = go.Figure()
-        fig.add_trace(go.Line(
-            x=temp['Date'],
-            y=temp[feature],
-            marker=dict(color=color[2]),
-            hovertemplate='Date: %{x} <br>Count: %{y:,.2f}',
-        ))
-        
-        return fig
+    color = px.colors.qualitative.Set1
+    if country:
+        df = df[df['Country/Region'] == country]
+    
+    temp = df.groupby(['Date']).agg({feature: "sum"}).reset_index()
+    
+    fig = go.Figure()
+    fig.add_trace(go.Line(
+        x=temp['Date'],
+        y=temp[feature],
+        marker=dict(color=color[2]),
+        hovertemplate='Date: %{x} <br>Count: %{y:,.2f}',
+    ))
+    
+    return fig
+
+@versioned_cache(lambda: data_store.aggregate_version('latest_by_country'))
+def snapshot_figure(country):
+    """
+    Function returning the total count chart of a country, cached per data version
+    :param country: str
+    :return: plotly.figure shared by every session, not to be modified
+    """
+    return plot_snapshot_numbers(data_store.country_rows('latest_by_country', country), px.colors.qualitative.D3)
+
+@versioned_cache(lambda: data_store.aggregate_version('by_country_date'))
+def timeline_figure(country, feature):
+    """
+    Function returning the timeline chart of a country, cached per data version
+    :param country: str
+    :param feature: str
+    :return: plotly.figure shared by every session, not to be modified
+    """
+    return timeline(data_store.country_rows('by_country_date', country), feature)
+
+@versioned_cache(lambda: data_store.aggregate_version('latest_by_country_province'))
+def top_states_figure(country):
+    """
+    Function returning the top provinces chart of a country, cached per data version
+    :param country: str
+    :return: plotly.figure shared by every session, not to be modified, or None when the
+             country has no province/state level data
+    """
+    tops = {metric: data_store.top_n('latest_by_country_province', metric, 10, country) for metric in METRICS}
+    return plot_top_states(tops, country=country)
 
 def main():
     st.title("Visualization of the Covid-19 Cases Countrywise")
-    df = load_data()
-    country = st.sidebar.selectbox("Select country",df["Country/Region"].unique())
+    countries = data_store.get_aggregate('latest_by_country')["Country/Region"]
+    country = st.sidebar.selectbox("Select country",countries.tolist())
     #barplot to show the changes in the covid 19 cases
 
     graph_type = st.sidebar.selectbox("Choose visualization", ["Total Count",
                                                         "Timeline","Province/States"])
     if(graph_type=="Total Count"):
         st.header(f'Changes in the covid cases in {country}')
-        fig = plot_snapshot_numbers(df, px.colors.qualitative.D3, country)
+        with st.spinner("Rendering chart..."):
+            fig = snapshot_figure(country)
         st.plotly_chart(fig)
     
     if(graph_type=="Timeline"):
         st.header(f'Timeline of the covid cases in {country}')
         feature = st.selectbox("Select one", ['Confirmed', 'Deaths','Recovered'])
-        fig = timeline(df,feature,country=country)
+        with st.spinner("Rendering chart..."):
+            fig = timeline_figure(country, feature)
         st.plotly_chart(fig)
     
     if(graph_type=="Province/States"):
         st.header(f'Top 10 Province/States with highest covid cases in {country}')
-        fig = plot_top_states(df,country=country)
-        st.plotly_chart(fig)
+        with st.spinner("Rendering chart..."):
+            fig = top_states_figure(country)
+        if fig is None:
+            st.info("Sorry we do not have province/state level information for {}".format(country))
+        else:
+            st.plotly_chart(fig)
 
 
 if __name__=='__main__':
@@ -0,0 +1,59 @@
+import os
+
+from pages.utils.storage import write_table
+
+METRICS = ['Confirmed', 'Deaths', 'Recovered', 'Active']
+
+# aggregate name -> group keys, summed over every other dimension of the long table
+AGGREGATES = {
+    'by_date': ['Date'],
+    'by_country_date': ['Country/Region', 'Date'],
+}
+
+# snapshot name -> group keys, summed over the rows of the latest date only since
+# the JHU series are cumulative (summing them over dates counts each case once per day)
+SNAPSHOTS = {
+    'latest_by_country_province': ['Country/Region', 'Province/State'],
+    'latest_by_country': ['Country/Region'],
+}
+
+
+def build_aggregates(df):
+    """
+    Function that materializes the recurring groupbys of the dashboard
+    arg: long JHU dataframe
+    return: dict of aggregate name -> dataframe
+    """
+    tables = {name: df.groupby(keys, observed=True)[METRICS].sum().reset_index()
+              for name, keys in AGGREGATES.items()}
+    latest = df[df['Date'] == df['Date'].max()]
+    tables.update({name: latest.groupby(keys, observed=True)[METRICS].sum().reset_index()
+                   for name, keys in SNAPSHOTS.items()})
+    return tables
+
+
+def rank_snapshot(data):
+    """
+    Function that sorts a snapshot table once per metric. Province snapshots are
+    also ranked within each country.
+    arg: snapshot dataframe
+    return: dict of (country or None, metric) -> rows in descending metric order
+    """
+    rankings = {}
+    for metric in METRICS:
+        ranked = data.sort_values(metric, ascending=False, kind='mergesort')
+        rankings[(None, metric)] = ranked
+        if 'Province/State' in data.columns:
+            for country, rows in ranked.groupby('Country/Region', observed=True, sort=False):
+                rankings[(country, metric)] = rows
+    return rankings
+
+
+def write_aggregates(df, fmt='csv', directory='data'):
+    """
+    Function that writes every aggregate next to the long table as <directory>/agg_<name>
+    arg: long JHU dataframe, output format, directory of the long table
+    return: list of written paths
+    """
+    return [write_table(data, os.path.join(directory, f'agg_{name}'), fmt)
+            for name, data in build_aggregates(df).items()]
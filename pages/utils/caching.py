@@ -0,0 +1,80 @@
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+from pages.utils import metrics
+
+TTL = 3600
+MAX_ENTRIES = 128
+
+# every cache created by versioned_cache, as (clear, retain) functions
+_caches = []
+
+
+def versioned_cache(version, ttl=TTL, max_entries=MAX_ENTRIES):
+    """
+    Decorator that caches a function per (dataset version, arguments). Unlike st.cache it
+    never hashes dataframes: the function must load its own data and take only hashable
+    arguments, and version is a callable returning a cheap token of the data it reads
+    (e.g. data_store.aggregate_version). The function must not write to the page, since
+    a cache hit does not run it. Every caller and session gets the same returned object,
+    so callers must not modify it (e.g. update_layout on a cached figure); copy it first.
+    arg: version callable, seconds an entry is reused for (None for no expiry), number of
+         entries kept (least recently used first out)
+    """
+    def decorator(func):
+        entries = OrderedDict()
+        lock = threading.Lock()
+        name = f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (version()[:16], args, tuple(sorted(kwargs.items())))
+            now = time.monotonic()
+            with lock:
+                entry = entries.get(key)
+                if entry is not None and (ttl is None or now - entry[0] < ttl):
+                    entries.move_to_end(key)
+                    metrics.cache('versioned', 'hit')
+                    return entry[1]
+            metrics.cache('versioned', 'miss')
+            with metrics.timed('cached_call', function=name):
+                value = func(*args, **kwargs)
+            with lock:
+                entries[key] = (now, value)
+                entries.move_to_end(key)
+                while len(entries) > max_entries:
+                    entries.popitem(last=False)
+            return value
+
+        def cache_clear():
+            with lock:
+                entries.clear()
+
+        def cache_retain(versions):
+            with lock:
+                for key in [key for key in entries if key[0] not in versions]:
+                    del entries[key]
+
+        wrapper.cache_clear = cache_clear
+        _caches.append((cache_clear, cache_retain))
+        return wrapper
+    return decorator
+
+
+def clear_all():
+    """
+    Function that empties every versioned_cache
+    """
+    for cache_clear, _ in _caches:
+        cache_clear()
+
+
+def retain(versions):
+    """
+    Function that drops the entries of every versioned_cache computed for data versions
+    other than the given tokens
+    """
+    for _, cache_retain in _caches:
+        cache_retain(versions)
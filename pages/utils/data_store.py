@@ -0,0 +1,302 @@
+import logging
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from pages.utils import metrics
+from pages.utils.aggregates import AGGREGATES, SNAPSHOTS, build_aggregates, rank_snapshot
+from pages.utils.storage import apply_schema, default_dtypes, file_digest, memory_mb, read_table, table_path
+from pages.utils.versions import data_dir, snapshot
+
+
+# dataset name -> stored table without extension, relative to the version directory
+DATASETS = {
+    'covid': 'covid',
+    'vaccine': 'df_vaccine',
+    'daily': 'df_daily',
+    'summary': 'summary_df',
+}
+DATASETS.update({f'agg_{name}': f'agg_{name}' for name in list(AGGREGATES) + list(SNAPSHOTS)})
+
+logger = logging.getLogger(__name__)
+
+# every session gets views of the same cached frames. With copy-on-write (pandas >= 1.5)
+# modifying a view in place copies the touched columns first instead of changing them for
+# everyone; the pinned pandas 1.2 lacks it, so there callers must copy() before doing so.
+try:
+    pd.set_option('mode.copy_on_write', True)
+except KeyError:
+    pass
+
+_cache = {}
+_digests = {}
+_locks = {}
+_locks_guard = threading.Lock()
+_derived_lock = threading.RLock()
+
+
+def _stamp(name):
+    """
+    Function that returns the stored file of a dataset, in the version directory the
+    calling thread reads from, with its mtime and size
+    """
+    path = table_path(os.path.join(data_dir(), DATASETS[name]))
+    stat = os.stat(path)
+    return (path, stat.st_mtime_ns, stat.st_size)
+
+
+def _digest(stamp):
+    """
+    Function that hashes a file once per (path, mtime, size) stamp, forgetting the
+    stamps the same path had before
+    """
+    if stamp not in _digests:
+        digest = file_digest(stamp[0])
+        for stale in [other for other in list(_digests) if other[0] == stamp[0]]:
+            _digests.pop(stale, None)
+        _digests[stamp] = digest
+    return _digests[stamp]
+
+
+def _refresh(name, columns=None):
+    """
+    Function that (re)loads a dataset when its file changed since the last load.
+    The file is only hashed when its path, mtime or size moved, and only
+    re-parsed when no version directory holds a cached copy with the same hash.
+    Loaded tables are converted to the dtypes of storage.SCHEMA.
+    arg: dataset name and optional column projection
+    return: cache entry
+    """
+    stamp = _stamp(name)
+    key = (os.path.dirname(stamp[0]), name, tuple(columns) if columns is not None else None)
+    entry = _cache.get(key)
+    if entry is not None and entry['stamp'] == stamp:
+        metrics.cache('dataset', 'hit')
+        return entry
+
+    with _locks_guard:
+        lock = _locks.setdefault(key, threading.Lock())
+    with lock:
+        # another session may have reloaded while we waited for the lock
+        entry = _cache.get(key)
+        if entry is not None and entry['stamp'] == stamp:
+            metrics.cache('dataset', 'hit')
+            return entry
+        digest = _digest(stamp)
+        if entry is None or entry['digest'] != digest:
+            # a table a refresh left unchanged is shared with the previous version
+            entry = next((other for other_key, other in list(_cache.items())
+                          if other_key[1:] == key[1:] and other['digest'] == digest),
+                         entry)
+        if entry is not None and entry['digest'] == digest:
+            metrics.cache('dataset', 'hit')
+            entry = dict(entry, stamp=stamp)
+        else:
+            metrics.cache('dataset', 'miss')
+            with metrics.timed('load', dataset=name):
+                frame = apply_schema(read_table(stamp[0], columns=columns))
+            logger.info("Loaded %s: %d rows", name, len(frame))
+            entry = {'stamp': stamp, 'digest': digest, 'frame': frame}
+        _cache[key] = entry
+        return entry
+
+
+def get_dataset(name, columns=None):
+    """
+    Function that returns a dataset shared by every session and page of the process.
+    The returned frame is a shallow view of the cached one: adding, replacing or
+    dropping columns is safe. Values modified in place stay private to the view under
+    copy-on-write (see above); without it, copy() the frame first.
+    arg: dataset name (one of DATASETS) and optional list of columns to read
+    return: pandas dataframe
+    """
+    return _refresh(name, columns)['frame'].copy(deep=False)
+
+
+def get_aggregate(name):
+    """
+    Function that returns one of the aggregates.AGGREGATES or SNAPSHOTS tables written by the refresh.
+    When the refresh predates the aggregates they are computed once from the long
+    table and cached with its version.
+    arg: aggregate name (e.g. 'by_date')
+    return: pandas dataframe
+    """
+    try:
+        return get_dataset(f'agg_{name}')
+    except FileNotFoundError:
+        pass
+    version = dataset_version('covid')
+    key = ('derived', version)
+    with _derived_lock:
+        if key not in _cache:
+            metrics.cache('derived', 'miss')
+            for stale in [k for k in list(_cache) if k[0] == 'derived']:
+                del _cache[stale]
+            with metrics.timed('aggregate', table='covid', op='derive'):
+                _cache[key] = build_aggregates(get_dataset('covid'))
+        else:
+            metrics.cache('derived', 'hit')
+        return _cache[key][name].copy(deep=False)
+
+
+def aggregate_version(name):
+    """
+    Function that returns the version of an aggregate, i.e. of its file or of the
+    long table it is derived from
+    """
+    try:
+        return dataset_version(f'agg_{name}')
+    except FileNotFoundError:
+        return dataset_version('covid')
+
+
+def top_n(name, metric, n=10, country=None):
+    """
+    Function that returns the n largest rows of a snapshot table for a metric.
+    The rankings are sorted once per dataset version, so a lookup is a slice.
+    arg: snapshot name (one of aggregates.SNAPSHOTS), metric, n, and for the
+         province snapshot the country to rank within
+    return: pandas dataframe (empty when the country has no rows)
+    """
+    key = ('ranked', name, aggregate_version(name))
+    with _derived_lock:
+        if key not in _cache:
+            metrics.cache('ranking', 'miss')
+            for stale in [k for k in list(_cache) if k[:2] == ('ranked', name)]:
+                del _cache[stale]
+            data = get_aggregate(name)
+            with metrics.timed('aggregate', table=name, op='rank'):
+                _cache[key] = rank_snapshot(data)
+        else:
+            metrics.cache('ranking', 'hit')
+        rankings = _cache[key]
+    ranked = rankings.get((country, metric))
+    if ranked is None:
+        ranked = rankings[(None, metric)].iloc[0:0]
+    return ranked.head(n).copy(deep=False)
+
+
+def _partition(data, key='Country/Region'):
+    """
+    Function that sorts a table by a key and records where each key's rows start and stop
+    arg: dataframe, key column
+    return: (sorted dataframe, dict of key value -> (start, stop) row offsets)
+    """
+    ordered = data.sort_values(key, kind='mergesort').reset_index(drop=True)
+    keys = ordered[key].astype(str).to_numpy()
+    if len(keys) == 0:
+        return ordered, {}
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    stops = np.r_[starts[1:], len(keys)]
+    return ordered, dict(zip(keys[starts], zip(starts, stops)))
+
+
+def country_rows(name, country):
+    """
+    Function that returns the rows of one country of an aggregate without scanning it.
+    The aggregate is sorted by country once per dataset version, so a lookup is a slice.
+    arg: aggregate name (e.g. 'by_country_date'), country
+    return: pandas dataframe (empty when the country has no rows)
+    """
+    key = ('partitioned', name, aggregate_version(name))
+    with _derived_lock:
+        if key not in _cache:
+            metrics.cache('partition', 'miss')
+            for stale in [k for k in list(_cache) if k[:2] == ('partitioned', name)]:
+                del _cache[stale]
+            data = get_aggregate(name)
+            with metrics.timed('aggregate', table=name, op='partition'):
+                _cache[key] = _partition(data)
+        else:
+            metrics.cache('partition', 'hit')
+        ordered, offsets = _cache[key]
+    start, stop = offsets.get(country, (0, 0))
+    return ordered.iloc[start:stop].copy(deep=False)
+
+
+def memory_report():
+    """
+    Function that lists the memory held by every loaded dataset, next to what the same
+    rows take with pandas' default dtypes (see storage.default_dtypes). Measuring takes
+    longer than loading, so it is done here, once per loaded table, rather than on load.
+    return: dataframe indexed by dataset and column projection
+    """
+    directory = data_dir()
+    rows = []
+    for key, entry in list(_cache.items()):
+        if key[0] != directory:
+            continue
+        if 'memory' not in entry:
+            entry['memory'] = (memory_mb(default_dtypes(entry['frame'])), memory_mb(entry['frame']))
+        rows.append({'dataset': key[1], 'columns': ', '.join(key[2]) if key[2] else 'all',
+                     'default_mb': entry['memory'][0], 'loaded_mb': entry['memory'][1]})
+    report = pd.DataFrame(rows, columns=['dataset', 'columns', 'default_mb', 'loaded_mb'])
+    report['saved_mb'] = report['default_mb'] - report['loaded_mb']
+    report['saved_percent'] = 100 * report['saved_mb'] / report['default_mb']
+    return report.set_index(['dataset', 'columns']).sort_index()
+
+
+def dataset_version(name):
+    """
+    Function that returns the content hash of the stored dataset
+    """
+    return _digest(_stamp(name))
+
+
+def preload(directory, source):
+    """
+    Function that loads into the cache every dataset and column projection cached for
+    the source version directory, from the directory of a new version, so the first
+    readers after a swap find them loaded
+    arg: new version directory, version directory whose cached datasets to replay
+    """
+    with snapshot(directory):
+        for key in [key for key in list(_cache) if key[0] == source]:
+            _refresh(key[1], key[2])
+
+
+def retain(directory):
+    """
+    Function that drops the cached datasets, file digests and load locks of every other
+    version directory, and the rankings, partitions and derived aggregates of data versions no
+    longer live
+    arg: live version directory
+    """
+    with snapshot(directory):
+        live = set()
+        for name in DATASETS:
+            try:
+                live.add(dataset_version(name))
+            except FileNotFoundError:
+                pass
+    with _derived_lock:
+        for key in list(_cache):
+            if key[0] in ('derived', 'ranked', 'partitioned'):
+                if key[-1] not in live:
+                    del _cache[key]
+            elif key[0] != directory:
+                del _cache[key]
+    for stamp in list(_digests):
+        if os.path.dirname(stamp[0]) != directory:
+            _digests.pop(stamp, None)
+    _prune_locks()
+
+
+def _prune_locks():
+    """
+    Function that drops the load locks of datasets no longer cached
+    """
+    with _locks_guard:
+        for key in [key for key in _locks if key not in _cache]:
+            del _locks[key]
+
+
+def clear_cache():
+    """
+    Function that drops every cached dataset
+    """
+    _cache.clear()
+    _digests.clear()
+    _prune_locks()
@@ -0,0 +1,145 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from pages.utils.storage import CHUNK, file_digest
+
+RAW_DIR = 'data/raw'
+WORKERS = 8
+RETRIES = 3
+BACKOFF = 0.5
+TIMEOUT = (10, 60)
+
+logger = logging.getLogger(__name__)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Function that returns the process-wide HTTP session: pooled keep-alive connections,
+    gzip negotiation, and retries with exponential backoff on connection errors and
+    throttling or server errors
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(total=RETRIES, backoff_factor=BACKOFF, status_forcelist=[429, 500, 502, 503, 504])
+            adapter = HTTPAdapter(pool_connections=WORKERS, pool_maxsize=WORKERS, max_retries=retry)
+            _session = requests.Session()
+            _session.headers['Accept-Encoding'] = 'gzip, deflate'
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+        return _session
+
+
+def _cache_paths(url, raw_dir):
+    name = os.path.basename(urllib.parse.urlparse(url).path)
+    return os.path.join(raw_dir, name), os.path.join(raw_dir, name + '.json')
+
+
+def _cached(url, raw_dir):
+    """
+    Function that returns the raw cache entry of a url when its file is intact
+    """
+    path, meta_path = _cache_paths(url, raw_dir)
+    if not (os.path.exists(path) and os.path.exists(meta_path)):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta.get('url') != url or file_digest(path) != meta.get('sha256'):
+        logger.warning("Raw cache of %s is stale or corrupt, downloading it again", url)
+        return None
+    return dict(meta, path=path)
+
+
+def _stream(response, path):
+    """
+    Function that streams a response body to path through a temporary file, hashing it
+    on the way
+    return: sha256 hex digest
+    """
+    digest = hashlib.sha256()
+    with open(path + '.tmp', 'wb') as f:
+        for chunk in response:
+            digest.update(chunk)
+            f.write(chunk)
+    os.replace(path + '.tmp', path)
+    return digest.hexdigest()
+
+
+def download(url, raw_dir=RAW_DIR):
+    """
+    Function that downloads a source file into the raw cache. The cached copy's ETag is
+    sent so an unchanged file is not transferred again. Works for http(s) as well as
+    file:// urls.
+    arg: url, raw cache directory
+    return: dict with 'path' of the cached file, 'etag', 'sha256', 'modified' (False when
+            the server answered 304) and 'url'
+    """
+    os.makedirs(raw_dir, exist_ok=True)
+    path, meta_path = _cache_paths(url, raw_dir)
+    cached = _cached(url, raw_dir)
+
+    for attempt in range(RETRIES + 1):
+        try:
+            if urllib.parse.urlparse(url).scheme == 'file':
+                with urllib.request.urlopen(url) as response:
+                    sha256, etag = _stream(iter(lambda: response.read(CHUNK), b''), path), None
+            else:
+                headers = {'If-None-Match': cached['etag']} if cached and cached.get('etag') else {}
+                with get_session().get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+                    if response.status_code == 304:
+                        return dict(cached, modified=False)
+                    response.raise_for_status()
+                    sha256 = _stream(response.iter_content(CHUNK), path)
+                    etag = response.headers.get('ETag')
+            break
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            # the adapter retries failed connections; this covers transfers cut mid-stream
+            if attempt == RETRIES:
+                raise
+            wait = BACKOFF * 2 ** attempt
+            logger.warning("Download of %s failed (%s), retrying in %.1fs", url, e, wait)
+            time.sleep(wait)
+
+    meta = {'url': url, 'etag': etag, 'sha256': sha256}
+    with open(meta_path + '.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(meta_path + '.tmp', meta_path)
+    return dict(meta, path=path, modified=True)
+
+
+def fetch_all(urls, parse=None, raw_dir=RAW_DIR, workers=WORKERS):
+    """
+    Function that downloads several sources concurrently over the pooled session. When a
+    parse function is given, each file is parsed by its download thread as soon as it
+    lands, while the other transfers are still running.
+    arg: dict of name -> url, optional parse(name, path) function, raw cache directory,
+         number of concurrent downloads
+    return: dict of name -> download() result, with the parse result under 'parsed'
+    """
+    def fetch_one(name):
+        start = time.perf_counter()
+        result = download(urls[name], raw_dir)
+        logger.info("%s: %s in %.2fs", name, 'downloaded' if result['modified'] else 'not modified',
+                    time.perf_counter() - start)
+        if parse is not None:
+            result['parsed'] = parse(name, result['path'])
+        return result
+
+    with ThreadPoolExecutor(max_workers=min(workers, len(urls)) or 1) as pool:
+        futures = {name: pool.submit(fetch_one, name) for name in urls}
+        return {name: future.result() for name, future in futures.items()}
+
@@ -1,7 +1,33 @@
 import pandas as pd
 import numpy as np
 import datetime
+import argparse
+import json
+import logging
+import os
 import pycountry 
+from pages.utils.aggregates import write_aggregates
+from pages.utils.fetch import fetch_all
+from pages.utils.figure_cache import warm
+from pages.utils.profiling import track
+from pages.utils.storage import FORMATS, read_table, table_path, write_table
+from pages.utils.versions import DATA_DIR, require_unversioned
+
+JHU_SOURCE = 'https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/'
+JHU_FILE = 'time_series_covid19_{}_global.csv'
+JHU_SERIES = ['confirmed', 'deaths', 'recovered']
+COVID_TABLE = 'data/covid'
+MANIFEST = 'data/covid_manifest.json'
+# number of already ingested days re-read on every incremental refresh, since JHU revises recent values
+TAIL_WINDOW = 7
+# curated name -> ISO code table, checked in; names it lacks are looked up with pycountry
+# and recorded in the generated COUNTRY_CODES_EXTRA instead
+COUNTRY_CODES = 'data/country_codes.csv'
+COUNTRY_CODES_EXTRA = 'data/country_codes_extra.csv'
+ID_COLUMNS = ['Province/State', 'Country/Region', 'Lat', 'Long']
+KEY_COLUMNS = ['Province/State', 'Country/Region']
+
+logger = logging.getLogger(__name__)
 
 def get_country_code(name):
     """
@@ -9,36 +35,239 @@ def get_country_code(name):
     """
     try:
         return pycountry.countries.lookup(name).alpha_3
-    except:
-        None
+    except LookupError:
+        return None
+
+
+def _read_codes(path):
+    if not os.path.exists(path):
+        return {}
+    table = pd.read_csv(path, keep_default_na=False)
+    return {name: code or None for name, code in zip(table['country'], table['iso_code'])}
 
 
-def fetchdata():
+def resolve_country_codes(names, path=COUNTRY_CODES, extra_path=COUNTRY_CODES_EXTRA):
     """
-    Function that reads raw data from JHU timeseries dataset and performs preprocessing
-    arg: None
-    return: None
+    Function that maps country names to ISO codes through the mapping table in data/.
+    Only names missing from the table and from the side table of names found by earlier
+    runs are looked up with pycountry; those are added to the side table, so the curated
+    table is never rewritten. Names without a code are logged.
+    arg: iterable of country names, path of the mapping table, path of the side table
+    return: dict of country name -> ISO code (None when unresolved)
+    """
+    extra = _read_codes(extra_path)
+    codes = dict(extra, **_read_codes(path))
+
+    names = pd.unique(pd.Series(names).dropna())
+    missing = [name for name in names if name not in codes]
+    for name in missing:
+        codes[name] = extra[name] = get_country_code(name)
+    if missing:
+        table = pd.DataFrame(sorted(extra.items()), columns=['country', 'iso_code'])
+        table.to_csv(extra_path + '.tmp', index=False)
+        os.replace(extra_path + '.tmp', extra_path)
+
+    unresolved = sorted(name for name in names if codes[name] is None)
+    if unresolved:
+        logger.warning("No ISO code for %d countries: %s", len(unresolved), ', '.join(unresolved))
+    return codes
+
+
+def build_long_table(df_confirmed, df_deaths, df_recovered):
+    """
+    Function that turns the three wide JHU matrices into one long table in a single pass.
+    Deaths and recovered rows are aligned on the (province, country) keys of the
+    confirmed matrix and the values are stacked with NumPy instead of melting and
+    merging each frame. Locations missing from a matrix count as 0, and a location repeated
+    in the deaths or recovered matrix takes its first row.
+    arg: wide confirmed, deaths and recovered dataframes
+    return: long dataframe with one row per location and date
+    """
+    date_cols = [col for col in df_confirmed.columns if col not in ID_COLUMNS]
+    # a missing province is a valid key ("whole country"), so give it a value for alignment
+    keys = pd.MultiIndex.from_frame(df_confirmed[KEY_COLUMNS].fillna(''))
+
+    def aligned(df):
+        df = df.set_index(pd.MultiIndex.from_frame(df[KEY_COLUMNS].fillna('')))
+        duplicated = df.index.duplicated()
+        if duplicated.any():
+            logger.warning("Keeping the first of the repeated locations %s", sorted(set(df.index[duplicated])))
+            df = df[~duplicated]
+        return df.reindex(index=keys, columns=date_cols).to_numpy(dtype='float64')
+
+    n_locations, n_dates = len(keys), len(date_cols)
+    dates = pd.to_datetime(pd.Index(date_cols), format='%m/%d/%y')
+    ids = df_confirmed[ID_COLUMNS]
+
+    # date-major order, i.e. all locations for the first date, then the next date...
+    df_all = ids.iloc[np.tile(np.arange(n_locations), n_dates)].reset_index(drop=True)
+    df_all['Date'] = dates.repeat(n_locations)
+    for name, df in (('Confirmed', df_confirmed), ('Deaths', df_deaths), ('Recovered', df_recovered)):
+        values = df[date_cols].to_numpy(dtype='float64') if df is df_confirmed else aligned(df)
+        df_all[name] = np.nan_to_num(values.ravel(order='F'))
+    return df_all
+
+
+def load_manifest(path=MANIFEST):
     """
-    df_confirmed = pd.read_csv('https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_confirmed_global.csv')
-    df_deaths = pd.read_csv('https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_deaths_global.csv')
-    df_recovered = pd.read_csv('https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_recovered_global.csv')
+    Function that reads the refresh manifest (last ingested date and source versions)
+    return: dict, empty when no refresh has been recorded yet
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
 
-    df_confirmed = df_confirmed.melt(id_vars=['Province/State', 'Country/Region', 'Lat', 'Long'], var_name='Date', value_name='Confirmed')
-    df_deaths = df_deaths.melt(id_vars=['Province/State', 'Country/Region', 'Lat', 'Long'], var_name='Date', value_name='Deaths')
-    df_recovered = df_recovered.melt(id_vars=['Province/State', 'Country/Region', 'Lat', 'Long'], var_name='Date', value_name='Recovered')
 
-    df_all =  df_confirmed.merge(right=df_deaths, how='left',on=['Province/State', 'Country/Region', 'Date', 'Lat', 'Long'])
-    df_all = df_all.merge(right=df_recovered, how='left',on=['Province/State', 'Country/Region', 'Date', 'Lat', 'Long'])
+def save_manifest(manifest, path=MANIFEST):
+    """
+    Function that atomically replaces the refresh manifest
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
 
-    df_all['Confirmed'] = df_all['Confirmed'].fillna(0)
-    df_all['Deaths'] = df_all['Deaths'].fillna(0)
-    df_all['Recovered'] = df_all['Recovered'].fillna(0)
-    df_all['Date'] = df_all['Date'].apply(lambda s: pd.to_datetime(s))
-    df_all['iso_code'] = df_all['Country/Region'].apply(get_country_code)
 
+def finish_table(df_all):
+    """
+    Function that adds the derived iso_code and Active columns to the long table
+    """
+    df_all['iso_code'] = df_all['Country/Region'].map(resolve_country_codes(df_all['Country/Region']))
     #tabulating the active cases
     df_all['Active'] = df_all['Confirmed'] - df_all['Deaths'] - df_all['Recovered']
+    return df_all
+
+
+def _paths(directory):
+    """
+    Function that returns the stored table and manifest paths inside a data directory
+    """
+    return (os.path.join(directory, os.path.basename(COVID_TABLE)),
+            os.path.join(directory, os.path.basename(MANIFEST)))
+
+
+def store_table(df_all, files, fmt='csv', directory=DATA_DIR, aggregates=True):
+    """
+    Function that writes the long table, its aggregates and the manifest recording its
+    last date and the checksums of the source files it was built from
+    arg: long dataframe, dict of series -> download result (see fetch.download), output
+         format, data directory, whether to write the aggregates
+    """
+    table, manifest = _paths(directory)
+    write_table(df_all, table, fmt)
+    if aggregates:
+        write_aggregates(df_all, fmt, directory)
+    save_manifest({
+        'last_date': df_all['Date'].max().strftime('%Y-%m-%d'),
+        'sources': {series: {'etag': f['etag'], 'sha256': f['sha256']} for series, f in files.items()},
+    }, manifest)
+
+
+def _download(source, parse):
+    return fetch_all({series: source + JHU_FILE.format(series) for series in JHU_SERIES}, parse=parse)
+
+
+def fetchdata(fmt='csv', stats=None, source=JHU_SOURCE, directory=DATA_DIR, files=None, aggregates=True):
+    """
+    Function that reads raw data from JHU timeseries dataset and performs preprocessing
+    arg: output format (one of storage.FORMATS), optional list collecting per-stage timings,
+         base url of the time series files, data directory, optional files already
+         downloaded (see fetch.fetch_all), whether to write the aggregates
+    return: long dataframe
+    """
+    with track('download', stats):
+        if files is None:
+            # each file is parsed as soon as it lands, while the others are still downloading
+            files = _download(source, lambda series, path: pd.read_csv(path))
+
+    with track('reshape', stats):
+        df_all = build_long_table(*(files[series]['parsed'] if 'parsed' in files[series]
+                                    else pd.read_csv(files[series]['path']) for series in JHU_SERIES))
+
+    with track('iso codes', stats):
+        df_all = finish_table(df_all)
+
+    with track('write', stats):
+        store_table(df_all, files, fmt, directory, aggregates)
+    return df_all
+
+
+def refresh(fmt='csv', stats=None, source=JHU_SOURCE, tail_window=TAIL_WINDOW, directory=DATA_DIR, files=None,
+            aggregates=True):
+    """
+    Function that incrementally updates the stored JHU table. Only the date columns after
+    the last ingested date, plus the last tail_window days, are parsed and reshaped; they
+    replace the matching rows of the stored table. Falls back to a full fetchdata() when
+    nothing has been ingested yet or when the set of locations changed.
+    arg: output format, optional list collecting per-stage timings, base url of the
+         time series files, number of ingested days to re-read, data directory, optional
+         files already downloaded (see fetch.fetch_all), whether to write the aggregates
+    return: long dataframe, or None when the sources did not change since the stored table
+    """
+    table, manifest_path = _paths(directory)
+    manifest = load_manifest(manifest_path)
+    try:
+        path = table_path(table)
+    except FileNotFoundError:
+        path = None
+    if not manifest or path is None:
+        logger.info("No previous refresh recorded, running a full fetch")
+        return fetchdata(fmt, stats, source, directory, files, aggregates)
+
+    known = manifest['sources']
+    start = pd.Timestamp(manifest['last_date']) - pd.Timedelta(days=tail_window - 1)
+
+    def read_tail(series, path):
+        header = pd.read_csv(path, nrows=0).columns
+        new_cols = [col for col in header if col not in ID_COLUMNS
+                    and pd.to_datetime(col, format='%m/%d/%y') >= start]
+        return pd.read_csv(path, usecols=ID_COLUMNS + new_cols)[ID_COLUMNS + new_cols]
+
+    with track('download', stats):
+        if files is None:
+            # unchanged files are answered with 304 and read back from the raw cache
+            files = _download(source, read_tail)
+    if (all(f['sha256'] == known[series]['sha256'] for series, f in files.items())
+            and path.endswith(FORMATS[fmt])):
+        logger.info("Sources unchanged since %s, nothing to do", manifest['last_date'])
+        return None
+    downloaded = {series: {key: value for key, value in f.items() if key != 'parsed'} for series, f in files.items()}
+
+    with track('reshape', stats):
+        frames = [files[series]['parsed'] if 'parsed' in files[series] else read_tail(series, files[series]['path'])
+                  for series in JHU_SERIES]
+        df_new = finish_table(build_long_table(*frames))
+
+    with track('merge', stats):
+        df_old = read_table(path)
+        df_old = df_old[df_old['Date'] < start]
+        old_keys = set(map(tuple, df_old[KEY_COLUMNS].astype(object).fillna('').drop_duplicates().to_numpy()))
+        new_keys = set(map(tuple, frames[0][KEY_COLUMNS].fillna('').to_numpy()))
+        if old_keys != new_keys:
+            logger.info("Locations changed upstream, running a full fetch")
+            return fetchdata(fmt, stats, source, directory, downloaded, aggregates)
+        df_all = pd.concat([df_old, df_new[df_old.columns]], ignore_index=True)
+
+    with track('write', stats):
+        store_table(df_all, downloaded, fmt, directory, aggregates)
+    logger.info("Ingested %d rows from %s onwards", len(df_new), start.strftime('%Y-%m-%d'))
+    return df_all
+
 
-    df_all.to_csv('data/covid.csv')
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Refresh the JHU time series dataset')
+    parser.add_argument('--format', choices=list(FORMATS), default='csv')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only ingest dates after the last refresh (plus a revised tail window)')
+    parser.add_argument('--source', default=JHU_SOURCE,
+                        help='base url of the time series files, e.g. file:///path/to/mirror/')
+    args = parser.parse_args()
+    require_unversioned('fetch_data')
+    logging.basicConfig(level=logging.INFO)
+    if args.incremental:
+        refresh(fmt=args.format, source=args.source)
+    else:
+        fetchdata(fmt=args.format, source=args.source)
+    warm()
 
-fetchdata()
@@ -1,30 +1,70 @@
 import pandas as pd
-import numpy as np
-import datetime
-import pycountry
+import argparse
+from pages.utils.fetch import fetch_all
+from pages.utils.figure_cache import warm
+from pages.utils.storage import FORMATS, read_table, table_path, write_table
+from pages.utils.versions import require_unversioned
 
-def get_vacc_data():
-    vaccine_data = pd.read_csv('https://raw.githubusercontent.com/owid/covid-19-data/master/public/data/vaccinations/vaccinations.csv')
-    vaccine_loc = pd.read_csv('https://raw.githubusercontent.com/owid/covid-19-data/master/public/data/vaccinations/locations.csv')
+OWID_SOURCE = 'https://raw.githubusercontent.com/owid/covid-19-data/master/public/data/vaccinations/'
+OWID_FILES = {'vaccinations': 'vaccinations.csv', 'locations': 'locations.csv'}
+WORLDOMETER_SUMMARY = 'data/worldometer_coronavirus_summary_data.csv'
+WORLDOMETER_DAILY = 'data/worldometer_coronavirus_daily_data.csv'
+VACCINE_TABLE = 'data/df_vaccine'
+SUMMARY_TABLE = 'data/summary_df'
+DAILY_TABLE = 'data/df_daily'
+
+def get_vacc_data(fmt='csv', source=OWID_SOURCE):
+    # both files download concurrently and each is parsed as soon as it lands
+    files = fetch_all({name: source + file for name, file in OWID_FILES.items()},
+                      parse=lambda name, path: pd.read_csv(path))
+    df_vaccine = build_vacc_data(files['vaccinations']['parsed'], files['locations']['parsed'])
+    return write_table(df_vaccine, VACCINE_TABLE, fmt)
+
+def build_vacc_data(vaccine_data, vaccine_loc):
+    """
+    Function that joins the OWID vaccinations with the vaccines used by each location
+    and fills the gaps of every country's series
+    arg: vaccinations.csv and locations.csv dataframes
+    return: vaccination dataframe sorted by date
+    """
     df_vaccine = pd.merge(vaccine_data, vaccine_loc, on=["location", "iso_code"])
-    df_vaccine.drop(['daily_vaccinations_raw'], axis=1)
+    df_vaccine = df_vaccine.drop(['daily_vaccinations_raw'], axis=1)
     df_vaccine['date'] = pd.to_datetime(df_vaccine['date'])
     df_vaccine = df_vaccine.sort_values('date', ascending=True)
-    df_vaccine['date'] = df_vaccine['date'].dt.strftime('%Y-%m-%d')
     df_vaccine = df_vaccine.rename(columns={'location': 'country'})
-    for iso_code in df_vaccine['iso_code'].unique():
-        df_vaccine.loc[df_vaccine['iso_code'] == iso_code, :] = df_vaccine.loc[df_vaccine['iso_code'] == iso_code, :].fillna(method='ffill').fillna(0)
-    df_vaccine.to_csv('data/df_vaccine.csv')
+    return fill_by_country(df_vaccine)
+
+def fill_by_country(df_vaccine):
+    """
+    Function that forward fills every column within each iso_code (in the frame's
+    date order) and replaces the values still missing with 0.
+    Rows without an iso_code are left untouched.
+    arg: vaccination dataframe sorted by date
+    return: filled dataframe
+    """
+    has_code = df_vaccine['iso_code'].notna()
+    filled = df_vaccine[has_code].groupby('iso_code', sort=False).ffill().fillna(0)
+    df_vaccine = df_vaccine.copy()
+    df_vaccine.loc[has_code, filled.columns] = filled
+    return df_vaccine
 
-def aggregate(df: pd.Series, agg_col: str) -> pd.DataFrame:
-    data = df.groupby(["country"])[agg_col].max()
-    data = pd.DataFrame(data)
+def aggregate(df: pd.DataFrame, agg_cols: list) -> pd.DataFrame:
+    data = df.groupby(["country"])[agg_cols].max()
     return data
 
-def get_summ_data():
-    summary_data = pd.read_csv(r'C:\Users\Srijhak\Documents\Covid19-dash\data\worldometer_coronavirus_summary_data.csv')
-    df_vaccine = pd.read_csv(r'C:\Users\Srijhak\Documents\Covid19-dash\data\df_vaccine.csv')
-    df_vaccine.country = df_vaccine.country.replace().replace({
+def get_summ_data(fmt='csv', df_vaccine=None):
+    summary_data = pd.read_csv(WORLDOMETER_SUMMARY)
+    if df_vaccine is None:
+        df_vaccine = read_table(table_path(VACCINE_TABLE))
+    return write_table(build_summ_data(summary_data, df_vaccine), SUMMARY_TABLE, fmt)
+
+def build_summ_data(summary_data, df_vaccine):
+    """
+    Function that joins the worldometer summary with the latest vaccination figures of each country
+    arg: worldometer summary dataframe, vaccination dataframe (left unmodified)
+    return: summary dataframe
+    """
+    df_vaccine = df_vaccine.assign(country=df_vaccine.country.astype(str).replace({
     "Antigua and Barbuda": "Antigua And Barbuda",
     "Bosnia and Herzegovina": "Bosnia And Herzegovina",
     "Brunei": "Brunei Darussalam",
@@ -48,28 +88,36 @@ def get_summ_data():
     "United Kingdom": "UK",
     "United States": "USA",
     "Vietnam": "Viet Nam",
-    "Wallis and Futuna": "Wallis And Futuna Islands"})
+    "Wallis and Futuna": "Wallis And Futuna Islands"}))
 
-    df_vaccine = df_vaccine[df_vaccine.country.apply(lambda x: x not in ['Bonaire Sint Eustatius and Saba','England','Eswatini','Guernsey','Hong Kong','Jersey','Kosovo','Macao',
+    df_vaccine = df_vaccine[~df_vaccine.country.isin(['Bonaire Sint Eustatius and Saba','England','Eswatini','Guernsey','Hong Kong','Jersey','Kosovo','Macao',
 'Nauru','Palestine','Pitcairn','Scotland','Tonga','Turkmenistan','Tuvalu', 'Wales'])]
 
     summary = summary_data.set_index("country")
     vaccines = df_vaccine[['country', 'vaccines']].drop_duplicates().set_index('country')
     summary = summary.join(vaccines)
-    for cols in df_vaccine.columns[4:-4]:
-        summary = summary.join(aggregate(df_vaccine,cols))
+    summary = summary.join(aggregate(df_vaccine, list(df_vaccine.select_dtypes('number').columns)))
     summary['vaccinated_percent'] = summary.total_vaccinations / summary.population * 100
     summary['tested_positive'] = summary.total_confirmed / summary.total_tests * 100
-    summary.to_csv('data/summary_df.csv')
+    return summary.reset_index()
+
+def get_daily_data(fmt='csv', df_vaccine=None):
+    df_daily = pd.read_csv(WORLDOMETER_DAILY, parse_dates=['date'])
+    if df_vaccine is None:
+        df_vaccine = read_table(table_path(VACCINE_TABLE))
+    return write_table(build_daily_data(df_daily, df_vaccine), DAILY_TABLE, fmt)
 
-def get_daily_data():
-    df_daily = pd.read_csv(r'C:\Users\Srijhak\Documents\Covid19-dash\data\worldometer_coronavirus_daily_data.csv')
-    df_vaccine = pd.read_csv(r'C:\Users\Srijhak\Documents\Covid19-dash\data\df_vaccine.csv')
+def build_daily_data(df_daily, df_vaccine):
+    """
+    Function that puts the worldwide daily cases next to the daily vaccinations
+    arg: worldometer daily dataframe, vaccination dataframe
+    return: dataframe with one row per date
+    """
     # use only common countries and dates 
     countries = df_vaccine.dropna(subset=['daily_vaccinations'])['country'].unique()
     dates = df_vaccine.dropna(subset=['daily_vaccinations'])['date'].unique()
-    country_mask = df_daily.country.apply(lambda x: x in countries)
-    date_mask = df_daily.date.apply(lambda x: x in dates)
+    country_mask = df_daily.country.isin(countries)
+    date_mask = df_daily.date.isin(dates)
 
     # generate the visualization data 
     columns_to_sum = ['daily_new_cases', 'cumulative_total_cases', 'cumulative_total_deaths', 'active_cases']
@@ -81,9 +129,16 @@ def get_daily_data():
 
     # bring back the vaccine data we prepared in the previous section 
     cumulative_vaccines = pd.DataFrame(df_vaccine.groupby('date')['total_vaccinations'].sum())
-    data = data.join(cumulative_vaccines).reset_index()
-    data.to_csv('data/df_daily.csv')
+    return data.join(cumulative_vaccines).reset_index()
+
 
-get_vacc_data()
-get_daily_data()
-get_summ_data()
\ No newline at end of file
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Refresh the OWID vaccination datasets')
+    parser.add_argument('--format', choices=list(FORMATS), default='csv')
+    parser.add_argument('--source', default=OWID_SOURCE, help='base url of vaccinations.csv and locations.csv')
+    args = parser.parse_args()
+    require_unversioned('fetch_vacc_data')
+    get_vacc_data(fmt=args.format, source=args.source)
+    get_daily_data(fmt=args.format)
+    get_summ_data(fmt=args.format)
+    warm()
@@ -0,0 +1,146 @@
+import functools
+import hashlib
+import importlib
+import logging
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+import plotly.io as pio
+
+from pages.utils import metrics
+
+FIGURE_DIR = 'data/figures'
+MAX_ENTRIES = 128
+MAX_BYTES = 64 * 2**20
+
+logger = logging.getLogger(__name__)
+
+
+class FigureCache:
+    """
+    LRU cache of serialized figure JSON, bounded by entry count and total size.
+    Entries written at refresh time are also stored under directory, so every
+    server process can pick them up on a memory miss.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES, directory=FIGURE_DIR):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        version, chart_id, args = key
+        digest = hashlib.sha1(repr(args).encode()).hexdigest()[:12]
+        return os.path.join(self.directory, version, f'{chart_id}-{digest}.json')
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                metrics.cache('figure', 'hit')
+                return self._entries[key]
+        path = self._path(key)
+        if not os.path.exists(path):
+            metrics.cache('figure', 'miss')
+            return None
+        metrics.cache('figure', 'disk')
+        with open(path) as f:
+            fig_json = f.read()
+        self.put(key, fig_json)
+        return fig_json
+
+    def put(self, key, fig_json, persist=False):
+        with self._lock:
+            if key in self._entries:
+                self._size -= len(self._entries.pop(key))
+            self._entries[key] = fig_json
+            self._size += len(fig_json)
+            while self._entries and (len(self._entries) > self.max_entries or self._size > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+        if persist:
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + '.tmp', 'w') as f:
+                f.write(fig_json)
+            os.replace(path + '.tmp', path)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def retain(self, versions):
+        """
+        Drops the figures rendered for data versions other than the given tokens
+        """
+        with self._lock:
+            for key in [key for key in self._entries if key[0] not in versions]:
+                self._size -= len(self._entries.pop(key))
+
+
+figures = FigureCache()
+
+# chart id -> (cached builder, version callable, argument tuples to pre-render at refresh time)
+_registry = {}
+
+
+def cached_figure(chart_id, version, warm=((),)):
+    """
+    Decorator that caches a figure builder's JSON per (dataset version, chart id, arguments).
+    The builder must load its own data and take only hashable arguments, so a cache hit
+    costs one dictionary lookup plus deserialization.
+    arg: chart id, callable returning the version token of the data the chart depends on,
+         argument tuples warm() should pre-render (None for charts that are only cached lazily)
+    """
+    def decorator(builder):
+        @functools.wraps(builder)
+        def wrapper(*args, persist=False):
+            key = (version()[:16], chart_id, args)
+            fig_json = figures.get(key)
+            if fig_json is None or persist:
+                with metrics.timed('figure_build', chart=chart_id):
+                    fig_json = builder(*args).to_json()
+                logger.info("%s: %.1f kB payload", chart_id, len(fig_json) / 1024)
+                figures.put(key, fig_json, persist=persist)
+            metrics.payload(chart_id, len(fig_json))
+            return pio.from_json(fig_json)
+
+        _registry[chart_id] = (wrapper, version, warm)
+        return wrapper
+    return decorator
+
+
+def warm(modules=('pages.world', 'pages.vaccinate')):
+    """
+    Function that pre-renders every registered figure of the given page modules for the
+    current dataset versions and removes figures rendered for older versions
+    arg: page modules declaring cached figures
+    return: number of figures rendered
+    """
+    for module in modules:
+        importlib.import_module(module)
+
+    rendered = 0
+    current = set()
+    for chart_id, (wrapper, version, warm_args) in _registry.items():
+        try:
+            current.add(version()[:16])
+        except FileNotFoundError:
+            logger.info("Skipping %s, its data has not been fetched", chart_id)
+            continue
+        for args in warm_args or ():
+            wrapper(*args, persist=True)
+            rendered += 1
+
+    if os.path.isdir(figures.directory):
+        for name in os.listdir(figures.directory):
+            if name not in current:
+                shutil.rmtree(os.path.join(figures.directory, name), ignore_errors=True)
+    logger.info("Rendered %d figures into %s", rendered, figures.directory)
+    return rendered
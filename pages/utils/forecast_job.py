@@ -0,0 +1,164 @@
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from pages.utils import data_store, forecasting
+from pages.utils.forecasters import ENGINES
+
+FEATURES = ['Confirmed', 'Deaths', 'Recovered', 'Active']
+
+logger = logging.getLogger(__name__)
+
+
+def forecast_version():
+    """
+    Function that returns the version token forecasts are stored under. The global and
+    per-country series both come from the same refresh, so one token covers both.
+    """
+    return data_store.aggregate_version('by_country_date')
+
+
+def build_tasks(version, features=FEATURES, limit=None, engines=tuple(ENGINES)):
+    """
+    Function that lists the series to fit: the world and every country, for every feature
+    and engine
+    arg: version token, features to forecast, optional number of countries to keep
+         (largest by latest Confirmed first), engine names
+    return: list of (version, scope, feature, engine, dataframe) tuples
+    """
+    series = {'Global': data_store.get_aggregate('by_date')}
+    by_country = data_store.get_aggregate('by_country_date')
+    countries = set(data_store.top_n('latest_by_country', 'Confirmed', n=limit or len(by_country))['Country/Region'])
+    for country, data in by_country.groupby('Country/Region', observed=True, sort=False):
+        if country in countries:
+            series[country] = data.drop(columns='Country/Region').reset_index(drop=True)
+    return [(version[:16], scope, feature, engine, data[['Date', feature]])
+            for scope, data in series.items() for feature in features for engine in engines]
+
+
+def fit_task(task):
+    """
+    Function that fits and stores one forecast; runs in a worker process
+    arg: (version, scope, feature, engine, dataframe) tuple
+    return: {'scope', 'feature', 'engine', 'rmse', 'seconds'} dict, or None when the fit failed
+    """
+    version, scope, feature, engine, data = task
+    start = time.perf_counter()
+    try:
+        result = forecasting.fit_forecast(data, feature, engine=engine)
+    except Exception:
+        logger.exception("Could not fit %s %s with the %s engine", scope, feature, engine)
+        return None
+    forecasting.save_forecast((version, scope, feature, engine), result)
+    return {'scope': scope, 'feature': feature, 'engine': engine, 'rmse': result['rmse'],
+            'seconds': time.perf_counter() - start}
+
+
+def backtest_task(task):
+    """
+    Function that backtests and stores one country series; runs in a worker process
+    arg: (version, scope, feature, engine names, dataframe) tuple
+    return: True, or None when the backtest failed (e.g. too few days)
+    """
+    version, scope, feature, engines, data = task
+    try:
+        forecasting.get_backtest(data, feature, version, scope, engines, workers=1)
+    except Exception:
+        logger.exception("Could not backtest %s %s", scope, feature)
+        return None
+    return True
+
+
+def backtest_tasks(tasks, engines):
+    """
+    Function that lists the country series to backtest, one per country and feature
+    arg: list of fit tasks (see build_tasks), engine names to backtest
+    return: list of (version, scope, feature, engine names, dataframe) tuples
+    """
+    series = {(version, scope, feature): data for version, scope, feature, _, data in tasks if scope != 'Global'}
+    return [(version, scope, feature, tuple(engines), data) for (version, scope, feature), data in series.items()]
+
+
+def run(tasks, workers, function=fit_task):
+    """
+    Function that runs every task in a pool of worker processes
+    arg: list of tasks (see build_tasks), number of worker processes, task function
+    return: list of the results of the successful tasks, index rows for fit_task
+    """
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return [row for row in pool.map(function, tasks) if row is not None]
+
+
+def scaling(tasks, max_workers):
+    """
+    Function that times the same batch with 1..max_workers processes
+    arg: list of tasks, largest number of worker processes to try
+    return: list of {'workers', 'seconds', 'speedup', 'efficiency'} dicts
+    """
+    report = []
+    for workers in range(1, max_workers + 1):
+        start = time.perf_counter()
+        run(tasks, workers)
+        seconds = time.perf_counter() - start
+        speedup = report[0]['seconds'] / seconds if report else 1.0
+        report.append({'workers': workers, 'seconds': seconds,
+                       'speedup': speedup, 'efficiency': speedup / workers})
+        logger.info("%2d workers %8.1fs  speedup %.2fx  efficiency %3.0f%%",
+                    workers, seconds, speedup, 100 * speedup / workers)
+    return report
+
+
+def main(workers=None, features=FEATURES, limit=None, engines=tuple(ENGINES), backtest_expensive=False):
+    """
+    Function that precomputes the forecasts of the current data, indexes them and
+    backtests the global series with every engine and the country series with the
+    engines that are not expensive
+    arg: number of worker processes (defaults to the number of cores), features,
+         optional number of countries to keep, engine names, whether the country
+         backtests also refit the expensive engines
+    return: list of index rows
+    """
+    version = forecast_version()
+    tasks = build_tasks(version, features, limit, engines)
+    workers = workers or os.cpu_count()
+    logger.info("Fitting %d forecasts with %d workers", len(tasks), workers)
+    start = time.perf_counter()
+    rows = run(tasks, workers)
+    forecasting.save_index(version, rows)
+    world = data_store.get_aggregate('by_date')
+    for feature in features:
+        forecasting.get_backtest(world, feature, version, workers=workers)
+    country_engines = [engine for engine in engines if backtest_expensive or not ENGINES[engine].expensive]
+    if country_engines:
+        backtests = backtest_tasks(tasks, country_engines)
+        logger.info("Backtesting %d country series with %s", len(backtests), ', '.join(country_engines))
+        run(backtests, workers, backtest_task)
+    forecasting.prune_versions(version)
+    logger.info("Stored %d of %d forecasts in %.1fs", len(rows), len(tasks), time.perf_counter() - start)
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Precompute the forecasts shown on the forecast page.')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--features', nargs='+', default=FEATURES, choices=FEATURES)
+    parser.add_argument('--engines', nargs='+', default=list(ENGINES), choices=list(ENGINES))
+    parser.add_argument('--limit', type=int, default=None,
+                        help='only fit the N countries with the most confirmed cases')
+    parser.add_argument('--backtest-expensive', action='store_true',
+                        help='also backtest the expensive engines on every country, not only on the world')
+    parser.add_argument('--scaling', action='store_true',
+                        help='time the batch with 1..--workers processes instead of indexing it')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    for noisy in ('cmdstanpy', 'fbprophet'):
+        logging.getLogger(noisy).setLevel(logging.WARNING)
+    # run through the imported module so worker processes can unpickle fit_task
+    from pages.utils import forecast_job
+    if args.scaling:
+        forecast_job.scaling(forecast_job.build_tasks(forecast_version(), args.features, args.limit, args.engines),
+                             args.workers or os.cpu_count())
+    else:
+        forecast_job.main(args.workers, args.features, args.limit, args.engines, args.backtest_expensive)
@@ -0,0 +1,206 @@
+import abc
+import importlib.util
+import json
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objs as go
+from plotly.subplots import make_subplots
+
+SEASON = 7
+Z = 1.96
+
+
+class Forecaster(abc.ABC):
+    """
+    Interface of the forecasting engines. fit() takes a daily series as a dataframe with
+    ds and y columns; predict() returns a dataframe covering the history and the next
+    periods days with at least the ds, yhat, yhat_lower and yhat_upper columns Prophet uses.
+    Engines whose fits take long enough to be worth a worker process set expensive.
+    """
+    name = None
+    expensive = False
+
+    @abc.abstractmethod
+    def fit(self, data):
+        """ Fits the engine on a dataframe with ds and y columns and returns it """
+
+    @abc.abstractmethod
+    def predict(self, periods):
+        """ Returns the fitted history and the next periods days """
+
+    @abc.abstractmethod
+    def plot(self, forecast):
+        """ Returns a figure of a predict() result with the observed series """
+
+    @abc.abstractmethod
+    def plot_components(self, forecast):
+        """ Returns a figure of the trend and seasonal components of a predict() result """
+
+    @abc.abstractmethod
+    def to_json(self):
+        """ Returns the fitted engine as a JSON string """
+
+    @classmethod
+    @abc.abstractmethod
+    def from_json(cls, text):
+        """ Returns the engine stored by to_json() """
+
+
+class ProphetForecaster(Forecaster):
+    """
+    The accurate engine: Prophet with its default settings. fbprophet is only imported
+    when a model is fitted or loaded.
+    """
+    name = 'accurate'
+    expensive = True
+
+    def __init__(self, model=None):
+        self.model = model
+
+    def fit(self, data):
+        from fbprophet import Prophet
+        self.model = Prophet()
+        self.model.fit(data)
+        return self
+
+    def predict(self, periods):
+        return self.model.predict(self.model.make_future_dataframe(periods=periods))
+
+    def plot(self, forecast):
+        return self.model.plot(forecast)
+
+    def plot_components(self, forecast):
+        return self.model.plot_components(forecast)
+
+    def to_json(self):
+        from fbprophet.serialize import model_to_json
+        return model_to_json(self.model)
+
+    @classmethod
+    def from_json(cls, text):
+        from fbprophet.serialize import model_from_json
+        return cls(model_from_json(text))
+
+
+def _smooth(y, alpha, beta, gamma, phi):
+    """
+    Function that runs additive Holt-Winters with a damped trend over a series
+    arg: series, level, trend and season smoothing factors, trend damping
+    return: dict with the final state, the one-step-ahead fit and its squared error
+    """
+    n = len(y)
+    level = y[0]
+    trend = (y[min(2 * SEASON, n - 1)] - y[0]) / max(min(2 * SEASON, n - 1), 1)
+    season = np.zeros(SEASON)
+    fitted_trend = np.empty(n)
+    fitted_season = np.empty(n)
+    for t in range(n):
+        s = season[t % SEASON]
+        fitted_trend[t] = level + phi * trend
+        fitted_season[t] = s
+        new_level = alpha * (y[t] - s) + (1 - alpha) * (level + phi * trend)
+        trend = beta * (new_level - level) + (1 - beta) * phi * trend
+        season[t % SEASON] = gamma * (y[t] - new_level) + (1 - gamma) * s
+        level = new_level
+    errors = y - fitted_trend - fitted_season
+    return {'level': level, 'trend': trend, 'season': season, 'fitted_trend': fitted_trend,
+            'fitted_season': fitted_season, 'sse': float(errors @ errors),
+            'sigma': float(errors.std()) if n > 1 else 0.0}
+
+
+class FastForecaster(Forecaster):
+    """
+    The fast engine, NumPy only: damped-trend Holt-Winters with weekly seasonality on
+    log1p of the series, i.e. a locally log-linear trend. The smoothing factors are picked
+    from a small grid by one-step-ahead error. Components are multiplicative on the
+    original scale; series with negative values are smoothed as they are.
+    """
+    name = 'fast'
+    ALPHAS = (0.2, 0.5, 0.8)
+    BETAS = (0.05, 0.2)
+    GAMMA = 0.1
+    PHI = 0.98
+
+    def __init__(self, params=None):
+        self.params = params
+
+    def fit(self, data):
+        y = data['y'].to_numpy(dtype=float)
+        log = bool((y >= 0).all())
+        if log:
+            y = np.log1p(y)
+        best = min((_smooth(y, alpha, beta, self.GAMMA, self.PHI)
+                    for alpha in self.ALPHAS for beta in self.BETAS), key=lambda state: state['sse'])
+        self.params = {
+            'start': str(pd.to_datetime(data['ds']).iloc[0].date()),
+            'log': log,
+            'y': data['y'].tolist(),
+            'level': best['level'], 'trend': best['trend'], 'sigma': best['sigma'],
+            'season': best['season'].tolist(),
+            'fitted_trend': best['fitted_trend'].tolist(),
+            'fitted_season': best['fitted_season'].tolist(),
+        }
+        return self
+
+    def predict(self, periods):
+        p = self.params
+        n = len(p['y'])
+        h = np.arange(1, periods + 1)
+        trend = np.concatenate([p['fitted_trend'],
+                                p['level'] + np.cumsum(self.PHI ** h) * p['trend']])
+        weekly = np.concatenate([p['fitted_season'], np.asarray(p['season'])[(n + h - 1) % SEASON]])
+        spread = Z * p['sigma'] * np.concatenate([np.ones(n), np.sqrt(h)])
+        mean = trend + weekly
+        if not p['log']:
+            return pd.DataFrame({
+                'ds': pd.date_range(p['start'], periods=n + periods, freq='D'),
+                'trend': trend, 'weekly': weekly, 'yhat': mean,
+                'yhat_lower': mean - spread, 'yhat_upper': mean + spread,
+            })
+        return pd.DataFrame({
+            'ds': pd.date_range(p['start'], periods=n + periods, freq='D'),
+            'trend': np.expm1(trend),
+            'weekly': np.expm1(weekly),
+            'yhat': np.expm1(mean),
+            'yhat_lower': np.expm1(mean - spread),
+            'yhat_upper': np.expm1(mean + spread),
+        })
+
+    def plot(self, forecast):
+        history = forecast['ds'].iloc[:len(self.params['y'])]
+        fig = go.Figure([
+            go.Scatter(x=forecast['ds'], y=forecast['yhat_upper'], mode='lines', line_width=0,
+                       showlegend=False, hoverinfo='skip'),
+            go.Scatter(x=forecast['ds'], y=forecast['yhat_lower'], mode='lines', line_width=0,
+                       fill='tonexty', fillcolor='rgba(0,114,178,0.2)', name='interval'),
+            go.Scatter(x=forecast['ds'], y=forecast['yhat'], mode='lines', line_color='#0072B2', name='forecast'),
+            go.Scatter(x=history, y=self.params['y'], mode='markers', marker=dict(color='black', size=3),
+                       name='observed'),
+        ])
+        fig.update_layout(xaxis_title='ds', yaxis_title='y')
+        return fig
+
+    def plot_components(self, forecast):
+        fig = make_subplots(rows=2, cols=1,
+                            subplot_titles=['trend', 'weekly (relative)' if self.params['log'] else 'weekly'])
+        fig.add_trace(go.Scatter(x=forecast['ds'], y=forecast['trend'], line_color='#0072B2'), row=1, col=1)
+        week = forecast.tail(SEASON)
+        fig.add_trace(go.Scatter(x=week['ds'].dt.day_name(), y=week['weekly'], line_color='#0072B2'), row=2, col=1)
+        if self.params['log']:
+            fig.update_yaxes(tickformat='%', row=2, col=1)
+        fig.update_layout(showlegend=False)
+        return fig
+
+    def to_json(self):
+        return json.dumps(self.params)
+
+    @classmethod
+    def from_json(cls, text):
+        return cls(json.loads(text))
+
+
+# engines whose package is installed; Prophet is optional
+ENGINES = {engine.name: engine for engine in (FastForecaster, ProphetForecaster)
+           if engine is not ProphetForecaster or importlib.util.find_spec('fbprophet') is not None}
+DEFAULT_ENGINE = FastForecaster.name
@@ -0,0 +1,306 @@
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from pages.utils import metrics
+from pages.utils.forecasters import DEFAULT_ENGINE, ENGINES
+
+FORECAST_DIR = 'data/forecasts'
+PERIODS = 365
+HORIZONS = (7, 14, 30)
+ORIGINS = 6
+ORIGIN_STEP = 7
+MIN_TRAIN = 28
+MAX_CACHED = 64
+
+logger = logging.getLogger(__name__)
+
+_cache = OrderedDict()
+_locks = {}
+_locks_guard = threading.Lock()
+_MISSING = object()
+
+
+def _series(data, feature):
+    data = data[['Date', feature]].copy()
+    data.columns = ['ds','y']
+    data['ds'] = pd.to_datetime(data['ds'])
+    return data.reset_index(drop=True)
+
+
+def fit_forecast(data, feature, periods=PERIODS, engine=DEFAULT_ENGINE):
+    """
+    Function that fits an engine once on a daily series and forecasts it
+    arg: dataframe with Date and feature columns, feature, days to forecast,
+         engine name (one of forecasters.ENGINES)
+    return: dict with the fitted 'model', the 'forecast' dataframe, the in-sample 'rmse'
+            and the 'engine' name
+    """
+    data = _series(data, feature)
+    model = ENGINES[engine]().fit(data)
+    forecast = model.predict(periods)
+    errors = data['y'].to_numpy() - forecast['yhat'].head(data.shape[0]).to_numpy()
+    rmse = np.sqrt(np.mean(errors ** 2))
+    return {'model': model, 'forecast': forecast, 'rmse': rmse, 'engine': engine}
+
+
+def _backtest_origin(task):
+    """
+    Function that fits an engine on the series up to one origin and forecasts past it
+    arg: (engine, training dataframe, days to forecast) tuple
+    return: (forecast values, fit seconds)
+    """
+    engine, train, horizon = task
+    start = time.perf_counter()
+    predicted = ENGINES[engine]().fit(train).predict(horizon)['yhat'].tail(horizon).to_numpy()
+    return predicted, time.perf_counter() - start
+
+
+def backtest(data, feature, engines=tuple(ENGINES), horizons=HORIZONS, origins=ORIGINS,
+             step=ORIGIN_STEP, workers=None):
+    """
+    Function that scores the engines with a rolling-origin backtest: each engine is fitted
+    on the series up to each of origins cut-offs, step days apart, and forecasts the
+    following max(horizons) days. Every engine sees the same cut-offs. Fits of expensive
+    engines run in a pool of worker processes; engines that fail to import are skipped.
+    arg: dataframe with Date and feature columns, feature, engine names, horizons in days,
+         number of origins, days between origins, worker processes (default: all cores)
+    return: dataframe indexed by (engine, horizon) with rmse, mae and mape (%) over the first
+            horizon days after every origin, the number of origins and the mean fit seconds
+    """
+    series = _series(data, feature)
+    longest = max(horizons)
+    cutoffs = [c for c in range(len(series) - longest, 0, -step)[:origins] if c >= MIN_TRAIN]
+    if not cutoffs:
+        raise ValueError(f'{feature} has too few days to backtest {longest} days ahead')
+    # origins x days after the origin
+    actual = np.stack([series['y'].to_numpy(dtype=float)[c:c + longest] for c in cutoffs])
+    nonzero = actual != 0
+
+    rows = []
+    for engine in engines:
+        tasks = [(engine, series.iloc[:c], longest) for c in cutoffs]
+        try:
+            if ENGINES[engine].expensive and (workers or os.cpu_count()) > 1:
+                with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count(), len(tasks))) as pool:
+                    results = list(pool.map(_backtest_origin, tasks))
+            else:
+                results = [_backtest_origin(task) for task in tasks]
+        except ImportError:
+            # e.g. fbprophet is present but one of its own dependencies is not
+            logger.warning("Skipping the %s engine in the %s backtest, it could not be imported", engine, feature)
+            continue
+        errors = actual - np.stack([predicted for predicted, _ in results])
+        seconds = np.mean([seconds for _, seconds in results])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            relative = np.where(nonzero, np.abs(errors) / np.abs(actual), np.nan)
+        for horizon in horizons:
+            window = errors[:, :horizon]
+            rows.append({'engine': engine, 'horizon': horizon,
+                         'rmse': np.sqrt(np.mean(window ** 2)),
+                         'mae': np.mean(np.abs(window)),
+                         'mape': 100 * np.nanmean(relative[:, :horizon]) if nonzero[:, :horizon].any() else np.nan,
+                         'origins': len(cutoffs), 'fit_seconds': seconds})
+    return pd.DataFrame(rows).set_index(['engine', 'horizon'])
+
+
+def _paths(key):
+    version, scope, feature, engine = key
+    base = os.path.join(FORECAST_DIR, version, f'{scope}__{feature}__{engine}')
+    return base + '.json', base + '.pkl'
+
+
+def save_forecast(key, result):
+    """
+    Function that persists a fitted model (as the engine's JSON) and its forecast and metrics
+    arg: (version, scope, feature, engine) key, result of fit_forecast
+    """
+    model_path, result_path = _paths(key)
+    os.makedirs(os.path.dirname(model_path), exist_ok=True)
+    with open(model_path + '.tmp', 'w') as f:
+        f.write(result['model'].to_json())
+    pd.to_pickle({k: v for k, v in result.items() if k != 'model'}, result_path + '.tmp')
+    os.replace(model_path + '.tmp', model_path)
+    os.replace(result_path + '.tmp', result_path)
+
+
+def load_forecast(key):
+    """
+    Function that loads a persisted forecast
+    arg: (version, scope, feature, engine) key
+    return: result dict as returned by fit_forecast, or None when nothing is stored or its
+            engine is not installed
+    """
+    model_path, result_path = _paths(key)
+    if not (os.path.exists(model_path) and os.path.exists(result_path)):
+        return None
+    result = pd.read_pickle(result_path)
+    if result['engine'] not in ENGINES:
+        logger.warning("Cannot load the %s forecast %s, its engine is not installed", result['engine'], model_path)
+        return None
+    with open(model_path) as f:
+        model = ENGINES[result['engine']].from_json(f.read())
+    return dict(result, model=model)
+
+
+def save_index(version, rows):
+    """
+    Function that records which forecasts a batch run stored for a version
+    arg: version token, list of {'scope', 'feature', 'engine', 'rmse', 'seconds'} dicts
+    """
+    path = os.path.join(FORECAST_DIR, version[:16], 'index.csv')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pd.DataFrame(rows, columns=['scope', 'feature', 'engine', 'rmse', 'seconds']).to_csv(path + '.tmp', index=False)
+    os.replace(path + '.tmp', path)
+
+
+def load_index(version):
+    """
+    Function that loads the index written by save_index
+    arg: version token
+    return: pandas dataframe, or None when no batch run stored forecasts for the version
+    """
+    path = os.path.join(FORECAST_DIR, version[:16], 'index.csv')
+    if not os.path.exists(path):
+        return None
+    return pd.read_csv(path, keep_default_na=False, na_values=[''])
+
+
+def prune_versions(version):
+    """
+    Function that removes the stored forecasts of every other version
+    arg: version token to keep
+    """
+    if os.path.isdir(FORECAST_DIR):
+        for name in os.listdir(FORECAST_DIR):
+            if name != version[:16]:
+                shutil.rmtree(os.path.join(FORECAST_DIR, name), ignore_errors=True)
+
+
+def _lookup(key):
+    """
+    Function that returns the cached result of a key, marking it as recently used
+    """
+    with _locks_guard:
+        result = _cache.get(key, _MISSING)
+        if result is not _MISSING:
+            _cache.move_to_end(key)
+    return result
+
+
+def _store(key, result):
+    """
+    Function that caches a result, dropping the results of other versions and the least
+    recently used ones beyond MAX_CACHED, together with their locks
+    """
+    with _locks_guard:
+        for stale in [k for k in _cache if k[0] != key[0]]:
+            del _cache[stale]
+        _cache[key] = result
+        evicted = set()
+        while len(_cache) > MAX_CACHED:
+            evicted.add(_cache.popitem(last=False)[0])
+        for stale in [k for k in _locks if k[0] != key[0] or k in evicted]:
+            del _locks[stale]
+
+
+def _cached(key, compute):
+    """
+    Function that returns the cached result of a key, computing it at most once
+    """
+    result = _lookup(key)
+    if result is not _MISSING:
+        metrics.cache('forecast', 'hit')
+        return result
+    with _locks_guard:
+        lock = _locks.setdefault(key, threading.Lock())
+    with lock:
+        result = _lookup(key)
+        if result is not _MISSING:
+            metrics.cache('forecast', 'hit')
+            return result
+        metrics.cache('forecast', 'miss')
+        with metrics.timed('forecast', engine=key[3]):
+            result = compute()
+        if result is not None:
+            _store(key, result)
+        return result
+
+
+def get_forecast(data, feature, version, scope='Global', engine=DEFAULT_ENGINE):
+    """
+    Function that returns the forecast of a feature, fitting at most once per dataset
+    version and engine across sessions, pages and restarts
+    arg: dataframe with Date and feature columns, feature, version token of the data,
+         scope of the series (e.g. 'Global'), engine name
+    return: dict with 'model', 'forecast', 'rmse' and 'engine'
+    """
+    key = (version[:16], scope, feature, engine)
+
+    def load_or_fit():
+        result = load_forecast(key)
+        if result is None:
+            logger.info("Fitting %s %s forecast with the %s engine", scope, feature, engine)
+            result = fit_forecast(data, feature, engine=engine)
+            save_forecast(key, result)
+        return result
+
+    return _cached(key, load_or_fit)
+
+
+def get_stored_forecast(version, scope, feature, engine=DEFAULT_ENGINE):
+    """
+    Function that returns a forecast precomputed by the batch job, never fitting
+    arg: version token of the data, scope (e.g. a country), feature, engine name
+    return: dict with 'model', 'forecast', 'rmse' and 'engine', or None when it was not precomputed
+    """
+    key = (version[:16], scope, feature, engine)
+    return _cached(key, lambda: load_forecast(key))
+
+
+def _backtest_path(key):
+    version, scope, feature, _ = key
+    return os.path.join(FORECAST_DIR, version, f'{scope}__{feature}__backtest.pkl')
+
+
+def get_backtest(data, feature, version, scope='Global', engines=tuple(ENGINES), workers=None):
+    """
+    Function that returns the backtest of a series, computed once per dataset version.
+    Backtesting refits every engine several times, so this is for the batch job; pages
+    read the result with get_stored_backtest.
+    arg: dataframe with Date and feature columns, feature, version token of the data, scope,
+         engine names, worker processes (see backtest)
+    return: dataframe indexed by (engine, horizon) (see backtest)
+    """
+    key = (version[:16], scope, feature, 'backtest')
+    path = _backtest_path(key)
+
+    def load_or_score():
+        if os.path.exists(path):
+            return pd.read_pickle(path)
+        logger.info("Backtesting %s %s forecasts", scope, feature)
+        scores = backtest(data, feature, engines, workers=workers)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        scores.to_pickle(path + '.tmp')
+        os.replace(path + '.tmp', path)
+        return scores
+
+    return _cached(key, load_or_score)
+
+
+def get_stored_backtest(version, feature, scope='Global'):
+    """
+    Function that returns a backtest precomputed by the batch job, never computing it
+    arg: version token of the data, feature, scope
+    return: dataframe indexed by (engine, horizon), or None when it was not precomputed
+    """
+    key = (version[:16], scope, feature, 'backtest')
+    path = _backtest_path(key)
+    return _cached(key, lambda: pd.read_pickle(path) if os.path.exists(path) else None)
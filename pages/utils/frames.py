@@ -0,0 +1,62 @@
+import logging
+import time
+
+import pandas as pd
+
+# animation frame budgets offered on the map views: label -> decimate_frames arguments
+FRAME_BUDGETS = {
+    'Weekly': {'freq': 'W'},
+    'Monthly': {'freq': 'M'},
+    '30 frames': {'max_frames': 30},
+    'Daily': {},
+}
+DEFAULT_BUDGET = 'Weekly'
+
+logger = logging.getLogger(__name__)
+
+
+def decimate_frames(df, date_col, key_cols, value_cols, freq=None, max_frames=None):
+    """
+    Function that prepares the data of an animated map with a bounded number of frames.
+    Rows are summed to one per key per date (collapsing provinces), then only the last
+    date of every freq period, or max_frames evenly spaced dates, are kept. Frames
+    identical to the previous kept frame are dropped. Empty input gives an empty result.
+    arg: dataframe, date column, key columns (e.g. country and iso code), value columns,
+         pandas period alias (e.g. 'W', 'M'), maximum number of frames
+    return: dataframe sorted by date with one row per key per kept frame, dates rendered
+            as YYYY-MM-DD strings for the animation slider labels
+    """
+    data = (df.groupby(key_cols + [date_col], observed=True, dropna=False)[value_cols]
+              .sum().reset_index())
+    if data.empty:
+        return data.assign(**{date_col: pd.Series(dtype=object)})
+    dates = pd.Series(pd.to_datetime(data[date_col].unique())).sort_values()
+    if freq is not None:
+        dates = dates.groupby(dates.dt.to_period(freq)).max()
+    if max_frames is not None and len(dates) > max_frames:
+        if max_frames < 2:
+            raise ValueError(f"max_frames must be at least 2, got {max_frames}")
+        step = (len(dates) - 1) / (max_frames - 1)
+        dates = dates.iloc[sorted({round(i * step) for i in range(max_frames)})]
+    data = data[pd.to_datetime(data[date_col]).isin(dates)]
+
+    # one column per frame, so consecutive frames can be compared in one pass
+    changed = None
+    for col in value_cols:
+        wide = data.pivot_table(index=key_cols, columns=date_col, values=col, observed=True).fillna(0)
+        col_changed = wide.ne(wide.shift(axis=1)).any()
+        changed = col_changed if changed is None else changed | col_changed
+    changed.iloc[0] = True
+    data = data[data[date_col].isin(changed.index[changed])].sort_values(date_col, kind='mergesort')
+    return data.assign(**{date_col: pd.to_datetime(data[date_col]).dt.strftime('%Y-%m-%d')}).reset_index(drop=True)
+
+
+def log_figure(chart_id, fig, start):
+    """
+    Function that logs the build time and frame count of a figure. Its payload size is
+    logged by figure_cache.cached_figure, which serializes it anyway.
+    arg: chart id, plotly figure, perf_counter value taken before the build
+    return: the figure
+    """
+    logger.info("%s: built in %.2fs, %d frames", chart_id, time.perf_counter() - start, len(fig.frames))
+    return fig
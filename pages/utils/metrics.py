@@ -0,0 +1,285 @@
+"""
+Lightweight instrumentation of the dashboard: timings of the page runs, data loads,
+aggregations, figure builds and chart emits, figure payload sizes and cache hits and
+misses. Everything is kept in process-wide Prometheus-style counters, histograms and
+gauges, and the events of the current script run are also traced for the debug panel.
+
+Set COVID_METRICS_FILE to a path to have the metrics written there in the Prometheus
+text format (e.g. for the node_exporter textfile collector), or COVID_METRICS_PORT to
+serve them on http://<host>:<port>/metrics.
+"""
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFIX = 'covid_'
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FILE_ENV = 'COVID_METRICS_FILE'
+PORT_ENV = 'COVID_METRICS_PORT'
+DEBUG_ENV = 'COVID_DEBUG_PANEL'
+# the metrics file is rewritten at most this often, in seconds
+FILE_INTERVAL = 10
+
+HELP = {
+    'request_seconds': 'Script run of a page, from the first to the last widget',
+    'load_seconds': 'Read and conversion of a stored table',
+    'aggregate_seconds': 'Computation of a derived table, ranking or country index',
+    'figure_build_seconds': 'Build and serialization of a figure on a cache miss',
+    'cached_call_seconds': 'Call of a versioned_cache function (e.g. a countrywise chart) on a cache miss',
+    'forecast_seconds': 'Load, fit or backtest of a forecast on a cache miss',
+    'chart_emit_seconds': 'st.plotly_chart, st.altair_chart or forecast figure st.write call',
+    'figure_payload_bytes': 'Size of the serialized figure, as of its last build or emit',
+    'cache_requests_total': 'Cache lookups by cache and result',
+}
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_gauges = {}
+_local = threading.local()
+_exported = [0.0]
+_server = []
+
+
+def _key(name, labels):
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _trace(event, labels, seconds=None, size=None):
+    trace = getattr(_local, 'trace', None)
+    if trace is not None:
+        trace.append({'event': event, 'labels': ', '.join(f'{k}={v}' for k, v in labels.items()),
+                      'ms': None if seconds is None else seconds * 1000,
+                      'kb': None if size is None else size / 1024})
+
+
+def count(name, value=1, **labels):
+    """
+    Function that increments a counter
+    """
+    with _lock:
+        key = _key(name, labels)
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def gauge(name, value, **labels):
+    """
+    Function that sets a gauge
+    """
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def observe(name, seconds, **labels):
+    """
+    Function that adds a duration to a histogram
+    """
+    with _lock:
+        histogram = _histograms.setdefault(_key(name, labels), {'buckets': [0] * len(BUCKETS), 'count': 0, 'sum': 0.0})
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram['buckets'][i] += 1
+        histogram['count'] += 1
+        histogram['sum'] += seconds
+
+
+@contextmanager
+def timed(event, **labels):
+    """
+    Context manager that records the duration of a block in the <event>_seconds
+    histogram and in the trace of the current script run
+    arg: event name (e.g. 'load'), labels (e.g. dataset='covid')
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        observe(f'{event}_seconds', seconds, **labels)
+        _trace(event, labels, seconds=seconds)
+
+
+def cache(name, result):
+    """
+    Function that counts a cache lookup
+    arg: cache name, 'hit', 'miss' or another outcome (e.g. 'disk')
+    """
+    count('cache_requests_total', cache=name, result=result)
+    caches = getattr(_local, 'caches', None)
+    if caches is not None:
+        caches[(name, result)] += 1
+
+
+def payload(chart, size):
+    """
+    Function that records the serialized size of a figure
+    arg: chart id, size in bytes
+    """
+    gauge('figure_payload_bytes', size, chart=chart)
+    _trace('payload', {'chart': chart}, size=size)
+
+
+@contextmanager
+def request(page, measure_payload=False):
+    """
+    Context manager around a script run of a page: it is timed, and the events recorded
+    inside it are kept for last_request()
+    arg: page name, whether to measure the payload of every emitted chart (see instrument_charts)
+    """
+    _local.trace, _local.caches, _local.page, _local.charts = [], Counter(), page, 0
+    _local.measure_payload = measure_payload
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        observe('request_seconds', seconds, page=page)
+        _local.last = {'page': page, 'seconds': seconds, 'events': _local.trace, 'caches': dict(_local.caches)}
+        _local.trace = _local.caches = _local.page = None
+        _local.measure_payload = False
+        export()
+
+
+def last_request():
+    """
+    Function that returns the events of the calling thread's last script run
+    return: dict with 'page', 'seconds', 'events' and 'caches', or None
+    """
+    return getattr(_local, 'last', None)
+
+
+def chart_id():
+    """
+    Function that names the next chart emitted by the current script run, e.g. 'world:2'
+    """
+    _local.charts = (getattr(_local, 'charts', None) or 0) + 1
+    return f"{getattr(_local, 'page', None) or '-'}:{_local.charts}"
+
+
+def debug_enabled(query_params=None):
+    """
+    Function that tells whether the debug panel is on: COVID_DEBUG_PANEL is set, or the
+    page was opened with ?debug=1
+    """
+    return bool(os.environ.get(DEBUG_ENV)) or (query_params or {}).get('debug') == ['1']
+
+
+def instrument_charts(st):
+    """
+    Function that wraps st.plotly_chart and st.altair_chart to time every chart emit;
+    calling it again is harmless. Measuring the payload serializes the figure once more,
+    so it is only done for script runs that ask for it (see request); figures from
+    figure_cache report theirs anyway.
+    arg: streamlit module
+    """
+    for attr, kind in (('plotly_chart', 'plotly'), ('altair_chart', 'altair')):
+        emit = getattr(st, attr)
+        emit = getattr(emit, 'uninstrumented', emit)
+
+        def wrapper(figure, *args, _emit=emit, _kind=kind, **kwargs):
+            chart = chart_id()
+            if getattr(_local, 'measure_payload', False):
+                payload(chart, len(figure.to_json()))
+            with timed('chart_emit', kind=_kind, chart=chart):
+                return _emit(figure, *args, **kwargs)
+
+        wrapper.uninstrumented = emit
+        setattr(st, attr, wrapper)
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, extra=()):
+    labels = tuple(labels) + tuple(extra)
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}' if labels else ''
+
+
+def prometheus_text():
+    """
+    Function that renders every metric in the Prometheus text exposition format
+    """
+    with _lock:
+        counters, gauges = dict(_counters), dict(_gauges)
+        histograms = {key: dict(value, buckets=list(value['buckets'])) for key, value in _histograms.items()}
+    lines = []
+    for kind, metrics in (('counter', counters), ('gauge', gauges), ('histogram', histograms)):
+        for name in sorted({name for name, _ in metrics}):
+            lines.append(f'# HELP {PREFIX}{name} {HELP.get(name, name)}')
+            lines.append(f'# TYPE {PREFIX}{name} {kind}')
+            for (metric, labels), value in sorted(metrics.items()):
+                if metric != name:
+                    continue
+                if kind != 'histogram':
+                    lines.append(f'{PREFIX}{name}{_labels(labels)} {value}')
+                    continue
+                for bound, cumulative in zip(BUCKETS, value['buckets']):
+                    lines.append(f'{PREFIX}{name}_bucket{_labels(labels, [("le", str(bound))])} {cumulative}')
+                lines.append(f'{PREFIX}{name}_bucket{_labels(labels, [("le", "+Inf")])} {value["count"]}')
+                lines.append(f'{PREFIX}{name}_sum{_labels(labels)} {value["sum"]:.6f}')
+                lines.append(f'{PREFIX}{name}_count{_labels(labels)} {value["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def export(path=None, force=False):
+    """
+    Function that atomically rewrites the metrics file, at most every FILE_INTERVAL
+    seconds unless forced
+    arg: path (defaults to COVID_METRICS_FILE; nothing is written when neither is set)
+    """
+    path = path or os.environ.get(FILE_ENV)
+    now = time.monotonic()
+    if not path or (not force and now - _exported[0] < FILE_INTERVAL):
+        return
+    _exported[0] = now
+    try:
+        with open(path + '.tmp', 'w') as f:
+            f.write(prometheus_text())
+        os.replace(path + '.tmp', path)
+    except OSError:
+        logger.exception("Could not write the metrics to %s", path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = prometheus_text().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port=None):
+    """
+    Function that starts the /metrics endpoint once per process, on port or
+    COVID_METRICS_PORT (nothing is started when neither is set)
+    return: the server, or None
+    """
+    port = port or int(os.environ.get(PORT_ENV, 0))
+    with _lock:
+        if port and not _server:
+            try:
+                server = ThreadingHTTPServer(('', port), _MetricsHandler)
+            except OSError:
+                # e.g. another server process of the app already serves this port
+                logger.warning("Could not serve the metrics on port %d", port)
+                _server.append(None)
+                return None
+            threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+            _server.append(server)
+        return _server[0] if _server else None
@@ -0,0 +1,33 @@
+import logging
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def track(stage, results=None):
+    """
+    Context manager that measures the wall time and peak Python heap growth of a stage.
+    The measurement is logged and, when a results list is given, appended to it.
+    arg: stage name, optional list collecting {'stage', 'seconds', 'peak_mb'} dicts
+    """
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+    base, _ = tracemalloc.get_traced_memory()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        if started_tracing:
+            tracemalloc.stop()
+        peak_mb = max(peak - base, 0) / 2**20
+        logger.info("%-20s %8.3fs  peak +%.1f MB", stage, seconds, peak_mb)
+        if results is not None:
+            results.append({'stage': stage, 'seconds': seconds, 'peak_mb': peak_mb})
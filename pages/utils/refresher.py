@@ -0,0 +1,226 @@
+"""
+Refreshes the data inside the running app. A background thread periodically builds the
+next dataset version in its own directory under data/versions/, validates it and makes
+it live by replacing data/CURRENT, so readers never see a half-written table. Pages
+pin one version per script run (see versions.snapshot), and the caches of versions no
+longer live are dropped after the swap while the others stay warm.
+
+    COVID_REFRESH_INTERVAL=21600 streamlit run app.py
+    python -m pages.utils.refresher --once --format parquet
+"""
+import argparse
+import logging
+import os
+import shutil
+import threading
+
+from pages.utils.versions import VERSIONS_DIR, activate, active_dir, new_version_dir, prune, seed, snapshot
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows, where refreshes are not coordinated across processes
+    fcntl = None
+
+INTERVAL_ENV = 'COVID_REFRESH_INTERVAL'
+FORMAT = 'parquet'
+LOCK = os.path.join(VERSIONS_DIR, '.lock')
+
+# dataset name -> columns a version must have for it to go live
+REQUIRED_COLUMNS = {
+    'covid': ['Country/Region', 'Date', 'Confirmed', 'Deaths', 'Recovered', 'Active'],
+    'agg_by_date': ['Date', 'Confirmed', 'Deaths', 'Recovered', 'Active'],
+    'agg_by_country_date': ['Country/Region', 'Date', 'Confirmed', 'Deaths', 'Recovered', 'Active'],
+    'agg_latest_by_country': ['Country/Region', 'Confirmed', 'Deaths', 'Recovered', 'Active'],
+    'agg_latest_by_country_province': ['Country/Region', 'Province/State', 'Confirmed'],
+    'vaccine': ['country', 'date', 'total_vaccinations', 'vaccines'],
+    'daily': ['date', 'daily_new_cases', 'daily_vaccinations'],
+    'summary': ['country', 'total_confirmed', 'total_vaccinations'],
+}
+# date column of the datasets that must not go back in time
+LATEST_DATE = {'covid': 'Date', 'vaccine': 'date'}
+
+logger = logging.getLogger(__name__)
+
+_refresher = None
+_refresher_lock = threading.Lock()
+
+
+def _table(directory, name):
+    from pages.utils.data_store import DATASETS
+    from pages.utils.storage import table_path
+    return table_path(os.path.join(directory, DATASETS[name]))
+
+
+def validate(directory, live):
+    """
+    Function that checks a new version before it goes live: every dataset is readable,
+    not empty and has its required columns, and its latest date is not older than the
+    live version's
+    arg: new version directory, live version directory
+    raise: ValueError describing the first problem found
+    """
+    from pages.utils.storage import read_table
+
+    for name, columns in REQUIRED_COLUMNS.items():
+        try:
+            data = read_table(_table(directory, name))
+        except FileNotFoundError:
+            raise ValueError(f"{name} is missing from {directory}")
+        missing = [col for col in columns if col not in data.columns]
+        if missing:
+            raise ValueError(f"{name} lacks the columns {missing}")
+        if data.empty:
+            raise ValueError(f"{name} is empty")
+        if name in LATEST_DATE:
+            try:
+                before = read_table(_table(live, name), columns=[LATEST_DATE[name]])[LATEST_DATE[name]].max()
+            except FileNotFoundError:
+                continue
+            after = data[LATEST_DATE[name]].max()
+            if after < before:
+                raise ValueError(f"{name} ends on {after:%Y-%m-%d}, before the live {before:%Y-%m-%d}")
+
+
+def swap(directory, live):
+    """
+    Function that makes a validated version live, drops the cached datasets, figures and
+    charts of the data versions it replaced, pre-renders its figures and prunes the
+    versions no reader can still be pinned to
+    arg: new version directory, version directory it replaces
+    """
+    from pages.utils import caching, data_store
+    from pages.utils.figure_cache import figures, warm
+
+    # loaded before the swap so the first readers of the new version find them cached
+    data_store.preload(directory, live)
+    activate(directory)
+    with snapshot(directory):
+        tokens = set()
+        for name in data_store.DATASETS:
+            try:
+                tokens.add(data_store.dataset_version(name)[:16])
+            except FileNotFoundError:
+                pass
+    data_store.retain(directory)
+    figures.retain(tokens)
+    caching.retain(tokens)
+    with snapshot(directory):
+        warm()
+    for stale in prune():
+        logger.info("Deleted data version %s", stale)
+
+
+def refresh_once(fmt=FORMAT, jhu_source=None, owid_source=None):
+    """
+    Function that builds, validates and swaps in the next dataset version. The new
+    version starts as links to the live tables, so the stages whose inputs did not change
+    are skipped and their tables carried over.
+    arg: output format, base urls of the JHU and OWID files (defaults to upstream)
+    return: directory of the new live version, or None when nothing changed
+    """
+    from pages.utils import update_data
+    from pages.utils.data_store import DATASETS
+    from pages.utils.fetch_data import MANIFEST
+    from pages.utils.storage import FORMATS
+
+    live = active_dir()
+    directory = new_version_dir()
+    try:
+        seed(live, directory, [base + ext for base in DATASETS.values() for ext in FORMATS.values()]
+             + [os.path.basename(update_data.STATE), os.path.basename(MANIFEST)])
+        stages = update_data.build_stages(fmt, jhu_source or update_data.JHU_SOURCE,
+                                          owid_source or update_data.OWID_SOURCE, directory, figures=False)
+        status = update_data.run(stages, fmt, state_path=os.path.join(directory, os.path.basename(update_data.STATE)))
+        failed = [name for name, value in status.items() if value not in ('ran', 'skipped')]
+        if failed:
+            raise RuntimeError(f"Refresh stages did not complete: {', '.join(failed)}")
+        if not any(status[stage.name] == 'ran' for stage in stages if not stage.source):
+            logger.info("Sources unchanged, keeping %s", live)
+            shutil.rmtree(directory, ignore_errors=True)
+            return None
+        validate(directory, live)
+    except BaseException:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    swap(directory, live)
+    logger.info("Swapped in data version %s", directory)
+    return directory
+
+
+def locked_refresh(fmt=FORMAT, jhu_source=None, owid_source=None):
+    """
+    Function that runs refresh_once unless another process sharing data/ is already
+    refreshing
+    return: directory of the new live version, or None
+    """
+    if fcntl is None:
+        return refresh_once(fmt, jhu_source, owid_source)
+    os.makedirs(VERSIONS_DIR, exist_ok=True)
+    with open(LOCK, 'w') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            logger.info("Another process is refreshing the data")
+            return None
+        return refresh_once(fmt, jhu_source, owid_source)
+
+
+class Refresher(threading.Thread):
+    """
+    Daemon thread refreshing the data every interval seconds, starting right away.
+    A failed refresh is logged and leaves the live version in place.
+    """
+
+    def __init__(self, interval, fmt=FORMAT, jhu_source=None, owid_source=None):
+        super().__init__(name='data-refresher', daemon=True)
+        self.interval = interval
+        self.fmt = fmt
+        self.jhu_source = jhu_source
+        self.owid_source = owid_source
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                locked_refresh(self.fmt, self.jhu_source, self.owid_source)
+            except Exception:
+                logger.exception("Data refresh failed, still serving %s", active_dir())
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+
+
+def start(interval=None):
+    """
+    Function that starts the process-wide refresher once. Without an interval it reads
+    COVID_REFRESH_INTERVAL (seconds) and does nothing when that is unset, so the app
+    can call it on every script run.
+    return: the refresher thread, or None when refreshing in the app is disabled
+    """
+    global _refresher
+    interval = interval or float(os.environ.get(INTERVAL_ENV, 0))
+    if not interval:
+        return None
+    with _refresher_lock:
+        if _refresher is None:
+            _refresher = Refresher(interval)
+            _refresher.start()
+        return _refresher
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--format', default=FORMAT, help='storage format of the tables')
+    parser.add_argument('--jhu-source', default=None, help='base url of the JHU time series files')
+    parser.add_argument('--owid-source', default=None, help='base url of vaccinations.csv and locations.csv')
+    parser.add_argument('--once', action='store_true', help='refresh once and exit instead of every --interval')
+    parser.add_argument('--interval', type=float, default=6 * 3600, help='seconds between refreshes')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    if args.once:
+        print(locked_refresh(args.format, args.jhu_source, args.owid_source) or 'No changes')
+    else:
+        refresher = Refresher(args.interval, args.format, args.jhu_source, args.owid_source)
+        refresher.start()
+        refresher.join()
@@ -0,0 +1,184 @@
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+# file extension of every supported on-disk format, in read preference order
+FORMATS = {
+    'parquet': '.parquet',
+    'feather': '.feather',
+    'csv': '.csv',
+}
+
+# dtype of every known column, applied when a table is written in a columnar format and
+# when the app loads it (see apply_schema). Names repeat on every row so they are
+# dictionary-encoded; JHU counts fit int32 (a count that does not stays int64); the OWID
+# and worldometer counts have gaps and pass 2**31, so they stay float64 while their
+# ratios only need float32.
+SCHEMA = {
+    'Country/Region': 'category',
+    'Province/State': 'category',
+    'iso_code': 'category',
+    'country': 'category',
+    'continent': 'category',
+    'vaccines': 'category',
+    'last_observation_date': 'category',
+    'source_name': 'category',
+    'source_website': 'category',
+    'Date': 'datetime64[ns]',
+    'date': 'datetime64[ns]',
+    'Lat': 'float32',
+    'Long': 'float32',
+    'Confirmed': 'int32',
+    'Deaths': 'int32',
+    'Recovered': 'int32',
+    'Active': 'int32',
+    'total_vaccinations_per_hundred': 'float32',
+    'people_vaccinated_per_hundred': 'float32',
+    'people_fully_vaccinated_per_hundred': 'float32',
+    'daily_vaccinations_per_million': 'float32',
+    'total_cases_per_1m_population': 'float32',
+    'total_deaths_per_1m_population': 'float32',
+    'total_tests_per_1m_population': 'float32',
+    'vaccinated_percent': 'float32',
+    'tested_positive': 'float32',
+}
+DATE_COLUMNS = [col for col, dtype in SCHEMA.items() if dtype.startswith('datetime')]
+
+# index column left behind by older to_csv calls
+STRAY_INDEX = 'Unnamed: 0'
+CHUNK = 1 << 20
+
+
+def table_path(base):
+    """
+    Function that finds the stored file of a table, preferring columnar formats
+    arg: path of the table without extension (e.g. 'data/covid')
+    return: path of the existing file
+    """
+    for ext in FORMATS.values():
+        if os.path.exists(base + ext):
+            return base + ext
+    raise FileNotFoundError(f"No stored table found for {base}")
+
+
+def file_digest(path):
+    """
+    Function that computes the sha256 digest of a file, reading it in chunks
+    arg: file path
+    return: hex digest
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def apply_schema(df):
+    """
+    Function that converts the columns of a frame listed in SCHEMA to their dtype.
+    Missing counts become 0. Columns already of the right dtype are not copied, and
+    names mostly unique to their row (e.g. one row per country) stay strings since
+    encoding them would not save anything.
+    arg: pandas dataframe (left unmodified)
+    return: pandas dataframe
+    """
+    converted = {}
+    for col, dtype in SCHEMA.items():
+        if col not in df.columns or df[col].dtype == dtype:
+            continue
+        values = df[col]
+        if dtype == 'category' and values.nunique() > len(values) / 2:
+            continue
+        if dtype == 'int32':
+            values = values.fillna(0)
+            limits = np.iinfo(np.int32)
+            if len(values) and (values.min() < limits.min or values.max() > limits.max):
+                dtype = 'int64'
+        if dtype.startswith('datetime'):
+            converted[col] = pd.to_datetime(values)
+        else:
+            converted[col] = values.astype(dtype)
+    return df.assign(**converted) if converted else df
+
+
+def default_dtypes(df):
+    """
+    Function that converts a frame back to the dtypes pandas gives a CSV it reads without
+    a schema: names as object strings, integers as int64 and floats as float64. Used as
+    the baseline of what apply_schema saves, whatever format the table was stored in.
+    arg: pandas dataframe (left unmodified)
+    return: pandas dataframe
+    """
+    converted = {}
+    for col in df.columns:
+        dtype = df[col].dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            converted[col] = df[col].astype(object)
+        elif dtype.kind in 'iu' and dtype != np.int64:
+            converted[col] = df[col].astype(np.int64)
+        elif dtype.kind == 'f' and dtype != np.float64:
+            converted[col] = df[col].astype(np.float64)
+    return df.assign(**converted) if converted else df
+
+
+def memory_mb(df):
+    """
+    Function that returns the memory held by a frame, strings included, in MB
+    """
+    return df.memory_usage(deep=True).sum() / 2**20
+
+
+def to_columnar(df):
+    """
+    Function that converts a frame to the dtypes used on disk (see SCHEMA)
+    arg: pandas dataframe
+    return: pandas dataframe
+    """
+    return apply_schema(df.reset_index(drop=True))
+
+
+def write_table(df, base, fmt='csv'):
+    """
+    Function that writes a table in the given format. The file is written to a
+    temporary path first and moved into place, and copies of the same table in
+    other formats are removed so readers never pick up a stale one.
+    arg: pandas dataframe, path without extension, format (one of FORMATS)
+    return: path of the written file
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}, expected one of {list(FORMATS)}")
+    path = base + FORMATS[fmt]
+    tmp_path = path + '.tmp'
+    if fmt == 'csv':
+        df.to_csv(tmp_path, index=False)
+    elif fmt == 'parquet':
+        to_columnar(df).to_parquet(tmp_path, index=False)
+    else:
+        to_columnar(df).to_feather(tmp_path)
+    os.replace(tmp_path, path)
+
+    for other in FORMATS.values():
+        if base + other != path and os.path.exists(base + other):
+            os.remove(base + other)
+    return path
+
+
+def read_table(path, columns=None):
+    """
+    Function that reads a stored table, only loading the requested columns
+    arg: file path and optional list of columns
+    return: pandas dataframe
+    """
+    ext = os.path.splitext(path)[1]
+    if ext == FORMATS['parquet']:
+        return pd.read_parquet(path, columns=columns)
+    if ext == FORMATS['feather']:
+        return pd.read_feather(path, columns=columns)
+
+    header = pd.read_csv(path, nrows=0).columns
+    usecols = [c for c in header if c != STRAY_INDEX] if columns is None else columns
+    parse_dates = [c for c in DATE_COLUMNS if c in usecols]
+    return pd.read_csv(path, usecols=usecols, parse_dates=parse_dates)[list(usecols)]
@@ -0,0 +1,317 @@
+"""
+Refreshes every dataset of the dashboard as one small graph of stages. Each stage
+declares the stages it reads from, the local files it reads and the tables it writes.
+Frames are handed from stage to stage in memory, the JHU and OWID branches run in
+parallel, and a stage is skipped when the fingerprint of its inputs matches the one
+recorded by the last run (in data/refresh_state.json) and its tables still exist.
+
+    python -m pages.utils.update_data --format parquet
+    python -m pages.utils.update_data --dry-run
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+import pandas as pd
+
+from pages.utils.aggregates import AGGREGATES, SNAPSHOTS, write_aggregates
+from pages.utils.fetch import fetch_all
+from pages.utils import fetch_data
+from pages.utils.fetch_data import COVID_TABLE, JHU_FILE, JHU_SERIES, JHU_SOURCE, load_manifest, save_manifest
+from pages.utils.fetch_vacc_data import (DAILY_TABLE, OWID_FILES, OWID_SOURCE, SUMMARY_TABLE, VACCINE_TABLE,
+                                         WORLDOMETER_DAILY, WORLDOMETER_SUMMARY, build_daily_data,
+                                         build_summ_data, build_vacc_data)
+from pages.utils.figure_cache import warm
+from pages.utils.profiling import track
+from pages.utils.storage import FORMATS, file_digest, read_table, table_path, write_table
+from pages.utils.versions import DATA_DIR, require_unversioned
+
+STATE = 'data/refresh_state.json'
+WORKERS = 4
+
+logger = logging.getLogger(__name__)
+
+
+class Stage:
+    """
+    One step of the refresh. run is called with the values of the input stages, in the
+    order they are declared, and returns the value handed to the stages reading from it.
+    A skipped stage hands on None, so run must load the tables of a None input itself.
+    Source stages download files and always run; their fingerprint is the checksum of
+    what they fetched, so everything downstream of an unchanged source is skipped.
+    A carry_over stage whose input files are missing keeps the tables it wrote before,
+    e.g. from the worldometer exports, which are not downloaded and not always present.
+    """
+
+    def __init__(self, name, run, inputs=(), files=(), outputs=(), source=False, carry_over=False):
+        self.name = name
+        self.run = run
+        self.inputs = list(inputs)
+        self.files = list(files)
+        self.outputs = list(outputs)
+        self.source = source
+        self.carry_over = carry_over
+
+
+def _load(base):
+    return read_table(table_path(base))
+
+
+def build_stages(fmt='csv', jhu_source=JHU_SOURCE, owid_source=OWID_SOURCE, directory=DATA_DIR, figures=True):
+    """
+    Function that declares the refresh graph
+    arg: output format, base urls of the JHU and OWID files, directory the tables are
+         written to, whether to pre-render the figures of the refreshed data
+    return: list of stages, each after the stages it reads from
+    """
+    covid_table, vaccine_table, daily_table, summary_table = (
+        os.path.join(directory, os.path.basename(table))
+        for table in (COVID_TABLE, VACCINE_TABLE, DAILY_TABLE, SUMMARY_TABLE))
+
+    def download(urls):
+        # parsing is left to the consuming stage, which does not run when nothing changed
+        return lambda: fetch_all(urls)
+
+    def covid(files):
+        # incremental on top of the table already in directory (e.g. seeded from the live
+        # version), a full build otherwise; the aggregates are the next stage's job
+        return fetch_data.refresh(fmt, source=jhu_source, directory=directory, files=files, aggregates=False)
+
+    def aggregates(df_all):
+        write_aggregates(df_all if df_all is not None else _load(covid_table), fmt, directory)
+
+    def vaccine(files):
+        df_vaccine = build_vacc_data(pd.read_csv(files['vaccinations']['path']),
+                                     pd.read_csv(files['locations']['path']))
+        write_table(df_vaccine, vaccine_table, fmt)
+        return df_vaccine
+
+    def daily(df_vaccine):
+        df_vaccine = df_vaccine if df_vaccine is not None else _load(vaccine_table)
+        write_table(build_daily_data(pd.read_csv(WORLDOMETER_DAILY, parse_dates=['date']), df_vaccine),
+                    daily_table, fmt)
+
+    def summary(df_vaccine):
+        df_vaccine = df_vaccine if df_vaccine is not None else _load(vaccine_table)
+        write_table(build_summ_data(pd.read_csv(WORLDOMETER_SUMMARY), df_vaccine), summary_table, fmt)
+
+    stages = [
+        Stage('jhu_download', download({series: jhu_source + JHU_FILE.format(series) for series in JHU_SERIES}),
+              source=True),
+        Stage('owid_download', download({name: owid_source + file for name, file in OWID_FILES.items()}),
+              source=True),
+        Stage('covid', covid, inputs=['jhu_download'], outputs=[covid_table]),
+        Stage('aggregates', aggregates, inputs=['covid'],
+              outputs=[os.path.join(directory, f'agg_{name}') for name in list(AGGREGATES) + list(SNAPSHOTS)]),
+        Stage('vaccine', vaccine, inputs=['owid_download'], outputs=[vaccine_table]),
+        Stage('daily', daily, inputs=['vaccine'], files=[WORLDOMETER_DAILY], outputs=[daily_table],
+              carry_over=True),
+        Stage('summary', summary, inputs=['vaccine'], files=[WORLDOMETER_SUMMARY], outputs=[summary_table],
+              carry_over=True),
+    ]
+    if figures:
+        stages.append(Stage('figures', lambda *tables: warm(), inputs=['aggregates', 'daily', 'summary']))
+    return stages
+
+
+def check_graph(stages):
+    """
+    Function that rejects a graph with duplicate names or with a stage reading from one
+    declared after it (which also rules out cycles)
+    """
+    seen = set()
+    for stage in stages:
+        if stage.name in seen:
+            raise ValueError(f"Stage {stage.name!r} is declared twice")
+        missing = [name for name in stage.inputs if name not in seen]
+        if missing:
+            raise ValueError(f"Stage {stage.name!r} reads from {missing}, which are not declared before it")
+        seen.add(stage.name)
+
+
+def fingerprint(stage, upstream, fmt):
+    """
+    Function that hashes what a stage's result depends on: the output format, the
+    fingerprints of its input stages and the contents of its input files
+    arg: stage, dict of stage name -> fingerprint, output format
+    return: 16 character hex digest
+    """
+    payload = {'stage': stage.name, 'format': fmt, 'inputs': [upstream[name] for name in stage.inputs],
+               'files': [file_digest(path) for path in stage.files]}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def source_fingerprint(files):
+    """
+    Function that hashes the checksums of the files fetched by a source stage
+    """
+    checksums = {name: f['sha256'] for name, f in files.items()}
+    return hashlib.sha256(json.dumps(checksums, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def carried_fingerprint(stage):
+    """
+    Function that hashes the tables a carry_over stage keeps, standing in for the
+    fingerprint of its inputs so the stages reading from it rerun when they change
+    """
+    payload = {'stage': stage.name, 'outputs': [file_digest(table_path(base)) for base in stage.outputs]}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def outputs_exist(stage):
+    try:
+        for base in stage.outputs:
+            table_path(base)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def plan(stages, fmt='csv', force=False, state_path=STATE):
+    """
+    Function that predicts which stages the next run executes, assuming the sources
+    still have the checksums recorded by the last run
+    arg: stages, output format, whether every stage is forced, path of the refresh state
+    return: list of (stage, action, reason) tuples
+    """
+    check_graph(stages)
+    recorded = load_manifest(state_path).get('stages', {})
+    upstream, steps = {}, []
+    for stage in stages:
+        last = recorded.get(stage.name, {}).get('fingerprint')
+        if stage.source:
+            upstream[stage.name] = last
+            steps.append((stage, 'check', 'download when changed upstream'))
+            continue
+        try:
+            upstream[stage.name] = fingerprint(stage, upstream, fmt)
+        except FileNotFoundError as e:
+            if stage.carry_over and outputs_exist(stage):
+                upstream[stage.name] = carried_fingerprint(stage)
+                steps.append((stage, 'keep', f'missing {e.filename}'))
+            else:
+                upstream[stage.name] = None
+                steps.append((stage, 'fail', f'missing {e.filename}'))
+            continue
+        if force:
+            steps.append((stage, 'run', 'forced'))
+        elif not outputs_exist(stage):
+            steps.append((stage, 'run', 'outputs missing'))
+        elif last is None or upstream[stage.name] != last:
+            steps.append((stage, 'run', 'inputs changed'))
+        else:
+            steps.append((stage, 'skip', 'unless a source changed'))
+    return steps
+
+
+def run(stages, fmt='csv', force=False, workers=WORKERS, stats=None, state_path=STATE):
+    """
+    Function that runs the refresh graph: a stage starts as soon as all its inputs are
+    done, so independent branches overlap. The fingerprint of every stage that succeeds
+    is recorded immediately, so a failed run resumes where it stopped. Stages downstream
+    of a failure are not run. A carry_over stage missing an input file is skipped, even
+    when forced, as long as its tables exist.
+    arg: stages, output format, whether to run stages whose inputs did not change,
+         number of stages run at once, optional list collecting per-stage timings,
+         path of the refresh state
+    return: dict of stage name -> 'ran', 'skipped', 'failed' or 'blocked'
+    """
+    check_graph(stages)
+    state = load_manifest(state_path)
+    recorded = state.setdefault('stages', {})
+    state_lock = threading.Lock()
+    by_name = {stage.name: stage for stage in stages}
+    values, upstream, status = {}, {}, {}
+
+    def execute(stage):
+        last = recorded.get(stage.name, {}).get('fingerprint')
+        if not stage.source:
+            try:
+                upstream[stage.name] = fingerprint(stage, upstream, fmt)
+            except FileNotFoundError as e:
+                if not (stage.carry_over and outputs_exist(stage)):
+                    raise
+                upstream[stage.name] = carried_fingerprint(stage)
+                logger.warning("%-20s skipped, keeping its tables as %s is missing", stage.name, e.filename)
+                return None, 'skipped'
+            if not force and upstream[stage.name] == last and outputs_exist(stage):
+                logger.info("%-20s skipped, inputs unchanged", stage.name)
+                return None, 'skipped'
+        start = time.perf_counter()
+        with track(stage.name, stats):
+            value = stage.run(*(values[name] for name in stage.inputs))
+        if stage.source:
+            upstream[stage.name] = source_fingerprint(value)
+        with state_lock:
+            recorded[stage.name] = {'fingerprint': upstream[stage.name],
+                                    'seconds': round(time.perf_counter() - start, 3),
+                                    'finished': datetime.now().isoformat(timespec='seconds')}
+            save_manifest(state, state_path)
+        return value, 'ran'
+
+    pending = list(stages)
+    running = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while pending or running:
+            for stage in list(pending):
+                if any(status.get(name) in ('failed', 'blocked') for name in stage.inputs):
+                    status[stage.name] = 'blocked'
+                    pending.remove(stage)
+                elif all(name in values for name in stage.inputs):
+                    running[pool.submit(execute, stage)] = stage.name
+                    pending.remove(stage)
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    values[name], status[name] = future.result()
+                except Exception:
+                    logger.exception("Stage %s failed", name)
+                    status[name] = 'failed'
+    return {name: status[name] for name in by_name}
+
+
+def main(fmt='csv', jhu_source=JHU_SOURCE, owid_source=OWID_SOURCE, force=False, dry_run=False):
+    """
+    Function that prints the plan of a refresh, or runs it and prints the time of each stage
+    return: True when every stage succeeded (or would be attempted, for a dry run)
+    """
+    stages = build_stages(fmt, jhu_source, owid_source)
+    if dry_run:
+        for stage, action, reason in plan(stages, fmt, force):
+            print(f"{action:>5}  {stage.name:<14} {reason:<26} <- {', '.join(stage.inputs + stage.files) or '-'}"
+                  f"  -> {', '.join(stage.outputs) or '-'}")
+        return True
+
+    stats = []
+    start = time.perf_counter()
+    status = run(stages, fmt, force, stats=stats)
+    wall = time.perf_counter() - start
+    seconds = {entry['stage']: entry['seconds'] for entry in stats}
+    for stage in stages:
+        timing = f"{seconds[stage.name]:8.2f}s" if stage.name in seconds else ' ' * 9
+        print(f"{stage.name:<14} {status[stage.name]:<8} {timing}")
+    print(f"{'total':<14} {'':<8} {wall:8.2f}s wall, {sum(seconds.values()):.2f}s of stage time")
+    return all(value in ('ran', 'skipped') for value in status.values())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--format', choices=list(FORMATS), default='csv')
+    parser.add_argument('--jhu-source', default=JHU_SOURCE, help='base url of the JHU time series files')
+    parser.add_argument('--owid-source', default=OWID_SOURCE, help='base url of vaccinations.csv and locations.csv')
+    parser.add_argument('--force', action='store_true', help='run every stage even if its inputs did not change')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='print what would run and why, without downloading or writing anything')
+    args = parser.parse_args()
+    require_unversioned('update_data')
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    raise SystemExit(0 if main(args.format, args.jhu_source, args.owid_source, args.force, args.dry_run) else 1)
@@ -0,0 +1,119 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+DATA_DIR = 'data'
+VERSIONS_DIR = 'data/versions'
+# names the live directory under VERSIONS_DIR; absent until a version is swapped in
+CURRENT = 'data/CURRENT'
+# versions kept on disk: the live one and the one before it, which readers that started
+# before the last swap may still be reading
+KEEP = 2
+
+_local = threading.local()
+
+
+def active_dir():
+    """
+    Function that returns the directory of the live dataset version: the one named by
+    data/CURRENT once a refresh has been swapped in, else data/ itself
+    """
+    try:
+        with open(CURRENT) as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return DATA_DIR
+    return os.path.join(VERSIONS_DIR, name) if name else DATA_DIR
+
+
+def data_dir():
+    """
+    Function that returns the directory the calling thread reads tables from: the version
+    pinned by snapshot(), else the live one
+    """
+    return getattr(_local, 'directory', None) or active_dir()
+
+
+@contextmanager
+def snapshot(directory=None):
+    """
+    Context manager that pins the calling thread to one dataset version, so every table
+    read inside the block comes from the same refresh even if a new one is swapped in
+    meanwhile. Nested blocks keep the outer pin unless given a directory.
+    arg: version directory (defaults to the pinned or live one)
+    """
+    previous = getattr(_local, 'directory', None)
+    _local.directory = directory or previous or active_dir()
+    try:
+        yield _local.directory
+    finally:
+        _local.directory = previous
+
+
+def require_unversioned(script):
+    """
+    Function that stops a script writing its tables straight to data/ once the app reads
+    the versions swapped in by the refresher, since nothing would read what it wrote
+    arg: name of the script, for the message
+    raise: SystemExit pointing to the refresher
+    """
+    if os.path.exists(CURRENT):
+        raise SystemExit(f"{script}: {CURRENT} exists, so the app reads the data versions swapped in by "
+                         f"the refresher and would never see tables written to {DATA_DIR}/. "
+                         "Run python -m pages.utils.refresher --once instead.")
+
+
+def new_version_dir():
+    """
+    Function that creates an empty directory for the next version, named so that
+    versions sort by creation time
+    """
+    os.makedirs(VERSIONS_DIR, exist_ok=True)
+    directory = tempfile.mkdtemp(prefix=time.strftime('%Y%m%d-%H%M%S-'), dir=VERSIONS_DIR)
+    # mkdtemp makes it private to the owner
+    os.chmod(directory, 0o755)
+    return directory
+
+
+def seed(source, target, names):
+    """
+    Function that links the files of a version into a new one. Tables are only ever
+    replaced, never written in place, so the hard links stay independent copies.
+    arg: source directory, target directory, file names to carry over
+    """
+    for name in names:
+        path = os.path.join(source, name)
+        if os.path.isfile(path):
+            try:
+                os.link(path, os.path.join(target, name))
+            except OSError:
+                shutil.copy2(path, os.path.join(target, name))
+
+
+def activate(directory):
+    """
+    Function that makes a version directory live by atomically replacing data/CURRENT
+    """
+    with open(CURRENT + '.tmp', 'w') as f:
+        f.write(os.path.basename(directory))
+    os.replace(CURRENT + '.tmp', CURRENT)
+
+
+def prune(keep=KEEP):
+    """
+    Function that deletes the versions older than the keep most recent ones up to the live one
+    return: list of deleted directories
+    """
+    if not os.path.isdir(VERSIONS_DIR):
+        return []
+    live = os.path.basename(active_dir())
+    names = sorted(name for name in os.listdir(VERSIONS_DIR) if os.path.isdir(os.path.join(VERSIONS_DIR, name)))
+    if live not in names:
+        return []
+    stale = names[:max(names.index(live) + 1 - keep, 0)]
+    for name in stale:
+        shutil.rmtree(os.path.join(VERSIONS_DIR, name), ignore_errors=True)
+    return [os.path.join(VERSIONS_DIR, name) for name in stale]
@@ -6,18 +6,27 @@ import plotly.express as px
 import plotly.graph_objs as go
 from plotly.subplots import make_subplots
 import datetime
+import time
+from pages.utils import data_store
+from pages.utils.aggregates import METRICS
+from pages.utils.figure_cache import cached_figure
+from pages.utils.frames import DEFAULT_BUDGET, FRAME_BUDGETS, decimate_frames, log_figure
+
+# comparison view: resolution -> Altair x encoding of the pre-aggregated rows, countries
+# selected by default, and the most rows embedded in the chart spec
+COMPARISON_RESOLUTIONS = {
+    'Quarterly': 'utcyearquarter(Date):O',
+    'Daily': 'Date:T',
+}
+COMPARISON_DEFAULT = 5
+COMPARISON_MAX_ROWS = 5000
 
 def load_data():
     """ Function to load data
-        param DATA_URL: data_url
-        return: pandas dataframe
+        return: pandas dataframe shared across sessions (see data_store)
     """
-    DATA_URL = 'data/covid.csv'
-    data = pd.read_csv(DATA_URL)
-    data['Date'] = pd.to_datetime(data['Date']).dt.strftime('%Y-%m-%d')
-    return data
+    return data_store.get_dataset('covid')
 
-@st.cache
 def plot_snapshot_numbers(df, colors, country=None):
     """
     Function plots snapshots for worldwide and countries.
@@ -27,101 +36,186 @@ def plot_snapshot_numbers(df, colors, country=None):
     :param country: str
     :return: plotly.figure
     """
-    with st.spinner("Rendering chart..."):
-        colors = px.colors.qualitative.D3
-        if country:
-            df = df[df["Country/Region"] == country]
-        fig = go.Figure()
-        fig.add_trace(go.Bar(y=df[["Confirmed", "Deaths", "Recovered", "Active"]].columns.tolist(),
-                             x=df[["Confirmed", "Deaths", "Recovered", "Active"]].sum().values,
-                             text=df[["Confirmed", "Deaths", "Recovered", "Active"]].sum().values,
-                             orientation='h',
-                             marker=dict(color=[colors[1], colors[3], colors[2], colors[0]]),
-                             ),
+    colors = px.colors.qualitative.D3
+    if country:
+        df = df[df["Country/Region"] == country]
+    fig = go.Figure()
+    fig.add_trace(go.Bar(y=df[["Confirmed", "Deaths", "Recovered", "Active"]].columns.tolist(),
+                         x=df[["Confirmed", "Deaths", "Recovered", "Active"]].sum().values,
+                         text=df[["Confirmed", "Deaths", "Recovered", "Active"]].sum().values,
+                         orientation='h',
+                         marker=dict(color=[colors[1], colors[3], colors[2], colors[0]]),
+                         ),
+                  )
+    fig.update_traces(opacity=0.7,
+                      textposition=["inside", "outside", "inside", "inside"],
+                      texttemplate='%{text:.3s}',
+                      hovertemplate='Status: %{y} <br>Count: %{x:,.2f}',
+                      marker_line_color='rgb(255, 255, 255)',
+                      marker_line_width=2.5
                       )
-        fig.update_traces(opacity=0.7,
-                          textposition=["inside", "outside", "inside", "inside"],
-                          texttemplate='%{text:.3s}',
-                          hovertemplate='Status: %{y} <br>Count: %{x:,.2f}',
-                          marker_line_color='rgb(255, 255, 255)',
-                          marker_line_width=2.5
-                          )
-        fig.update_layout(
-            title="Total count",
-            width=800,
-            legend_title_text="Status",
-            xaxis=dict(title="Count"),
-            yaxis=dict(showgrid=False, showticklabels=True),
-        )
+    fig.update_layout(
+        title="Total count",
+        width=800,
+        legend_title_text="Status",
+        xaxis=dict(title="Count"),
+        yaxis=dict(showgrid=False, showticklabels=True),
+    )
 
     return fig
 
-@st.cache
-def plot_top_countries(df, colors):
+def plot_top_countries(tops, colors):
     """
     Function plots top countries by confirmed, deaths, recovered, active cases.
-    :param df: DataFrame
+    :param tops: dict of metric -> DataFrame of the top countries for it (see data_store.top_n)
     :param colors: list
     :return: plotly.figure
     """
-    with st.spinner("Rendering chart..."):
-        temp = df.groupby("Country/Region").agg({"Confirmed": "sum",
-                                                 "Deaths": "sum",
-                                                 "Recovered": "sum",
-                                                 "Active": "sum"})
-        colors = px.colors.qualitative.Prism
-        fig = make_subplots(2, 2, subplot_titles=("Top 10 Countries by cases",
-                                                  "Top 10 Countries by deaths",
-                                                  "Top 10 Countries by recoveries",
-                                                  "Top 10 Countries by active cases"))
-        fig.append_trace(go.Bar(x=temp["Confirmed"].nlargest(n=10),
-                                y=temp["Confirmed"].nlargest(n=10).index,
-                                orientation='h',
-                                marker=dict(color=colors),
-                                hovertemplate='<br>Count: %{x:,.2f}',
-                                ),
-                         row=1, col=1)
-
-        fig.append_trace(go.Bar(x=temp["Deaths"].nlargest(n=10),
-                                y=temp["Deaths"].nlargest(n=10).index,
-                                orientation='h',
-                                marker=dict(color=colors),
-                                hovertemplate='<br>Count: %{x:,.2f}',
-                                ),
-                         row=2, col=1)
-
-        fig.append_trace(go.Bar(x=temp["Recovered"].nlargest(n=10),
-                                y=temp["Recovered"].nlargest(n=10).index,
-                                orientation='h',
-                                marker=dict(color=colors),
-                                hovertemplate='<br>Count: %{x:,.2f}',
-                                ),
-                         row=1, col=2)
-
-        fig.append_trace(go.Bar(x=temp["Active"].nlargest(n=10),
-                                y=temp["Active"].nlargest(n=10).index,
-                                orientation='h',
-                                marker=dict(color=colors),
-                                hovertemplate='<br>Count: %{x:,.2f}'),
-                         row=2, col=2)
-        fig.update_yaxes(autorange="reversed")
-        fig.update_traces(
-            opacity=0.7,
-            marker_line_color='rgb(255, 255, 255)',
-            marker_line_width=2.5
-        )
-        fig.update_layout(height=700,
-                          width=1000,
-                          showlegend=False)
+    colors = px.colors.qualitative.Prism
+    fig = make_subplots(2, 2, subplot_titles=("Top 10 Countries by cases",
+                                              "Top 10 Countries by deaths",
+                                              "Top 10 Countries by recoveries",
+                                              "Top 10 Countries by active cases"))
+    fig.append_trace(go.Bar(x=tops["Confirmed"]["Confirmed"],
+                            y=tops["Confirmed"]["Country/Region"],
+                            orientation='h',
+                            marker=dict(color=colors),
+                            hovertemplate='<br>Count: %{x:,.2f}',
+                            ),
+                     row=1, col=1)
+
+    fig.append_trace(go.Bar(x=tops["Deaths"]["Deaths"],
+                            y=tops["Deaths"]["Country/Region"],
+                            orientation='h',
+                            marker=dict(color=colors),
+                            hovertemplate='<br>Count: %{x:,.2f}',
+                            ),
+                     row=2, col=1)
+
+    fig.append_trace(go.Bar(x=tops["Recovered"]["Recovered"],
+                            y=tops["Recovered"]["Country/Region"],
+                            orientation='h',
+                            marker=dict(color=colors),
+                            hovertemplate='<br>Count: %{x:,.2f}',
+                            ),
+                     row=1, col=2)
+
+    fig.append_trace(go.Bar(x=tops["Active"]["Active"],
+                            y=tops["Active"]["Country/Region"],
+                            orientation='h',
+                            marker=dict(color=colors),
+                            hovertemplate='<br>Count: %{x:,.2f}'),
+                     row=2, col=2)
+    fig.update_yaxes(autorange="reversed")
+    fig.update_traces(
+        opacity=0.7,
+        marker_line_color='rgb(255, 255, 255)',
+        marker_line_width=2.5
+    )
+    fig.update_layout(height=700,
+                      width=1000,
+                      showlegend=False)
+
+    return fig
+
+
+@cached_figure('world.snapshot', lambda: data_store.aggregate_version('latest_by_country'))
+def snapshot_figure():
+    """
+    Function builds the worldwide snapshot chart from the latest totals.
+    :return: plotly.figure
+    """
+    return plot_snapshot_numbers(data_store.get_aggregate('latest_by_country'), px.colors.qualitative.D3)
 
+@cached_figure('world.active_cases', lambda: data_store.aggregate_version('by_date'))
+def active_cases_figure():
+    """
+    Function builds the chart of worldwide active cases per date.
+    :return: plotly.figure
+    """
+    datewise=data_store.get_aggregate('by_date').set_index("Date")
+    fig=px.bar(x=datewise.index,y=datewise["Active"])
+    fig.update_layout(title="Distribution of Number of Active Cases",
+              xaxis_title="Date",yaxis_title="Number of Cases",)
     return fig
 
+@cached_figure('world.top_countries', lambda: data_store.aggregate_version('latest_by_country'))
+def top_countries_figure():
+    """
+    Function builds the top 10 countries chart from the latest snapshot.
+    :return: plotly.figure
+    """
+    tops = {metric: data_store.top_n('latest_by_country', metric, 10) for metric in METRICS}
+    return plot_top_countries(tops, px.colors.qualitative.D3)
+
+def map_frames(budget):
+    """
+    Function that loads one row per country per animation frame for the map views.
+    :param budget: key of frames.FRAME_BUDGETS
+    :return: DataFrame
+    """
+    df = data_store.get_dataset('covid', columns=['Country/Region', 'iso_code', 'Date', 'Confirmed', 'Deaths'])
+    return decimate_frames(df, 'Date', ['Country/Region', 'iso_code'], ['Confirmed', 'Deaths'], **FRAME_BUDGETS[budget])
+
+@cached_figure('world.confirmed_map', lambda: data_store.dataset_version('covid'), warm=[(DEFAULT_BUDGET,)])
+def confirmed_map(budget):
+    """
+    Function builds the animated choropleth of confirmed cases.
+    :param budget: key of frames.FRAME_BUDGETS
+    :return: plotly.figure
+    """
+    start = time.perf_counter()
+    df = map_frames(budget)
+    fig = px.choropleth(df,                        # Input Dataframe
+                 locations="iso_code",           # identify country code column
+                 color="Confirmed",                 # identify representing column
+                 hover_name="Country/Region",        # identify hover name
+                 animation_frame="Date",        # identify date column
+                 projection="natural earth",        # select projection
+                 color_continuous_scale = 'blues',  # select prefer color scale
+                 range_color=[0,max(df['Confirmed']+2)]              # select range of dataset
+                 )
+    fig.update_layout(title="Use the slider to observe the rate of increase of the Covid 19 confirmed cases",height=500, width=800)
+    return log_figure('world.confirmed_map', fig, start)
+
+@cached_figure('world.deaths_map', lambda: data_store.dataset_version('covid'), warm=[(DEFAULT_BUDGET,)])
+def deaths_map(budget):
+    """
+    Function builds the animated bubble map of deaths.
+    :param budget: key of frames.FRAME_BUDGETS
+    :return: plotly.figure
+    """
+    start = time.perf_counter()
+    df = map_frames(budget)
+    fig = px.scatter_geo(df, locations="Country/Region", locationmode='country names', 
+                 color="Deaths", size= df['Deaths'].pow(0.3), hover_name="Country/Region", 
+                 range_color= [0, max(df['Deaths'])], 
+                 projection="natural earth", animation_frame="Date", 
+                 title='Progression of the number of deaths due to COVID-19')
+    fig.update_layout(height=550, width=850)
+    return log_figure('world.deaths_map', fig, start)
+
+
+def comparison_data(countries, resolution='Quarterly', max_rows=COMPARISON_MAX_ROWS):
+    """ Function to prepare the country comparison chart in pandas, so only the plotted points
+        reach the browser. Confirmed is cumulative, so a quarter is shown by its last day.
+        param: list of countries, resolution (key of COMPARISON_RESOLUTIONS), row cap
+        return: dataframe of Country/Region, Date and Confirmed, and the countries that fit in the cap
+    """
+    data = data_store.get_aggregate('by_country_date')[['Country/Region', 'Date', 'Confirmed']]
+    data = data[data['Country/Region'].isin(countries) & (data['Confirmed'] > 0)]
+    if resolution == 'Quarterly':
+        quarter = pd.to_datetime(data['Date']).dt.to_period('Q')
+        data = data.groupby([data['Country/Region'], quarter], observed=True, sort=False).tail(1)
+    rows = data.groupby('Country/Region', observed=True).size().reindex(countries, fill_value=0).cumsum()
+    charted = rows.index[rows <= max_rows].tolist()
+    data = data[data['Country/Region'].isin(charted)]
+    return data.astype({'Country/Region': str}).reset_index(drop=True), charted
 
 
 # show data on streamlit
 def main():
     st.title("Worldwide Visualization of the Covid-19 Cases")
-    df = load_data()
     st.write("The dataset was taken from [John Hopkins Covid19 data](https://github.com/CSSEGISandData/COVID-19)")
 
     graph_type = st.sidebar.selectbox("Choose a type of visualization", ["Map",
@@ -130,46 +224,30 @@ def main():
 
     #worldmap visualization of covid cases
     if (graph_type=="Map"):
+        budget = st.sidebar.selectbox("Animation frames", list(FRAME_BUDGETS))
 
-        #total number of cases indicator
+        #total number of cases indicator, as of the latest date
+        totals = data_store.get_aggregate('by_date').iloc[-1]
         fig = go.Figure()
-        fig.add_trace(go.Indicator(mode="number",value=int(df['Confirmed'].sum()),number={"valueformat":"0.f","font":{"size":28}},
+        fig.add_trace(go.Indicator(mode="number",value=int(totals['Confirmed']),number={"valueformat":"0.f","font":{"size":28}},
              title={"text":"Total_Confirmed","font":{"size":25}},domain={"row":0,"column":0}))
 
-        fig.add_trace(go.Indicator(mode="number",value=int(df['Deaths'].sum()),number={"valueformat":"0.f","font":{"size":28}},
+        fig.add_trace(go.Indicator(mode="number",value=int(totals['Deaths']),number={"valueformat":"0.f","font":{"size":28}},
              title={"text":"Total_Deaths","font":{"size":25}},domain={"row":0,"column":1}))
 
-        fig.add_trace(go.Indicator(mode="number",value=int(df['Recovered'].sum()),number={"valueformat":"0.f","font":{"size":28}},
+        fig.add_trace(go.Indicator(mode="number",value=int(totals['Recovered']),number={"valueformat":"0.f","font":{"size":28}},
              title={"text":"Total_Recovered","font":{"size":25}},domain={"row":1,"column":0}))
 
-        fig.add_trace(go.Indicator(mode="number",value=int(df['Active'].sum()),number={"valueformat":"0.f","font":{"size":28}},
+        fig.add_trace(go.Indicator(mode="number",value=int(totals['Active']),number={"valueformat":"0.f","font":{"size":28}},
              title={"text":"Total_Active_Case","font":{"size":25}},domain={"row":1,"column":1}))
 
         fig.update_layout(grid={"rows":2,"columns":2})
         st.plotly_chart(fig)
        
-        fig = px.choropleth(df,                        # Input Dataframe
-                     locations="iso_code",           # identify country code column
-                     color="Confirmed",                 # identify representing column
-                     hover_name="Country/Region",        # identify hover name
-                     animation_frame="Date",        # identify date column
-                     projection="natural earth",        # select projection
-                     color_continuous_scale = 'blues',  # select prefer color scale
-                     range_color=[0,max(df['Confirmed']+2)]              # select range of dataset
-                     )
-        fig.update_layout(title="Use the slider to observe the rate of increase of the Covid 19 confirmed cases",height=500, width=800)
+        fig = confirmed_map(budget)
         st.plotly_chart(fig)
 
-        
-        
-
-        fig1 = px.scatter_geo(df, locations="Country/Region", locationmode='country names', 
-                     color="Deaths", size= df['Deaths'].pow(0.3), hover_name="Country/Region", 
-                     range_color= [0, max(df['Deaths'])], 
-                     projection="natural earth", animation_frame="Date", 
-                     title='Progression of the number of deaths due to COVID-19')
-        fig1.update_layout(height=550, width=850)
-        
+        fig1 = deaths_map(budget)
         st.plotly_chart(fig1)
 
 
@@ -177,34 +255,35 @@ def main():
     if(graph_type=="Total Count"):
         #barplot to show the changes in the covid 19 cases
         st.subheader('Changes in the covid cases over the world')
-        fig = plot_snapshot_numbers(df, px.colors.qualitative.D3)
+        with st.spinner("Rendering chart..."):
+            fig = snapshot_figure()
         st.plotly_chart(fig)
 
         st.subheader('Current active cases')
-        datewise=df.groupby(["Date"]).agg({"Active":'sum'})
-        fig=px.bar(x=datewise.index,y=datewise["Active"])
-        fig.update_layout(title="Distribution of Number of Active Cases",
-                  xaxis_title="Date",yaxis_title="Number of Cases",)
+        fig = active_cases_figure()
         st.plotly_chart(fig)
 
     if(graph_type=="Comparison of countries"):
         st.subheader('Top 10 countries with the highest Covid 19 cases')
-        fig = plot_top_countries(df, px.colors.qualitative.D3)
+        with st.spinner("Rendering chart..."):
+            fig = top_countries_figure()
         st.plotly_chart(fig)
 
         st.subheader('Timeline Comparision of covid 19 growth rate for various countries')
-        country_name_input = st.multiselect('Select Country Names', df.groupby('Country/Region').count().reset_index()['Country/Region'].tolist())
-        subset_data = df
-        if len(country_name_input) > 0:
-            subset_data = df[df['Country/Region'].isin(country_name_input)]
+        resolution = st.sidebar.selectbox("Comparison resolution", list(COMPARISON_RESOLUTIONS))
+        countries = sorted(data_store.get_aggregate('latest_by_country')['Country/Region'])
+        defaults = data_store.top_n('latest_by_country', 'Confirmed', COMPARISON_DEFAULT)['Country/Region'].tolist()
+        country_name_input = st.multiselect('Select Country Names', countries, default=defaults)
+        subset_data, charted = comparison_data(country_name_input or defaults, resolution)
+        if len(charted) < len(country_name_input):
+            st.warning(f'Only the first {len(charted)} countries fit in {COMPARISON_MAX_ROWS} chart rows; '
+                       'choose fewer countries or a coarser resolution.')
     
-        fig = alt.Chart(subset_data).transform_filter(
-        alt.datum.Confirmed > 0  
-        ).mark_line().encode(
-        x=alt.X('yearquarter(Date)', type='nominal', title='Date'),
-        y=alt.Y('sum(Confirmed):Q',  title='Confirmed cases'),
+        fig = alt.Chart(subset_data).mark_line().encode(
+        x=alt.X(COMPARISON_RESOLUTIONS[resolution], title='Date'),
+        y=alt.Y('Confirmed:Q',  title='Confirmed cases'),
         color='Country/Region',
-        tooltip = 'sum(Confirmed)',
+        tooltip = 'Confirmed',
         ).properties(
         width=850,
         height=500
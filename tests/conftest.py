@@ -0,0 +1,16 @@
+import os
+
+import pandas as pd
+import pytest
+
+from pages.utils import fetch_data
+
+
+@pytest.fixture
+def source(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('data')
+    pd.DataFrame({'country': ['France', 'India', 'Italy'], 'iso_code': ['FRA', 'IND', 'ITA']}).to_csv(
+        fetch_data.COUNTRY_CODES, index=False)
+    (tmp_path / 'src').mkdir()
+    return tmp_path / 'src'
@@ -0,0 +1,37 @@
+"""
+Synthetic JHU time series shared by the fetch tests
+"""
+import numpy as np
+import pandas as pd
+
+from pages.utils import fetch_data
+from pages.utils.storage import read_table, table_path
+
+COUNTRIES = ['France', 'France', 'India', 'Italy']
+PROVINCES = ['Reunion', np.nan, np.nan, np.nan]
+
+
+def write_sources(directory, days, revise=None, countries=COUNTRIES, provinces=PROVINCES):
+    """
+    Writes the three JHU matrices with the first days dates, Italy missing from recovered,
+    optionally revising the value of one day
+    """
+    dates = pd.date_range('2020-01-22', periods=days)
+    header = [f'{d.month}/{d.day}/{d.year % 100}' for d in dates]
+    rng = np.random.default_rng(0)
+    for series in fetch_data.JHU_SERIES:
+        values = np.cumsum(rng.integers(0, 50, (len(countries), 60)), axis=1)[:, :days]
+        if revise is not None:
+            values[0, revise] += 1000
+        ids = pd.DataFrame({'Province/State': provinces, 'Country/Region': countries,
+                            'Lat': 1.0, 'Long': 1.0})
+        table = pd.concat([ids, pd.DataFrame(values, columns=header)], axis=1)
+        if series == 'recovered':
+            table = table[table['Country/Region'] != 'Italy']
+        table.to_csv(directory / fetch_data.JHU_FILE.format(series), index=False)
+
+
+def stored():
+    return read_table(table_path(fetch_data.COVID_TABLE))
+
+
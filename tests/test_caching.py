@@ -0,0 +1,65 @@
+import pytest
+
+from pages.utils import caching
+
+
+@pytest.fixture
+def cached(monkeypatch):
+    """
+    A versioned_cache function counting its calls, on a version token and a clock the
+    tests move by hand
+    """
+    state = {'version': 'v1', 'now': 0.0, 'calls': []}
+    monkeypatch.setattr(caching.time, 'monotonic', lambda: state['now'])
+
+    @caching.versioned_cache(lambda: state['version'], ttl=60, max_entries=2)
+    def square(x):
+        state['calls'].append(x)
+        return [x * x]
+
+    state['square'] = square
+    return state
+
+
+def test_results_are_shared_until_the_version_changes(cached):
+    square = cached['square']
+    assert square(3) is square(3)
+    cached['version'] = 'v2'
+    assert square(3) == [9]
+    assert cached['calls'] == [3, 3]
+
+
+def test_entries_expire_after_the_ttl(cached):
+    square = cached['square']
+    square(3)
+    cached['now'] = 59.0
+    square(3)
+    cached['now'] = 61.0
+    square(3)
+    assert cached['calls'] == [3, 3]
+
+
+def test_least_recently_used_is_evicted(cached):
+    square = cached['square']
+    square(1)
+    square(2)
+    square(1)
+    square(3)
+    square(1)
+    square(2)
+    assert cached['calls'] == [1, 2, 3, 2]
+
+
+def test_retain_drops_other_versions(cached):
+    square = cached['square']
+    square(1)
+    cached['version'] = 'v2'
+    square(2)
+    caching.retain({'v2'})
+    square(2)
+    cached['version'] = 'v1'
+    square(1)
+    assert cached['calls'] == [1, 2, 1]
+    caching.clear_all()
+    square(1)
+    assert cached['calls'] == [1, 2, 1, 1]
@@ -0,0 +1,69 @@
+import os
+
+import pandas as pd
+import pytest
+
+from pages.utils import data_store
+from pages.utils.storage import write_table
+
+
+@pytest.fixture
+def data(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('data')
+    write_table(pd.DataFrame({
+        'Country/Region': ['France', 'Italy', 'France'],
+        'Date': pd.to_datetime(['2021-01-01', '2021-01-01', '2021-01-02']),
+        'Confirmed': [1, 2, 3],
+    }), 'data/covid', 'parquet')
+    data_store.clear_cache()
+    yield tmp_path
+    data_store.clear_cache()
+
+
+@pytest.mark.skipif(not hasattr(pd.options.mode, 'copy_on_write'), reason='pandas without copy-on-write')
+def test_mutating_a_dataset_does_not_change_the_cache(data):
+    first = data_store.get_dataset('covid')
+    first.loc[0, 'Confirmed'] = -999
+    first['Confirmed'] += 1
+    first = first.drop(columns='Date')
+
+    again = data_store.get_dataset('covid')
+    assert again['Confirmed'].tolist() == [1, 2, 3]
+    assert 'Date' in again.columns
+
+
+def test_copied_dataset_can_be_modified(data):
+    copy = data_store.get_dataset('covid').copy()
+    copy.loc[0, 'Confirmed'] = -999
+    assert data_store.get_dataset('covid').loc[0, 'Confirmed'] == 1
+
+
+def test_digests_of_rewritten_tables_are_forgotten(data):
+    data_store.dataset_version('covid')
+    write_table(pd.DataFrame({'Country/Region': ['Spain'], 'Date': pd.to_datetime(['2021-01-03']),
+                              'Confirmed': [4]}), 'data/covid', 'parquet')
+    os.utime('data/covid.parquet', ns=(1, 1))
+    data_store.dataset_version('covid')
+    assert len(data_store._digests) == 1
+
+
+def test_retain_forgets_digests_of_other_versions(data):
+    data_store.get_dataset('covid')
+    os.makedirs('data/versions/next')
+    data_store.retain('data/versions/next')
+    assert not data_store._digests
+    assert not data_store._cache
+    assert not data_store._locks
+
+
+def test_memory_report_compares_with_default_dtypes(data, monkeypatch):
+    # measuring is left to the report, loads do not pay for it
+    with monkeypatch.context() as patch:
+        patch.setattr(data_store, 'default_dtypes', None)
+        data_store.get_dataset('covid')
+    report = data_store.memory_report().loc[('covid', 'all')]
+    # the parquet file already holds the compact dtypes; the baseline must not
+    assert report['saved_mb'] > 0
+    assert report['default_mb'] > report['loaded_mb']
+    assert data_store.memory_report().equals(data_store.memory_report())
@@ -0,0 +1,107 @@
+import gzip
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from pages.utils import fetch
+
+BODY = b'Country/Region,Confirmed\nFrance,1\nItaly,2\n' * 50
+ETAG = '"v1"'
+
+
+class Handler(BaseHTTPRequestHandler):
+    requests = []
+    failures = {}
+
+    def do_GET(self):
+        self.requests.append((self.path, self.headers.get('If-None-Match'), self.headers.get('Accept-Encoding')))
+        if self.failures.get(self.path, 0) > 0:
+            self.failures[self.path] -= 1
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.headers.get('If-None-Match') == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = BODY
+        self.send_response(200)
+        self.send_header('ETag', ETAG)
+        if self.path == '/gzip.csv' and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(BODY)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(fetch, 'BACKOFF', 0)
+    monkeypatch.setattr(fetch, '_session', None)
+    for var in ('HTTP_PROXY', 'HTTPS_PROXY', 'ALL_PROXY', 'http_proxy', 'https_proxy', 'all_proxy'):
+        monkeypatch.delenv(var, raising=False)
+    Handler.requests, Handler.failures = [], {}
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{httpd.server_port}'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_downloads_and_parses(server, tmp_path):
+    files = fetch.fetch_all({'a': server + '/a.csv', 'b': server + '/b.csv'},
+                            parse=lambda name, path: open(path, 'rb').read(), raw_dir=str(tmp_path))
+    for name in ('a', 'b'):
+        assert files[name]['modified']
+        assert files[name]['parsed'] == BODY
+        assert files[name]['etag'] == ETAG
+        assert files[name]['sha256'] == hashlib.sha256(BODY).hexdigest()
+
+
+def test_unchanged_file_is_answered_with_304(server, tmp_path):
+    url = server + '/a.csv'
+    fetch.fetch_all({'a': url}, raw_dir=str(tmp_path))
+    files = fetch.fetch_all({'a': url}, raw_dir=str(tmp_path))
+    assert not files['a']['modified']
+    assert Handler.requests[-1][1] == ETAG
+    assert open(files['a']['path'], 'rb').read() == BODY
+
+
+def test_corrupt_cache_is_downloaded_again(server, tmp_path):
+    url = server + '/a.csv'
+    path = fetch.fetch_all({'a': url}, raw_dir=str(tmp_path))['a']['path']
+    with open(path, 'ab') as f:
+        f.write(b'garbage')
+    files = fetch.fetch_all({'a': url}, raw_dir=str(tmp_path))
+    assert files['a']['modified']
+    assert Handler.requests[-1][1] is None
+    assert open(path, 'rb').read() == BODY
+
+
+def test_server_errors_are_retried(server, tmp_path):
+    Handler.failures['/flaky.csv'] = 2
+    files = fetch.fetch_all({'flaky': server + '/flaky.csv'}, raw_dir=str(tmp_path))
+    assert files['flaky']['modified']
+    assert open(files['flaky']['path'], 'rb').read() == BODY
+    assert [path for path, _, _ in Handler.requests].count('/flaky.csv') == 3
+
+
+def test_gzip_responses_are_stored_decompressed(server, tmp_path):
+    files = fetch.fetch_all({'gz': server + '/gzip.csv'}, raw_dir=str(tmp_path))
+    assert 'gzip' in Handler.requests[-1][2]
+    assert open(files['gz']['path'], 'rb').read() == BODY
+    assert files['gz']['sha256'] == hashlib.sha256(BODY).hexdigest()
+
+
+def test_file_urls(tmp_path):
+    source = tmp_path / 'source.csv'
+    source.write_bytes(BODY)
+    files = fetch.fetch_all({'local': source.as_uri()}, raw_dir=str(tmp_path / 'raw'))
+    assert open(files['local']['path'], 'rb').read() == BODY
@@ -0,0 +1,62 @@
+import pandas as pd
+
+from jhu import write_sources
+from pages.utils import fetch_data
+
+
+def test_new_country_names_go_to_the_side_table(source, monkeypatch):
+    curated = open(fetch_data.COUNTRY_CODES).read()
+    lookups = []
+    monkeypatch.setattr(fetch_data, 'get_country_code', lambda name: lookups.append(name) or 'XYZ')
+
+    codes = fetch_data.resolve_country_codes(['France', 'Atlantis', 'Atlantis', None])
+    assert codes['France'] == 'FRA' and codes['Atlantis'] == 'XYZ'
+    assert lookups == ['Atlantis']
+    assert open(fetch_data.COUNTRY_CODES).read() == curated
+    assert pd.read_csv(fetch_data.COUNTRY_CODES_EXTRA).to_dict('records') == [{'country': 'Atlantis', 'iso_code': 'XYZ'}]
+
+    # names found by an earlier run are not looked up again
+    assert fetch_data.resolve_country_codes(['Atlantis'])['Atlantis'] == 'XYZ'
+    assert lookups == ['Atlantis']
+
+
+def test_curated_codes_win_over_the_side_table(source):
+    pd.DataFrame({'country': ['France'], 'iso_code': ['OLD']}).to_csv(fetch_data.COUNTRY_CODES_EXTRA, index=False)
+    assert fetch_data.resolve_country_codes(['France'])['France'] == 'FRA'
+
+
+def melt_merge(df_confirmed, df_deaths, df_recovered):
+    """
+    The melt and merge build_long_table replaced, as a reference
+    """
+    frames = [df.melt(id_vars=fetch_data.ID_COLUMNS, var_name='Date', value_name=name)
+              for df, name in ((df_confirmed, 'Confirmed'), (df_deaths, 'Deaths'), (df_recovered, 'Recovered'))]
+    df_all = frames[0].merge(frames[1], how='left', on=fetch_data.ID_COLUMNS + ['Date'])
+    df_all = df_all.merge(frames[2], how='left', on=fetch_data.ID_COLUMNS + ['Date'])
+    df_all[['Confirmed', 'Deaths', 'Recovered']] = df_all[['Confirmed', 'Deaths', 'Recovered']].fillna(0)
+    df_all['Date'] = pd.to_datetime(df_all['Date'], format='%m/%d/%y')
+    return df_all
+
+
+def matrices(tmp_path, days=20):
+    write_sources(tmp_path, days)
+    return [pd.read_csv(tmp_path / fetch_data.JHU_FILE.format(series)) for series in fetch_data.JHU_SERIES]
+
+
+def test_long_table_matches_melt_and_merge(tmp_path):
+    frames = matrices(tmp_path)
+    assert 'Italy' not in set(frames[2]['Country/Region'])
+    expected = melt_merge(*frames)
+    pd.testing.assert_frame_equal(fetch_data.build_long_table(*frames), expected, check_dtype=False)
+
+
+def test_long_table_with_repeated_locations(tmp_path):
+    df_confirmed, df_deaths, df_recovered = matrices(tmp_path)
+    df_deaths = pd.concat([df_deaths, df_deaths.iloc[[2]].assign(**{'1/22/20': 10 ** 6})], ignore_index=True)
+    df_all = fetch_data.build_long_table(df_confirmed, df_deaths, df_recovered)
+    assert len(df_all) == len(df_confirmed) * 20
+    assert df_all['Deaths'].max() < 10 ** 6
+
+    df_confirmed = pd.concat([df_confirmed, df_confirmed.iloc[[0]]], ignore_index=True)
+    df_all = fetch_data.build_long_table(df_confirmed, df_deaths, df_recovered)
+    assert len(df_all) == len(df_confirmed) * 20
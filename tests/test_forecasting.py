@@ -0,0 +1,86 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pages.utils import forecast_job, forecasting
+from pages.utils.forecasters import FastForecaster, Forecaster, ProphetForecaster
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(forecasting, '_cache', forecasting.OrderedDict())
+    monkeypatch.setattr(forecasting, '_locks', {})
+    monkeypatch.setattr(forecasting, 'MAX_CACHED', 3)
+
+
+def key(name, version='v1'):
+    return (version, 'Global', name, 'fast')
+
+
+def test_least_recently_used_is_evicted_with_its_lock():
+    for name in 'abc':
+        forecasting._cached(key(name), lambda: name)
+    assert forecasting._cached(key('a'), lambda: 'recomputed') == 'a'
+    forecasting._cached(key('d'), lambda: 'd')
+    assert list(forecasting._cache) == [key('c'), key('a'), key('d')]
+    assert set(forecasting._locks) == set(forecasting._cache)
+
+
+def test_a_new_version_drops_the_old_results_and_locks():
+    forecasting._cached(key('a'), lambda: 1)
+    forecasting._cached(key('a', 'v2'), lambda: 2)
+    assert list(forecasting._cache) == list(forecasting._locks) == [key('a', 'v2')]
+
+
+def test_missing_results_are_not_cached():
+    assert forecasting._cached(key('a'), lambda: None) is None
+    assert forecasting._cached(key('a'), lambda: 1) == 1
+
+
+def test_concurrent_callers_compute_once():
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.05)
+        return 'result'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(forecasting._cached(key('a'), compute)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ['result'] * 8 and len(calls) == 1
+
+
+def test_engines_must_implement_the_whole_interface():
+    class Partial(Forecaster):
+        def fit(self, data):
+            return self
+
+    with pytest.raises(TypeError, match='abstract'):
+        Partial()
+    for engine in (FastForecaster, ProphetForecaster):
+        assert not engine.__abstractmethods__
+
+
+def test_country_backtests_are_stored_per_scope(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    days = pd.date_range('2021-01-01', periods=120)
+    data = pd.DataFrame({'Date': days, 'Confirmed': np.arange(120.0) ** 2})
+    tasks = [('v1', scope, 'Confirmed', engine, data.iloc[:length])
+             for scope, length in (('Global', 120), ('France', 120), ('Tuvalu', 30)) for engine in ('fast', 'accurate')]
+    backtests = forecast_job.backtest_tasks(tasks, ['fast'])
+    assert [(scope, engines) for _, scope, _, engines, _ in backtests] == [('France', ('fast',)), ('Tuvalu', ('fast',))]
+
+    assert [forecast_job.backtest_task(task) for task in backtests] == [True, None]
+    forecasting._cache.clear()
+    scores = forecasting.get_stored_backtest('v1', 'Confirmed', 'France')
+    assert list(scores.index.unique('engine')) == ['fast']
+    assert forecasting.get_stored_backtest('v1', 'Confirmed', 'Tuvalu') is None
+    assert forecasting.get_stored_backtest('v1', 'Confirmed') is None
@@ -0,0 +1,60 @@
+import pandas as pd
+import pytest
+
+from pages.utils.frames import decimate_frames
+
+
+def daily(days=90, start='2021-01-01'):
+    """
+    Cumulative counts of two countries, France split in two provinces
+    """
+    dates = pd.date_range(start, periods=days)
+    rows = [(date, country, province, float(i + 1))
+            for i, date in enumerate(dates)
+            for country, province in (('France', 'Reunion'), ('France', None), ('India', None))]
+    return pd.DataFrame(rows, columns=['Date', 'Country', 'Province', 'Confirmed'])
+
+
+def frames(df, **kwargs):
+    return decimate_frames(df, 'Date', ['Country'], ['Confirmed'], **kwargs)
+
+
+def test_empty_input():
+    data = frames(daily().iloc[:0], freq='W')
+    assert data.empty
+    assert list(data.columns) == ['Country', 'Date', 'Confirmed']
+
+
+def test_provinces_are_summed_and_every_day_kept_by_default():
+    data = frames(daily(10))
+    assert len(data) == 10 * 2
+    assert data.loc[data['Country'] == 'France', 'Confirmed'].tolist() == [2 * (i + 1) for i in range(10)]
+    assert data['Date'].iloc[0] == '2021-01-01'
+
+
+@pytest.mark.parametrize('freq, expected', [('W', 14), ('M', 3)])
+def test_last_date_of_each_period(freq, expected):
+    data = frames(daily(), freq=freq)
+    dates = pd.to_datetime(data['Date'].unique())
+    assert len(dates) == expected
+    assert dates[-1] == pd.Timestamp('2021-03-31')
+    if freq == 'M':
+        assert list(dates.strftime('%m-%d')) == ['01-31', '02-28', '03-31']
+
+
+def test_max_frames_caps_and_keeps_both_ends():
+    data = frames(daily(), max_frames=10)
+    dates = data['Date'].unique()
+    assert len(dates) == 10
+    assert dates[0] == '2021-01-01' and dates[-1] == '2021-03-31'
+    assert len(frames(daily(5), max_frames=10)['Date'].unique()) == 5
+    with pytest.raises(ValueError):
+        frames(daily(), max_frames=1)
+
+
+def test_unchanged_frames_are_dropped():
+    df = daily(10)
+    later, india = df['Date'] > '2021-01-05', df['Country'] == 'India'
+    df.loc[later & india, 'Confirmed'] = 5
+    df.loc[later & ~india, 'Confirmed'] = 2.5
+    assert frames(df)['Date'].nunique() == 6
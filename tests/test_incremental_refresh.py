@@ -0,0 +1,56 @@
+import os
+
+import pandas as pd
+
+from jhu import COUNTRIES, PROVINCES, stored, write_sources
+from pages.utils import fetch_data
+from pages.utils.storage import table_path
+
+
+def test_incremental_refresh_equals_full_fetch(source, caplog):
+    url = source.as_uri() + '/'
+    write_sources(source, 40)
+    fetch_data.fetchdata('parquet', source=url)
+    # new days, plus a revision of an ingested day inside the re-read tail window
+    write_sources(source, 50, revise=38)
+    with caplog.at_level('INFO', logger=fetch_data.__name__):
+        incremental = fetch_data.refresh('parquet', source=url)
+    assert 'Ingested' in caplog.text
+    assert fetch_data.load_manifest()['last_date'] == '2020-03-11'
+
+    from_disk = stored()
+    full = fetch_data.fetchdata('parquet', source=url)
+    pd.testing.assert_frame_equal(from_disk, stored())
+    assert from_disk.loc[(from_disk['Province/State'] == 'Reunion') & (from_disk['Date'] == '2020-02-29'),
+                         'Confirmed'].item() >= 1000
+    assert len(full) == len(incremental) == 50 * len(COUNTRIES)
+
+
+def test_unchanged_sources_are_not_rewritten(source):
+    url = source.as_uri() + '/'
+    write_sources(source, 40)
+    fetch_data.fetchdata('parquet', source=url)
+    mtime = os.stat(table_path(fetch_data.COVID_TABLE)).st_mtime_ns
+    assert fetch_data.refresh('parquet', source=url) is None
+    assert os.stat(table_path(fetch_data.COVID_TABLE)).st_mtime_ns == mtime
+
+
+def test_refresh_without_a_previous_run_fetches_everything(source):
+    url = source.as_uri() + '/'
+    write_sources(source, 40)
+    fetch_data.refresh('parquet', source=url)
+    assert len(stored()) == 40 * len(COUNTRIES)
+    assert os.path.exists(fetch_data.MANIFEST)
+
+
+def test_new_location_falls_back_to_a_full_fetch(source, caplog):
+    url = source.as_uri() + '/'
+    write_sources(source, 40)
+    fetch_data.fetchdata('parquet', source=url)
+    write_sources(source, 45, countries=COUNTRIES + ['India'], provinces=PROVINCES + ['Goa'])
+    with caplog.at_level('INFO', logger=fetch_data.__name__):
+        df_all = fetch_data.refresh('parquet', source=url)
+    assert 'Locations changed upstream' in caplog.text
+    assert 'Ingested' not in caplog.text
+    assert len(df_all) == len(stored()) == 45 * (len(COUNTRIES) + 1)
+    assert fetch_data.load_manifest()['last_date'] == '2020-03-06'
@@ -0,0 +1,93 @@
+import filecmp
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+from benchmarks.suite import write_inputs
+from pages.utils import caching, data_store, refresher, update_data, versions
+from pages.utils.fetch_vacc_data import WORLDOMETER_DAILY
+from pages.utils.figure_cache import figures
+from pages.utils.storage import read_table, table_path, write_table
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the tables committed to the repo, which a clean checkout starts from
+COMMITTED = ['country_codes.csv', 'df_daily.csv', 'summary_df.csv', 'worldometer_coronavirus_summary_data.csv']
+
+
+@pytest.fixture
+def checkout(tmp_path, monkeypatch):
+    """
+    A clean checkout over synthetic file:// sources: data/ only holds the committed tables
+    and the worldometer daily export is missing
+    """
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('data')
+    shutil.copy(os.path.join(REPO, 'data', 'country_codes.csv'), 'data')
+    write_inputs(str(tmp_path), '8x60x2')
+    source = (tmp_path / 'raw').as_uri() + '/'
+    # the committed df_daily.csv and summary_df.csv were built from the worldometer exports
+    update_data.run(update_data.build_stages('csv', source, source, figures=False))
+    for name in os.listdir('data'):
+        if name not in COMMITTED:
+            path = os.path.join('data', name)
+            shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+    assert not os.path.exists(WORLDOMETER_DAILY)
+    for clear in (data_store.clear_cache, caching.clear_all, figures.clear):
+        clear()
+    yield source
+    for clear in (data_store.clear_cache, caching.clear_all, figures.clear):
+        clear()
+
+
+def test_refresh_once_carries_over_the_daily_table(checkout):
+    first = refresher.refresh_once('parquet', checkout, checkout)
+    assert first is not None and versions.active_dir() == first
+    assert filecmp.cmp(table_path(os.path.join(first, 'df_daily')), 'data/df_daily.csv', shallow=False)
+    assert len(read_table(table_path(os.path.join(first, 'covid')))) > 0
+
+    assert refresher.refresh_once('parquet', checkout, checkout) is None
+
+    vaccinations = pd.read_csv('raw/vaccinations.csv')
+    vaccinations.loc[vaccinations['total_vaccinations'].last_valid_index(), 'total_vaccinations'] += 7
+    vaccinations.to_csv('raw/vaccinations.csv', index=False)
+    second = refresher.refresh_once('parquet', checkout, checkout)
+    assert second not in (None, first) and versions.active_dir() == second
+    assert filecmp.cmp(table_path(os.path.join(second, 'df_daily')), 'data/df_daily.csv', shallow=False)
+
+
+def test_validate_rejects_incomplete_or_older_versions(checkout):
+    live = refresher.refresh_once('parquet', checkout, checkout)
+    refresher.validate(live, live)
+
+    candidate = versions.new_version_dir()
+    versions.seed(live, candidate, os.listdir(live))
+    covid = read_table(table_path(os.path.join(candidate, 'covid')))
+    os.remove(table_path(os.path.join(candidate, 'covid')))
+    write_table(covid[covid['Date'] < covid['Date'].max()], os.path.join(candidate, 'covid'), 'parquet')
+    with pytest.raises(ValueError, match='before the live'):
+        refresher.validate(candidate, live)
+
+    write_table(covid.drop(columns='Active'), os.path.join(candidate, 'covid'), 'parquet')
+    with pytest.raises(ValueError, match='lacks the columns'):
+        refresher.validate(candidate, live)
+
+    write_table(covid, os.path.join(candidate, 'covid'), 'parquet')
+    refresher.validate(candidate, live)
+    os.remove(table_path(os.path.join(candidate, 'df_daily')))
+    with pytest.raises(ValueError, match='daily is missing'):
+        refresher.validate(candidate, live)
+
+
+def test_swap_activates_and_drops_the_replaced_version(checkout):
+    first = refresher.refresh_once('parquet', checkout, checkout)
+    with versions.snapshot(first):
+        data_store.get_dataset('covid')
+    assert any(key[0] == first for key in data_store._cache)
+
+    second = versions.new_version_dir()
+    versions.seed(first, second, os.listdir(first))
+    refresher.swap(second, first)
+    assert open(versions.CURRENT).read() == os.path.basename(second)
+    assert {key[0] for key in data_store._cache if key[0] in (first, second)} == {second}
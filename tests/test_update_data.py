@@ -0,0 +1,125 @@
+import os
+
+import pandas as pd
+import pytest
+
+from pages.utils import update_data
+from pages.utils.update_data import Stage
+from pages.utils.storage import read_table, table_path, write_table
+
+
+@pytest.fixture
+def graph(tmp_path, monkeypatch):
+    """
+    A small graph: source -> a (reads a.txt) -> b, and c (carry_over, reads c.txt) -> b.
+    Every stage writes a one row table with the value it computed; runs are counted.
+    """
+    monkeypatch.chdir(tmp_path)
+    calls = []
+    (tmp_path / 'a.txt').write_text('1')
+    (tmp_path / 'c.txt').write_text('10')
+
+    def table(name, value):
+        write_table(pd.DataFrame({'value': [value]}), str(tmp_path / name), 'csv')
+        return value
+
+    def a(source):
+        calls.append('a')
+        return table('a', source + int((tmp_path / 'a.txt').read_text()))
+
+    def c(source):
+        calls.append('c')
+        return table('c', int((tmp_path / 'c.txt').read_text()))
+
+    def b(a_value, c_value):
+        calls.append('b')
+        a_value = a_value if a_value is not None else read_table(str(tmp_path / 'a.csv'))['value'][0]
+        c_value = c_value if c_value is not None else read_table(str(tmp_path / 'c.csv'))['value'][0]
+        return table('b', a_value + c_value)
+
+    stages = [
+        Stage('source', lambda: {'file': {'sha256': 'abc'}}, source=True),
+        Stage('a', lambda files: a(100), inputs=['source'], files=['a.txt'], outputs=[str(tmp_path / 'a')]),
+        Stage('c', lambda files: c(0), inputs=['source'], files=['c.txt'], outputs=[str(tmp_path / 'c')],
+              carry_over=True),
+        Stage('b', b, inputs=['a', 'c'], outputs=[str(tmp_path / 'b')]),
+    ]
+
+    def run(**kwargs):
+        calls.clear()
+        return update_data.run(stages, state_path=str(tmp_path / 'state.json'), **kwargs), list(calls)
+
+    def plan(**kwargs):
+        return {stage.name: action for stage, action, _ in
+                update_data.plan(stages, state_path=str(tmp_path / 'state.json'), **kwargs)}
+
+    return {'dir': tmp_path, 'stages': stages, 'run': run, 'plan': plan}
+
+
+def stored(graph, name):
+    return read_table(table_path(str(graph['dir'] / name)))['value'][0]
+
+
+def test_check_graph_rejects_duplicates_and_forward_reads():
+    update_data.check_graph(update_data.build_stages())
+    with pytest.raises(ValueError, match='declared twice'):
+        update_data.check_graph([Stage('a', None), Stage('a', None)])
+    with pytest.raises(ValueError, match='not declared before'):
+        update_data.check_graph([Stage('a', None, inputs=['b']), Stage('b', None)])
+
+
+def test_unchanged_inputs_are_skipped(graph):
+    assert graph['plan']() == {'source': 'check', 'a': 'run', 'c': 'run', 'b': 'run'}
+    status, calls = graph['run']()
+    assert set(status.values()) == {'ran'} and sorted(calls) == ['a', 'b', 'c']
+    assert stored(graph, 'b') == 111
+
+    assert graph['plan']() == {'source': 'check', 'a': 'skip', 'c': 'skip', 'b': 'skip'}
+    status, calls = graph['run']()
+    assert status == {'source': 'ran', 'a': 'skipped', 'c': 'skipped', 'b': 'skipped'} and calls == []
+
+    status, calls = graph['run'](force=True)
+    assert sorted(calls) == ['a', 'b', 'c']
+
+
+def test_a_changed_file_reruns_its_stage_and_downstream(graph):
+    graph['run']()
+    (graph['dir'] / 'a.txt').write_text('2')
+    assert graph['plan']() == {'source': 'check', 'a': 'run', 'c': 'skip', 'b': 'run'}
+    status, calls = graph['run']()
+    assert calls == ['a', 'b'] and status['c'] == 'skipped'
+    assert stored(graph, 'b') == 112
+
+
+def test_a_missing_table_reruns_its_stage(graph):
+    graph['run']()
+    os.remove(graph['dir'] / 'a.csv')
+    assert graph['plan']()['a'] == 'run'
+    assert graph['run']()[1] == ['a']
+
+
+def test_failures_block_downstream_and_resume(graph):
+    os.remove(graph['dir'] / 'a.txt')
+    assert graph['plan']()['a'] == 'fail'
+    status, calls = graph['run']()
+    assert status == {'source': 'ran', 'a': 'failed', 'c': 'ran', 'b': 'blocked'} and calls == ['c']
+
+    (graph['dir'] / 'a.txt').write_text('1')
+    status, calls = graph['run']()
+    assert calls == ['a', 'b'] and status['c'] == 'skipped'
+
+
+def test_carry_over_keeps_tables_when_a_file_is_missing(graph):
+    graph['run']()
+    os.remove(graph['dir'] / 'c.txt')
+    assert graph['plan']()['c'] == 'keep'
+    status, calls = graph['run']()
+    assert status == {'source': 'ran', 'a': 'skipped', 'c': 'skipped', 'b': 'ran'} and calls == ['b']
+    assert stored(graph, 'c') == 10
+    assert graph['run'](force=True)[0]['c'] == 'skipped'
+
+    # with nothing to carry over the stage fails as before
+    os.remove(graph['dir'] / 'c.csv')
+    assert graph['plan']()['c'] == 'fail'
+    status, calls = graph['run']()
+    assert status['c'] == 'failed' and status['b'] == 'blocked'
@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+from pages.utils import versions
+
+
+@pytest.fixture
+def data(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(versions.DATA_DIR)
+
+
+def make_versions(count):
+    directories = []
+    for i in range(count):
+        directory = os.path.join(versions.VERSIONS_DIR, f'2021010{i}-000000-x')
+        os.makedirs(directory)
+        directories.append(directory)
+    return directories
+
+
+def test_activate_replaces_the_live_version(data):
+    assert versions.active_dir() == versions.DATA_DIR
+    first, second = make_versions(2)
+    versions.activate(first)
+    assert versions.active_dir() == first
+    versions.activate(second)
+    assert versions.active_dir() == second
+    assert not os.path.exists(versions.CURRENT + '.tmp')
+
+
+def test_snapshot_pins_a_version_across_swaps(data):
+    first, second = make_versions(2)
+    versions.activate(first)
+    with versions.snapshot() as pinned:
+        versions.activate(second)
+        assert pinned == versions.data_dir() == first
+        with versions.snapshot():
+            assert versions.data_dir() == first
+    assert versions.data_dir() == second
+
+
+def test_prune_keeps_the_live_version_and_the_one_before(data):
+    assert versions.prune() == []
+    directories = make_versions(4)
+    versions.activate(directories[2])
+    assert versions.prune() == directories[:1]
+    assert sorted(os.listdir(versions.VERSIONS_DIR)) == [os.path.basename(d) for d in directories[1:]]
+    # a version built after the live one (e.g. being validated) is never pruned
+    versions.activate(directories[3])
+    assert versions.prune() == directories[1:2]
+    assert versions.prune(keep=1) == directories[2:3]
+    assert os.listdir(versions.VERSIONS_DIR) == [os.path.basename(directories[3])]
+
+
+def test_seed_links_the_files_that_exist(data):
+    source, target = make_versions(2)
+    with open(os.path.join(source, 'covid.csv'), 'w') as f:
+        f.write('a\n1\n')
+    versions.seed(source, target, ['covid.csv', 'missing.csv'])
+    assert os.listdir(target) == ['covid.csv']
+    assert os.path.samefile(os.path.join(source, 'covid.csv'), os.path.join(target, 'covid.csv'))
+
+
+def test_scripts_refuse_to_write_once_versions_are_live(data):
+    versions.require_unversioned('fetch_data')
+    versions.activate(make_versions(1)[0])
+    with pytest.raises(SystemExit, match='refresher --once'):
+        versions.require_unversioned('fetch_data')